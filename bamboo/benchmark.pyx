@@ -0,0 +1,925 @@
+# cython: boundscheck = False
+# cython: wraparound = False
+# cython: cdivision = True
+
+import os
+
+import numpy as np
+
+from libc.stdio cimport printf
+from libc.stdlib cimport rand, malloc, free
+from libc.string cimport memset
+from libcpp.unordered_map cimport unordered_map
+from posix.time cimport gettimeofday, timeval
+from posix.resource cimport getrusage, rusage, RUSAGE_SELF
+
+from bamboo.board cimport S_BLACK, PASS, PURE_BOARD_MAX, FLIP_COLOR, MAX
+from bamboo.board cimport onboard_pos
+from bamboo.board cimport game_state_t, string_t, rollout_feature_t, COMPACT_GAME_STATE_ENABLED
+from bamboo.board cimport set_board_size, set_check_superko, set_check_seki, set_japanese_rule, set_use_lgrf2
+from bamboo.board cimport allocate_game, free_game, copy_game, initialize_board, put_stone, is_legal_not_eye_rollout, is_legal_not_eye
+from bamboo.board cimport board_journal_t, allocate_journal, free_journal, put_stone_undoable, undo_put_stone
+from bamboo.board cimport check_superko_flag
+from bamboo.rollout_preprocess cimport initialize_rollout, update_rollout, choice_rollout_move, update_tree_planes_all, get_tree_probs
+from bamboo.rollout_preprocess cimport update_all_probs
+from bamboo.zobrist_hash cimport set_hash_size, initialize_hash, mt
+from bamboo.local_pattern cimport read_rands, init_x33_hash, init_d12_rsp_hash, init_d12_hash
+from bamboo.local_pattern cimport x33_MAX, pattern_table_t, build_pattern_table, free_pattern_table, lookup_pattern_table
+from bamboo.local_pattern cimport x33_table, d12_rsp_table, d12_table, set_pattern_table_stats, get_pattern_table_stats
+from bamboo.nakade cimport initialize_nakade_hash
+from bamboo.policy_feature cimport MAX_POLICY_PLANES, MAX_VALUE_PLANES, PolicyFeature, allocate_feature, initialize_feature, update, update_incremental
+from bamboo.policy_feature cimport PLANES_NHWC, initialize_batch, update_batch
+from bamboo.policy_feature cimport LADDER_CACHE_SIZE, set_ladder_cache_size, get_ladder_cache_stats
+from bamboo.sgf_util cimport SGFMoveIterator
+from bamboo.parseboard cimport parse
+from bamboo.rollout_preprocess cimport initialize_rollout_const
+from bamboo.tree_search cimport tree_node_t, PyMCTS
+from bamboo.zobrist_hash cimport used
+
+
+def setup(rands_file,
+          x33_csv=None,
+          d12_rsp_csv=None,
+          d12_csv=None,
+          node_hash_size=2**16,
+          superko=True,
+          lgrf2=False):
+    cdef int nakade_size, x33_size, d12_rsp_size, d12_size
+
+    set_board_size(19)
+    set_check_superko(superko)
+    set_check_seki(False)
+    set_japanese_rule(False)
+    set_use_lgrf2(lgrf2)
+
+    set_hash_size(node_hash_size)
+    initialize_hash()
+
+    read_rands(rands_file)
+    nakade_size = initialize_nakade_hash()
+    x33_size = init_x33_hash(x33_csv)
+    d12_rsp_size = init_d12_rsp_hash(d12_rsp_csv)
+    d12_size = init_d12_hash(d12_csv)
+
+    initialize_rollout_const(nakade_size,
+        x33_size,
+        d12_rsp_size,
+        d12_size,
+        pos_aware_d12=False)
+
+
+cdef double run_ponder(PyMCTS mcts):
+    """ Run single ponder from empty board and return playout speed (PO/sec).
+    """
+    cdef timeval end_time
+    cdef double elapsed
+
+    mcts.mcts.player_color = S_BLACK
+    mcts.mcts.const_time = mcts.const_time
+    mcts.mcts.playout_limit = mcts.playout_limit
+    mcts.mcts.const_playout = mcts.const_playout
+
+    gettimeofday(&mcts.mcts.search_start_time, NULL)
+
+    mcts.mcts.ponder(mcts.game, False)
+
+    gettimeofday(&end_time, NULL)
+
+    elapsed = ((end_time.tv_sec - mcts.mcts.search_start_time.tv_sec) +
+               (end_time.tv_usec - mcts.mcts.search_start_time.tv_usec) / 1000000.0)
+
+    if elapsed == 0.0:
+        return 0.0
+    return mcts.mcts.n_playout/elapsed
+
+
+def bench_tree_parallel(rollout_path,
+                        tree_path=None,
+                        threads=(1, 2, 4, 8, 16, 32),
+                        playouts=10000):
+    """ Compare playout speed of node locking and lock-free statistics update.
+    """
+    cdef PyMCTS mcts
+
+    results = dict()
+    for lock_free in (False, True):
+        for n_threads in threads:
+            mcts = PyMCTS(const_playout=playouts, n_threads=n_threads, lock_free=lock_free)
+            mcts.clear()
+            mcts.set_rollout_parameter(rollout_path)
+            if tree_path:
+                mcts.set_tree_parameter(tree_path)
+            results[(lock_free, n_threads)] = run_ponder(mcts)
+
+    printf('\n>> Tree parallel playout speed (PO/sec)\n')
+    printf('Threads  Locking  Lock-free\n')
+    for n_threads in threads:
+        printf('%7d  %7d  %9d\n',
+            <int>n_threads,
+            <int>results[(False, n_threads)],
+            <int>results[(True, n_threads)])
+
+    return results
+
+
+def bench_root_parallel(rollout_path,
+                        tree_path=None,
+                        threads=(1, 2, 4, 8, 16, 32),
+                        trees=(1, 2, 4),
+                        playouts=10000):
+    """ Compare playout speed of shared tree and root parallel trees at equal thread counts.
+    """
+    cdef PyMCTS mcts
+
+    results = dict()
+    for n_threads in threads:
+        for n_trees in trees:
+            if n_trees > n_threads:
+                continue
+            mcts = PyMCTS(const_playout=playouts, n_threads=n_threads, root_parallel=n_trees)
+            mcts.clear()
+            mcts.set_rollout_parameter(rollout_path)
+            if tree_path:
+                mcts.set_tree_parameter(tree_path)
+            results[(n_threads, n_trees)] = run_ponder(mcts)
+
+    printf('\n>> Root parallel playout speed (PO/sec)\n')
+    printf('Threads')
+    for n_trees in trees:
+        printf('  %3d trees', <int>n_trees)
+    printf('\n')
+    for n_threads in threads:
+        printf('%7d', <int>n_threads)
+        for n_trees in trees:
+            if (n_threads, n_trees) in results:
+                printf('  %9d', <int>results[(n_threads, n_trees)])
+            else:
+                printf('  %9s', b'-')
+        printf('\n')
+
+    return results
+
+
+def bench_node_memory(rollout_path,
+                      tree_path=None,
+                      playouts=10000):
+    """ Report bytes per node and peak RSS after a single ponder.
+    """
+    cdef PyMCTS mcts
+    cdef double po_sec
+
+    mcts = PyMCTS(const_playout=playouts, n_threads=1)
+    mcts.clear()
+    mcts.set_rollout_parameter(rollout_path)
+    if tree_path:
+        mcts.set_tree_parameter(tree_path)
+    po_sec = run_ponder(mcts)
+
+    printf('\n>> Node memory\n')
+    printf('Node size           : %d bytes\n', <int>sizeof(tree_node_t))
+    printf('Nodes in use        : %u\n', used)
+    printf('Children in use     : %u\n', mcts.mcts.child_arena.used)
+    printf('Bytes per node      : %3.2lf\n',
+        (used*sizeof(tree_node_t) + mcts.mcts.child_arena.used*(sizeof(tree_node_t *) + sizeof(int) + sizeof(double)))/<double>used)
+    printf('Peak RSS            : %ld MB\n', peak_rss() // 1024)
+    printf('Playout Speed       : %d PO/sec\n', <int>po_sec)
+
+
+def bench_transposition(rollout_path,
+                        tree_path=None,
+                        playouts=10000):
+    """ Compare effective playouts per unique position with and without transposition.
+    """
+    cdef PyMCTS mcts
+
+    printf('\n>> Transposition\n')
+    printf('Transposition  Hits  Unique nodes  PO/node  PO/sec\n')
+    for transposition in (False, True):
+        mcts = PyMCTS(const_playout=playouts, n_threads=1, transposition=transposition)
+        mcts.clear()
+        mcts.set_rollout_parameter(rollout_path)
+        if tree_path:
+            mcts.set_tree_parameter(tree_path)
+        po_sec = run_ponder(mcts)
+        printf('%13s  %4d  %12u  %7.3lf  %6d\n',
+            <char *>(b'on' if transposition else b'off'),
+            mcts.mcts.n_transposition_hits,
+            used,
+            mcts.mcts.n_playout/<double>used,
+            <int>po_sec)
+
+
+def bench_game_state(rollout_path,
+                     moves=(0, 100, 200),
+                     playouts=1000):
+    """ Print game_state_t layout and size, and playout speed at some moves.
+    """
+    cdef PyMCTS mcts
+    cdef game_state_t *game
+    cdef game_state_t *search_game
+    cdef double po_sec, usec
+    cdef int n_moves
+
+    mcts = PyMCTS(n_threads=1)
+    mcts.clear()
+    mcts.set_rollout_parameter(rollout_path)
+
+    printf('\n>> Game state\n')
+    printf('Layout: %s\n', b'compact' if COMPACT_GAME_STATE_ENABLED else b'default')
+    printf('game_state_t: %d bytes (string_t %d bytes, rollout_feature_t %d bytes)\n',
+           <int>sizeof(game_state_t), <int>sizeof(string_t), <int>sizeof(rollout_feature_t))
+    printf('Moves  PO/sec  copy_game (usec)\n')
+    for n_moves in moves:
+        game = allocate_game()
+        initialize_board(game)
+        initialize_rollout(game)
+        play_rollout_moves(game, n_moves)
+        search_game = allocate_game()
+        po_sec = run_playouts(mcts, game, search_game, playouts, &usec)
+        printf('%5d  %6d  %16.2lf\n', n_moves, <int>po_sec, usec)
+        free_game(search_game)
+        free_game(game)
+
+
+def bench_rollout_sampling(rollout_path,
+                           moves=(0, 100, 200),
+                           playouts=1000,
+                           samples=100000):
+    """ Print time to sample a rollout move, and playout speed at some moves.
+    """
+    cdef PyMCTS mcts
+    cdef game_state_t *game
+    cdef game_state_t *search_game
+    cdef timeval start_time, end_time
+    cdef double po_sec, usec, sample_usec
+    cdef int n_moves, i
+
+    mcts = PyMCTS(n_threads=1)
+    mcts.clear()
+    mcts.set_rollout_parameter(rollout_path)
+
+    printf('\n>> Rollout move sampling\n')
+    printf('Moves  Sample (usec)  PO/sec\n')
+    for n_moves in moves:
+        game = allocate_game()
+        initialize_board(game)
+        initialize_rollout(game)
+        play_rollout_moves(game, n_moves)
+
+        gettimeofday(&start_time, NULL)
+        for i in range(samples):
+            choice_rollout_move(game, &mcts.mcts.rollout_rngs[0])
+        gettimeofday(&end_time, NULL)
+        sample_usec = ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+                       (end_time.tv_usec - start_time.tv_usec))/samples
+
+        search_game = allocate_game()
+        copy_game(search_game, game)
+        po_sec = run_playouts(mcts, game, search_game, playouts, &usec)
+        printf('%5d  %13.3lf  %6d\n', n_moves, sample_usec, <int>po_sec)
+        free_game(search_game)
+        free_game(game)
+
+
+def bench_superko(rollout_path,
+                  moves=(0, 100, 250),
+                  sweeps=1000):
+    """ Print time to check legality of all points, as tree expansion does, with and without superko.
+    """
+    cdef PyMCTS mcts
+    cdef game_state_t *game
+    cdef timeval start_time, end_time
+    cdef double usec
+    cdef bint check_superko = check_superko_flag
+    cdef int n_moves, superko, i, j
+
+    mcts = PyMCTS(n_threads=1)
+    mcts.clear()
+    mcts.set_rollout_parameter(rollout_path)
+
+    printf('\n>> Legality check of all points (usec)\n')
+    printf('Moves  No superko  Superko\n')
+    for n_moves in moves:
+        game = allocate_game()
+        initialize_board(game)
+        initialize_rollout(game)
+        play_rollout_moves(game, n_moves)
+        printf('%5d', n_moves)
+        for superko in range(2):
+            set_check_superko(superko)
+            gettimeofday(&start_time, NULL)
+            for i in range(sweeps):
+                for j in range(PURE_BOARD_MAX):
+                    is_legal_not_eye(game, onboard_pos[j], game.current_color)
+            gettimeofday(&end_time, NULL)
+            usec = ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+                    (end_time.tv_usec - start_time.tv_usec))/sweeps
+            printf('  %10.2lf', usec)
+        printf('\n')
+        free_game(game)
+
+    set_check_superko(check_superko)
+
+
+def bench_rollout_probs(rollout_path,
+                        moves=(0, 100, 200),
+                        playouts=1000,
+                        int samples=100000):
+    """ Print time to compute rollout policy of all points, and playout speed at some moves.
+    """
+    cdef PyMCTS mcts
+    cdef game_state_t *game
+    cdef game_state_t *search_game
+    cdef timeval start_time, end_time
+    cdef double po_sec, usec, probs_usec
+    cdef int n_moves, i
+
+    mcts = PyMCTS(n_threads=1)
+    mcts.clear()
+    mcts.set_rollout_parameter(rollout_path)
+
+    printf('\n>> Rollout policy\n')
+    printf('Moves  All probs (usec)  PO/sec\n')
+    for n_moves in moves:
+        game = allocate_game()
+        initialize_board(game)
+        initialize_rollout(game)
+        play_rollout_moves(game, n_moves)
+
+        gettimeofday(&start_time, NULL)
+        for i in range(samples):
+            update_all_probs(game)
+        gettimeofday(&end_time, NULL)
+        probs_usec = ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+                      (end_time.tv_usec - start_time.tv_usec))/samples
+
+        search_game = allocate_game()
+        copy_game(search_game, game)
+        po_sec = run_playouts(mcts, game, search_game, playouts, &usec)
+        printf('%5d  %16.3lf  %6d\n', n_moves, probs_usec, <int>po_sec)
+        free_game(search_game)
+        free_game(game)
+
+
+def bench_tree_probs(rollout_path,
+                     tree_path=None,
+                     moves=(0, 100, 200),
+                     int samples=100000):
+    """ Print speed of tree policy evaluation done for each node expansion.
+    """
+    cdef PyMCTS mcts
+    cdef game_state_t *game
+    cdef timeval start_time, end_time
+    cdef double probs[361]
+    cdef double sec
+    cdef int n_moves, i
+
+    mcts = PyMCTS(n_threads=1)
+    mcts.clear()
+    mcts.set_rollout_parameter(rollout_path)
+    if tree_path:
+        mcts.set_tree_parameter(tree_path)
+
+    printf('\n>> Tree policy evaluation\n')
+    printf('Moves  Expansions/sec  Probs only (usec)\n')
+    for n_moves in moves:
+        game = allocate_game()
+        initialize_board(game)
+        initialize_rollout(game)
+        play_rollout_moves(game, n_moves)
+        printf('%5d', n_moves)
+
+        gettimeofday(&start_time, NULL)
+        for i in range(samples):
+            update_tree_planes_all(game)
+            get_tree_probs(game, probs)
+        gettimeofday(&end_time, NULL)
+        sec = (end_time.tv_sec - start_time.tv_sec) + (end_time.tv_usec - start_time.tv_usec)/1000000.0
+        printf('  %14d', <int>(samples/sec))
+
+        gettimeofday(&start_time, NULL)
+        for i in range(samples):
+            get_tree_probs(game, probs)
+        gettimeofday(&end_time, NULL)
+        sec = (end_time.tv_sec - start_time.tv_sec) + (end_time.tv_usec - start_time.tv_usec)/1000000.0
+        printf('  %17.3lf\n', sec*1000000.0/samples)
+        free_game(game)
+
+
+def bench_pattern_table(rollout_path,
+                        int patterns=x33_MAX,
+                        int samples=1000000,
+                        playouts=1000):
+    """ Print time to look up patterns in std::unordered_map and in flat table,
+    and lookup stats of loaded pattern tables during playouts.
+    """
+    cdef unordered_map[unsigned long long, int] hashmap
+    cdef pattern_table_t table
+    cdef unsigned long long *keys
+    cdef PyMCTS mcts
+    cdef game_state_t *game
+    cdef game_state_t *search_game
+    cdef timeval start_time, end_time
+    cdef double map_usec, table_usec, usec
+    cdef double hit_rate
+    cdef long long checksum = 0
+    cdef char *table_name
+    cdef int i
+
+    keys = <unsigned long long *>malloc(samples * sizeof(unsigned long long))
+    for i in range(patterns):
+        hashmap[mt()] = i
+    # half of keys are found, as many empty points match no pattern
+    for i in range(samples):
+        keys[i] = mt()
+        if i % 2 == 0:
+            hashmap[keys[i]] = i % patterns
+
+    memset(&table, 0, sizeof(pattern_table_t))
+    build_pattern_table(&table, hashmap)
+
+    gettimeofday(&start_time, NULL)
+    for i in range(samples):
+        if hashmap.find(keys[i]) != hashmap.end():
+            checksum += hashmap[keys[i]]
+    gettimeofday(&end_time, NULL)
+    map_usec = ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+                (end_time.tv_usec - start_time.tv_usec))
+
+    gettimeofday(&start_time, NULL)
+    for i in range(samples):
+        checksum -= MAX(lookup_pattern_table(&table, keys[i]), 0)
+    gettimeofday(&end_time, NULL)
+    table_usec = ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+                  (end_time.tv_usec - start_time.tv_usec))
+
+    printf('\n>> Pattern lookup (%d patterns, %d slots)\n', <int>hashmap.size(), <int>(table.mask + 1))
+    printf('unordered_map (nsec)  flat table (nsec)\n')
+    printf('%20.2lf  %17.2lf\n', map_usec*1000.0/samples, table_usec*1000.0/samples)
+    assert checksum == 0
+
+    free_pattern_table(&table)
+    free(keys)
+
+    if x33_table.size == 0 and d12_rsp_table.size == 0 and d12_table.size == 0:
+        return
+
+    mcts = PyMCTS(n_threads=1)
+    mcts.clear()
+    mcts.set_rollout_parameter(rollout_path)
+
+    game = allocate_game()
+    search_game = allocate_game()
+    initialize_board(game)
+    initialize_rollout(game)
+    copy_game(search_game, game)
+
+    set_pattern_table_stats(True)
+    run_playouts(mcts, game, search_game, playouts, &usec)
+    stats = get_pattern_table_stats()
+    set_pattern_table_stats(False)
+
+    printf('\n>> Pattern table lookups in %d playouts\n', <int>playouts)
+    printf('Table    Patterns  Slots    Lookups     Hit rate  Probes\n')
+    for name in (b'x33', b'd12_rsp', b'd12'):
+        s = stats[name.decode('ascii')]
+        table_name = name
+        hit_rate = s['hits']/float(s['lookups']) if s['lookups'] else .0
+        printf('%-7s  %8d  %7d  %10lld  %8.3lf  %6.3lf\n',
+               table_name,
+               <int>s['size'],
+               <int>s['slots'],
+               <long long>s['lookups'],
+               hit_rate,
+               <double>s['mean_probes'])
+
+    free_game(search_game)
+    free_game(game)
+
+
+def bench_policy_feature(int moves=200,
+                         int games=10,
+                         int leaves=20,
+                         int depth=6):
+    """ Print policy feature encoding speed of full and incremental update along random games,
+    and over leaves of random depth below positions of the games, as tree search encodes them.
+    """
+    cdef PolicyFeature feature, incremental_feature, leaf_incremental_feature
+    cdef game_state_t *game
+    cdef game_state_t *leaf
+    cdef double full_usec = 0.0, incremental_usec = 0.0
+    cdef double leaf_full_usec = 0.0, leaf_incremental_usec = 0.0
+    cdef int n_positions = 0, n_leaves = 0
+    cdef int i, j
+
+    feature = allocate_feature(MAX_POLICY_PLANES)
+    initialize_feature(feature)
+    incremental_feature = allocate_feature(MAX_POLICY_PLANES)
+    initialize_feature(incremental_feature)
+    leaf_incremental_feature = allocate_feature(MAX_POLICY_PLANES)
+    initialize_feature(leaf_incremental_feature)
+
+    game = allocate_game()
+    leaf = allocate_game()
+    for i in range(games):
+        initialize_board(game)
+        while game.moves < moves:
+            full_usec += time_feature_update(feature, game, False)
+            incremental_usec += time_feature_update(incremental_feature, game, True)
+            n_positions += 1
+
+            if game.moves % 20 == 0:
+                for j in range(leaves):
+                    copy_game(leaf, game)
+                    play_random_moves(leaf, 1 + rand() % depth)
+                    leaf_full_usec += time_feature_update(feature, leaf, False)
+                    leaf_incremental_usec += time_feature_update(leaf_incremental_feature, leaf, True)
+                    n_leaves += 1
+
+            play_random_moves(game, 1)
+    free_game(leaf)
+    free_game(game)
+
+    printf('\n>> Policy feature update\n')
+    printf('Positions  Full (features/sec)  Incremental (features/sec)\n')
+    printf('%9s  %19d  %26d\n', b'games',
+           <int>(n_positions*1000000.0/full_usec),
+           <int>(n_positions*1000000.0/incremental_usec))
+    printf('%9s  %19d  %26d\n', b'leaves',
+           <int>(n_leaves*1000000.0/leaf_full_usec),
+           <int>(n_leaves*1000000.0/leaf_incremental_usec))
+
+
+cdef double time_feature_update(PolicyFeature feature, game_state_t *game, bint incremental):
+    cdef timeval start_time, end_time
+
+    gettimeofday(&start_time, NULL)
+    if incremental:
+        update_incremental(feature, game)
+    else:
+        update(feature, game)
+    gettimeofday(&end_time, NULL)
+    return ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+            (end_time.tv_usec - start_time.tv_usec))
+
+
+cdef void play_random_moves(game_state_t *game, int n_moves):
+    cdef int pos, i, j
+
+    for i in range(n_moves):
+        for j in range(100):
+            pos = onboard_pos[rand() % PURE_BOARD_MAX]
+            if is_legal_not_eye(game, pos, game.current_color):
+                break
+            pos = PASS
+        put_stone(game, pos, game.current_color)
+        game.current_color = FLIP_COLOR(game.current_color)
+
+
+def bench_ladder_cache(sgf_files,
+                       cache_sizes=(0, LADDER_CACHE_SIZE)):
+    """ Print speed of policy and value feature updates over SGF replays, with and without ladder cache.
+    Both features are updated for each position, as tree search does for a leaf.
+    """
+    cdef PolicyFeature policy_feature, value_feature
+    cdef SGFMoveIterator sgf_iter
+    cdef timeval start_time, end_time
+    cdef double usec
+    cdef int n_positions
+    cdef int cache_size
+
+    policy_feature = allocate_feature(MAX_POLICY_PLANES)
+    initialize_feature(policy_feature)
+    value_feature = allocate_feature(MAX_VALUE_PLANES)
+    initialize_feature(value_feature)
+
+    sgf_strings = []
+    for sgf_file in sgf_files:
+        with open(sgf_file, 'r') as file_object:
+            sgf_strings.append(file_object.read())
+
+    printf('\n>> Ladder cache over %d SGF replays\n', <int>len(sgf_strings))
+    printf('Cache size  Positions/sec  Lookups     Hit rate\n')
+    for cache_size in cache_sizes:
+        set_ladder_cache_size(cache_size)
+        usec = 0.0
+        n_positions = 0
+        for sgf_string in sgf_strings:
+            try:
+                sgf_iter = SGFMoveIterator(19, sgf_string, ignore_no_result=False)
+            except Exception:
+                continue
+            for move in sgf_iter:
+                gettimeofday(&start_time, NULL)
+                update(policy_feature, sgf_iter.game)
+                update(value_feature, sgf_iter.game)
+                gettimeofday(&end_time, NULL)
+                usec += ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+                         (end_time.tv_usec - start_time.tv_usec))
+                n_positions += 1
+        stats = get_ladder_cache_stats()
+        printf('%10d  %13d  %10lld  %8.3lf\n',
+               cache_size,
+               <int>(n_positions*1000000.0/usec) if usec > 0 else 0,
+               <long long>stats['lookups'],
+               <double>stats['hit_rate'])
+
+    set_ladder_cache_size(0)
+
+
+def bench_ladder_reader(int moves=200,
+                        int samples=100000):
+    """ Print cost of a ladder reading step, copying board and playing on the copy as the reader did,
+    against playing with undo journal and taking it back. Then print feature updates per second
+    on a position with a ladder running across the board.
+    """
+    cdef PolicyFeature feature
+    cdef game_state_t *game
+    cdef game_state_t *search_game
+    cdef board_journal_t *journal
+    cdef timeval start_time, end_time
+    cdef double copy_usec, undo_usec, update_usec
+    cdef int pos, i, j
+    cdef int n_updates = 1000
+
+    set_board_size(19)
+    game = allocate_game()
+    search_game = allocate_game()
+    journal = allocate_journal()
+
+    initialize_board(game)
+    while game.moves < moves:
+        for j in range(100):
+            pos = onboard_pos[rand() % PURE_BOARD_MAX]
+            if is_legal_not_eye(game, pos, game.current_color):
+                break
+            pos = PASS
+        put_stone(game, pos, game.current_color)
+        game.current_color = FLIP_COLOR(game.current_color)
+
+    gettimeofday(&start_time, NULL)
+    for i in range(samples):
+        pos = onboard_pos[i % PURE_BOARD_MAX]
+        copy_game(search_game, game)
+        put_stone(search_game, pos, search_game.current_color)
+    gettimeofday(&end_time, NULL)
+    copy_usec = ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+                 (end_time.tv_usec - start_time.tv_usec))
+
+    gettimeofday(&start_time, NULL)
+    for i in range(samples):
+        pos = onboard_pos[i % PURE_BOARD_MAX]
+        if put_stone_undoable(game, pos, game.current_color, journal):
+            undo_put_stone(game, journal)
+    gettimeofday(&end_time, NULL)
+    undo_usec = ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+                 (end_time.tv_usec - start_time.tv_usec))
+
+    # white stone at c3 is in a ladder running to the lower right corner
+    rows = ['.' * 19 for _ in range(19)]
+    rows[1] = '..B' + '.' * 16
+    rows[2] = '.BWa' + '.' * 15
+    rows[3] = '..bB' + '.' * 15
+    parse(game, '|'.join(rows) + '|')
+    game.current_color = S_BLACK
+
+    feature = allocate_feature(MAX_POLICY_PLANES)
+    initialize_feature(feature)
+    gettimeofday(&start_time, NULL)
+    for i in range(n_updates):
+        update(feature, game)
+    gettimeofday(&end_time, NULL)
+    update_usec = ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+                   (end_time.tv_usec - start_time.tv_usec))
+
+    printf('\n>> Ladder reading step at move %d (%d samples)\n', moves, samples)
+    printf('Copy and play (usec)  Play and undo (usec)\n')
+    printf('%20.3lf  %20.3lf\n', copy_usec/samples, undo_usec/samples)
+    printf('\n>> Policy feature update with ladder across board\n')
+    printf('Updates/sec  Ladder capture planes\n')
+    printf('%11d  %21d\n',
+           <int>(n_updates*1000000.0/update_usec),
+           <int>(feature.planes[44, 3 + 2*19] + feature.planes[44, 2 + 3*19]))
+
+    free_journal(journal)
+    free_game(search_game)
+    free_game(game)
+
+
+def bench_feature_batch(int moves=200,
+                        int batch_size=64,
+                        threads=(1, 2, 4)):
+    """ Print positions per second of encoding a batch of random games into a NHWC tensor,
+    one position at a time with numpy reshape and stack as self play did, and with update_batch.
+    """
+    cdef PolicyFeature feature
+    cdef game_state_t *games
+    cdef game_state_t **batch_games
+    cdef game_state_t *game
+    cdef timeval start_time, end_time
+    cdef double stack_usec, batch_usec
+    cdef int pos, i, j, n_threads
+    cdef int n_repeats = 10
+
+    set_board_size(19)
+    games = <game_state_t *>malloc(batch_size * sizeof(game_state_t))
+    batch_games = <game_state_t **>malloc(batch_size * sizeof(game_state_t *))
+    for i in range(batch_size):
+        game = &games[i]
+        initialize_board(game)
+        while game.moves < moves:
+            for j in range(100):
+                pos = onboard_pos[rand() % PURE_BOARD_MAX]
+                if is_legal_not_eye(game, pos, game.current_color):
+                    break
+                pos = PASS
+            put_stone(game, pos, game.current_color)
+            game.current_color = FLIP_COLOR(game.current_color)
+        batch_games[i] = game
+
+    feature = allocate_feature(MAX_POLICY_PLANES)
+    initialize_feature(feature)
+
+    gettimeofday(&start_time, NULL)
+    for i in range(n_repeats):
+        states = []
+        for j in range(batch_size):
+            update(feature, &games[j])
+            state = np.asarray(feature.planes).reshape((1, MAX_POLICY_PLANES, 19, 19))
+            states.append(np.transpose(state, (0, 2, 3, 1)))
+        tensor = np.vstack(states)
+    gettimeofday(&end_time, NULL)
+    stack_usec = ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+                  (end_time.tv_usec - start_time.tv_usec))
+
+    printf('\n>> Policy feature batch of %d positions at move %d\n', batch_size, moves)
+    printf('Threads  Stacked (positions/sec)  Batched (positions/sec)\n')
+    for n_threads in threads:
+        initialize_batch(feature, n_threads)
+        gettimeofday(&start_time, NULL)
+        for i in range(n_repeats):
+            tensor = np.empty((batch_size, 19, 19, MAX_POLICY_PLANES), dtype=np.int32)
+            update_batch(feature, batch_games, batch_size, tensor, PLANES_NHWC)
+        gettimeofday(&end_time, NULL)
+        batch_usec = ((end_time.tv_sec - start_time.tv_sec)*1000000.0 +
+                      (end_time.tv_usec - start_time.tv_usec))
+        printf('%7d  %23d  %23d\n',
+               n_threads,
+               <int>(n_repeats*batch_size*1000000.0/stack_usec),
+               <int>(n_repeats*batch_size*1000000.0/batch_usec))
+
+    free(batch_games)
+    free_game(games)
+
+cdef void play_rollout_moves(game_state_t *game, int n_moves):
+    cdef int pos
+
+    while game.moves < n_moves:
+        pos = onboard_pos[rand() % PURE_BOARD_MAX]
+        if not is_legal_not_eye_rollout(game, pos, game.current_color):
+            continue
+        put_stone(game, pos, game.current_color)
+        game.current_color = FLIP_COLOR(game.current_color)
+        update_rollout(game)
+
+
+cdef double run_playouts(PyMCTS mcts,
+                         game_state_t *game,
+                         game_state_t *search_game,
+                         int playouts,
+                         double *usec):
+    """ Return playout speed (PO/sec) and average time to copy game to search_game (usec).
+    """
+    cdef timeval start_time, end_time, copy_start_time, copy_end_time
+    cdef double elapsed, copy_elapsed = 0.0
+    cdef int i
+
+    gettimeofday(&start_time, NULL)
+    for i in range(playouts):
+        gettimeofday(&copy_start_time, NULL)
+        copy_game(search_game, game)
+        gettimeofday(&copy_end_time, NULL)
+        copy_elapsed += ((copy_end_time.tv_sec - copy_start_time.tv_sec)*1000000.0 +
+                         (copy_end_time.tv_usec - copy_start_time.tv_usec))
+        mcts.mcts.rollout(search_game, &mcts.mcts.rollout_rngs[0])
+    gettimeofday(&end_time, NULL)
+
+    elapsed = ((end_time.tv_sec - start_time.tv_sec) +
+               (end_time.tv_usec - start_time.tv_usec) / 1000000.0)
+
+    usec[0] = copy_elapsed/playouts
+    if elapsed == 0.0:
+        return 0.0
+    return playouts/elapsed
+
+
+cdef long peak_rss():
+    """ Peak resident set size in KB.
+    """
+    cdef rusage usage
+
+    getrusage(RUSAGE_SELF, &usage)
+    return usage.ru_maxrss
+
+
+def main(cmd_line_args=None):
+    import argparse
+
+    d = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("bench", type=str, choices=['tree_parallel', 'root_parallel', 'node_memory', 'transposition', 'game_state', 'rollout_sampling', 'superko', 'tree_probs', 'rollout_probs', 'pattern_table', 'policy_feature', 'ladder_cache', 'ladder_reader', 'feature_batch'],
+                        help="Benchmark to run")
+    parser.add_argument("--rollout_path", "-ro", type=str, default=os.path.join(d, '../params/rollout/rollout.hdf5'),
+                        help="Rollout policy network weights (hdf5)")
+    parser.add_argument("--tree_path", "-tr", type=str, default=None,
+                        help="Tree policy network weights (hdf5)")
+    parser.add_argument("--mt_rands_file", "-mt", type=str, default=os.path.join(d, '../params/rollout/mt_rands.txt'),
+                        help="Mersenne twister random number file")
+    parser.add_argument("--x33_csv", "-x33", type=str, default=None,
+                        help="Non-response 3x3 pattern file")
+    parser.add_argument("--d12_rsp_csv", "-rd12", type=str, default=None,
+                        help="Response 12 point diamond(MD2) pattern file")
+    parser.add_argument("--d12_csv", "-d12", type=str, default=None,
+                        help="Non-response 12 point diamond(MD2) pattern file")
+    parser.add_argument("--node_hash_size", "-n", type=int, default=2**16,
+                        help="MCT node hash size (Default: 2**16)")
+    parser.add_argument("--sgf_files", "-sgf", type=str, nargs='+', default=[],
+                        help="SGF files replayed for feature benchmarks")
+    parser.add_argument("--threads", "-t", type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help="Numbers of search threads to measure (Default: 1 2 4 8 16 32)")
+    parser.add_argument("--trees", "-k", type=int, nargs='+', default=[1, 2, 4],
+                        help="Numbers of root parallel trees to measure (Default: 1 2 4)")
+    parser.add_argument("--moves", "-m", type=int, nargs='+', default=[0, 100, 200],
+                        help="Numbers of moves played before measurement (Default: 0 100 200)")
+    parser.add_argument("--playouts", "-p", type=int, default=10000,
+                        help="Number of simulations for each measurement (Default: 10000)")
+    parser.add_argument("--samples", "-s", type=int, default=100000,
+                        help="Number of rollout moves sampled or policy evaluations for each measurement (Default: 100000)")
+
+    if cmd_line_args is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(cmd_line_args)
+
+    setup(args.mt_rands_file,
+          args.x33_csv,
+          args.d12_rsp_csv,
+          args.d12_csv,
+          node_hash_size=args.node_hash_size)
+
+    if args.bench == 'tree_parallel':
+        bench_tree_parallel(args.rollout_path,
+                            args.tree_path,
+                            threads=args.threads,
+                            playouts=args.playouts)
+    elif args.bench == 'root_parallel':
+        bench_root_parallel(args.rollout_path,
+                            args.tree_path,
+                            threads=args.threads,
+                            trees=args.trees,
+                            playouts=args.playouts)
+    elif args.bench == 'node_memory':
+        bench_node_memory(args.rollout_path,
+                          args.tree_path,
+                          playouts=args.playouts)
+    elif args.bench == 'transposition':
+        bench_transposition(args.rollout_path,
+                            args.tree_path,
+                            playouts=args.playouts)
+    elif args.bench == 'game_state':
+        bench_game_state(args.rollout_path,
+                         moves=args.moves,
+                         playouts=args.playouts)
+    elif args.bench == 'rollout_sampling':
+        bench_rollout_sampling(args.rollout_path,
+                               moves=args.moves,
+                               playouts=args.playouts,
+                               samples=args.samples)
+    elif args.bench == 'superko':
+        bench_superko(args.rollout_path,
+                      moves=args.moves)
+    elif args.bench == 'rollout_probs':
+        bench_rollout_probs(args.rollout_path,
+                            moves=args.moves,
+                            playouts=args.playouts,
+                            samples=args.samples)
+    elif args.bench == 'pattern_table':
+        bench_pattern_table(args.rollout_path,
+                            samples=args.samples,
+                            playouts=args.playouts)
+    elif args.bench == 'policy_feature':
+        bench_policy_feature(moves=max(args.moves))
+    elif args.bench == 'ladder_cache':
+        bench_ladder_cache(args.sgf_files)
+    elif args.bench == 'ladder_reader':
+        bench_ladder_reader(moves=max(args.moves),
+                            samples=args.samples)
+    elif args.bench == 'feature_batch':
+        bench_feature_batch(moves=max(args.moves),
+                            threads=args.threads)
+    elif args.bench == 'tree_probs':
+        bench_tree_probs(args.rollout_path,
+                         args.tree_path,
+                         moves=args.moves,
+                         samples=args.samples)
@@ -28,12 +28,22 @@ cdef extern from "ray.h":
     int NEIGHBOR_END
     int LIBERTY_END
     int STRING_EMPTY_END
+    int BITBOARD_WORDS
     int MAX_RECORDS
+    int ROLLOUT_FENWICK_TOP
+    int SUPERKO_TABLE_SIZE
     int MAX_MOVES
     int PASS
     int RESIGN
     int KOMI
 
+    int UPDATED_STRING_MAX
+    bint COMPACT_GAME_STATE_ENABLED
+
+    ctypedef int board_int_t
+    ctypedef double rollout_prob_t
+    ctypedef short string_link_t
+
     int POS(int x, int y, int board_size) nogil
     int X(int pos, int board_size) nogil
     int Y(int pos, int board_size) nogil
@@ -75,18 +85,30 @@ cdef extern from "ray.h":
         int pos
         unsigned long long hash
 
+    # lib, neighbor and empty are sets walked with next_link, as linked lists
+    # or as bits in COMPACT_GAME_STATE, so their size here is not the real one
     ctypedef struct string_t:
         char color
         int libs
-        short lib[483]
+        string_link_t lib[483]
         int neighbors
-        short neighbor[288]
+        string_link_t neighbor[288]
         int empties
-        short empty[483]
+        string_link_t empty[483]
         int origin
         int size
         bint flag
 
+    int next_link(string_link_t *links, int i) nogil
+    bint has_link(string_link_t *links, int i) nogil
+    void clear_links(string_link_t *links, int n, int end) nogil
+    bint add_link(string_link_t *links, int i, int head) nogil
+    bint remove_link(string_link_t *links, int i) nogil
+
+    bint test_bit(unsigned long long *bits, int pos) nogil
+    void set_bit(unsigned long long *bits, int pos) nogil
+    void clear_bit(unsigned long long *bits, int pos) nogil
+
     ctypedef struct rollout_feature_t:
         int color
         int tensor[9][529]
@@ -95,12 +117,13 @@ cdef extern from "ray.h":
         int prev_d12[12]
         int prev_d12_num
         int prev_nakade
-        int updated[529]
+        board_int_t updated[529]
         int updated_num
 
     ctypedef struct game_state_t:
         char current_color
         move_t record[1083]     # MAX_RECORDS
+        short superko_table[2048]   # SUPERKO_TABLE_SIZE
         int moves
         int prisoner[4]         # S_MAX
         int ko_pos
@@ -110,33 +133,50 @@ cdef extern from "ray.h":
         unsigned long long positional_hash
 
         char board[529]         # BOARD_MAX
-        int birth_move[529]     # BOARD_MAX
+        board_int_t birth_move[529]     # BOARD_MAX
 
         int pass_count
 
         unsigned int pat[529]   # BOARD_MAX
 
+        unsigned long long stones[3][9]     # S_OB, BITBOARD_WORDS
+        unsigned long long atari[9]         # BITBOARD_WORDS
+
         string_t string[288]    # MAX_STRING
-        int string_id[483]      # STRING_POS_MAX
-        int string_next[483]    # STRING_POS_MAX
+        board_int_t string_id[483]      # STRING_POS_MAX
+        board_int_t string_next[483]    # STRING_POS_MAX
 
-        int candidates[529]     # BOARD_MAX
+        board_int_t candidates[529]     # BOARD_MAX
 
-        int seki[529]          # BOARD_MAX
+        board_int_t seki[529]          # BOARD_MAX
+
+        int stone_num[3]                # S_OB
+        board_int_t empty_pos[361]      # PURE_BOARD_MAX
+        board_int_t empty_pos_index[529]    # BOARD_MAX
+        int empty_pos_num
 
         int capture_num[3]      # S_OB
-        int capture_pos[3][361] # S_OB, PURE_BOARD_MAX
+        board_int_t capture_pos[3][361] # S_OB, PURE_BOARD_MAX
 
         int updated_string_num[3]       # S_OB
-        int updated_string_id[3][1083]  # S_OB, MAX_RECORDS
+        board_int_t updated_string_id[3][1083]  # S_OB, UPDATED_STRING_MAX
 
         rollout_feature_t rollout_feature_planes[3] # S_OB
-        double rollout_probs[3][361]    # S_OB, PURE_BOARD_MAX
-        double rollout_row_probs[3][19] # S_OB, PURE_BOARD_SIZE
-        double rollout_logits[3][361]   # S_OB, PURE_BOARD_MAX
+        rollout_prob_t rollout_logits[3][361]   # S_OB, PURE_BOARD_MAX
+        rollout_prob_t rollout_logits_fenwick[3][362]   # S_OB, PURE_BOARD_MAX + 1
         double rollout_logits_sum[3]    # S_OB
 
 
+cdef struct journal_entry_t:
+    void *addr          # where saved bytes are written back, NULL for end of move
+    int size            # number of saved bytes, or journal size at start of move
+
+cdef struct board_journal_t:
+    char *data          # saved bytes, each followed by its journal_entry_t
+    int size
+    int capacity
+
+
 cdef int pure_board_size
 cdef int pure_board_max
 
@@ -179,6 +219,12 @@ cdef int[:, ::1] corner_neighbor
 cdef unsigned char territory[65536]     # PAT3_MAX
 cdef unsigned char nb4_empty[65536]     # PAT3_MAX
 cdef unsigned char eye_condition[65536] # PAT3_MAX
+cdef unsigned char eye_shape[65536]     # PAT3_MAX, 2 bits for each color
+
+cdef enum:
+    EYE_SHAPE_NONE = 0      # not a true eye
+    EYE_SHAPE_TRUE = 1      # true eye whatever empty diagonals are
+    EYE_SHAPE_CHECK = 2     # true eye only if enough empty diagonals are true eyes
 
 cdef bint check_seki_flag
 cdef bint check_superko_flag
@@ -210,6 +256,10 @@ cpdef void set_use_lgrf2(bint flag)
 cdef game_state_t *allocate_game() nogil
 cdef void free_game(game_state_t *game) nogil
 cdef void copy_game(game_state_t *dst, game_state_t *src) nogil
+cdef board_journal_t *allocate_journal() nogil
+cdef void free_journal(board_journal_t *journal) nogil
+cdef bint put_stone_undoable(game_state_t *game, int pos, char color, board_journal_t *journal) nogil
+cdef void undo_put_stone(game_state_t *game, board_journal_t *journal) nogil
 cdef void initialize_board(game_state_t *game)
 
 cdef bint do_move(game_state_t *game, int pos) nogil
@@ -251,6 +301,11 @@ cdef bint is_legal_not_eye_rollout(game_state_t *game, int pos, char color) nogi
 cdef bint is_suicide(game_state_t *game, int pos, char color) nogil
 cdef bint is_true_eye(game_state_t *game, int pos, char color, char other_color, int empty_diagonal_stack[200], int empty_diagonal_top) nogil
 cdef bint is_superko(game_state_t *game, int pos, char color) nogil
+cdef void add_superko_hash(game_state_t *game) nogil
+cdef void remove_superko_hash(game_state_t *game, int move) nogil
+cdef bint find_superko_hash(game_state_t *game, unsigned long long hash) nogil
+cdef void add_empty_pos(game_state_t *game, int pos) nogil
+cdef void remove_empty_pos(game_state_t *game, int pos) nogil
 cdef int calculate_score(game_state_t *game) nogil
 cdef void check_bent_four_in_the_corner(game_state_t *game) nogil
 
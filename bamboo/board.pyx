@@ -8,7 +8,7 @@ cimport numpy as np
 
 import h5py as h5
 
-from libc.stdlib cimport malloc, free
+from libc.stdlib cimport malloc, realloc, free
 from libc.string cimport memset, memcpy
 from libc.math cimport exp as cexp
 from libc.stdio cimport printf
@@ -104,22 +104,29 @@ cdef void copy_game(game_state_t *dst, game_state_t *src) nogil:
     cdef int i
 
     memcpy(dst.record, src.record, sizeof(move_t) * MAX_RECORDS)
+    memcpy(dst.superko_table, src.superko_table, sizeof(short) * SUPERKO_TABLE_SIZE)
     memcpy(dst.prisoner, src.prisoner, sizeof(int) * S_MAX)
     memcpy(dst.board, src.board, sizeof(char) * BOARD_MAX)
-    memcpy(dst.birth_move, src.birth_move, sizeof(int) * BOARD_MAX)
+    memcpy(dst.birth_move, src.birth_move, sizeof(board_int_t) * BOARD_MAX)
     memcpy(dst.pat, src.pat, sizeof(int) * BOARD_MAX)
-    memcpy(dst.string_id, src.string_id, sizeof(int) * STRING_POS_MAX)
-    memcpy(dst.string_next, src.string_next, sizeof(int) * STRING_POS_MAX)
+    memcpy(dst.stones, src.stones, sizeof(dst.stones))
+    memcpy(dst.atari, src.atari, sizeof(dst.atari))
+    memcpy(dst.string_id, src.string_id, sizeof(board_int_t) * STRING_POS_MAX)
+    memcpy(dst.string_next, src.string_next, sizeof(board_int_t) * STRING_POS_MAX)
     memcpy(dst.capture_num, src.capture_num, sizeof(int) * S_OB)
-    memcpy(dst.capture_pos, src.capture_pos, sizeof(int) * S_OB * PURE_BOARD_MAX)
+    memcpy(dst.capture_pos, src.capture_pos, sizeof(board_int_t) * S_OB * PURE_BOARD_MAX)
+
+    memcpy(dst.stone_num, src.stone_num, sizeof(int) * S_OB)
+    memcpy(dst.empty_pos, src.empty_pos, sizeof(board_int_t) * src.empty_pos_num)
+    memcpy(dst.empty_pos_index, src.empty_pos_index, sizeof(board_int_t) * BOARD_MAX)
+    dst.empty_pos_num = src.empty_pos_num
     
     memcpy(dst.updated_string_num, src.updated_string_num, sizeof(int) * S_OB)
-    memcpy(dst.updated_string_id, src.updated_string_id, sizeof(int) * S_OB * MAX_RECORDS)
+    memcpy(dst.updated_string_id, src.updated_string_id, sizeof(board_int_t) * S_OB * UPDATED_STRING_MAX)
 
     memcpy(dst.rollout_feature_planes, src.rollout_feature_planes, sizeof(rollout_feature_t) * S_OB)
-    memcpy(dst.rollout_probs, src.rollout_probs, sizeof(double) * S_OB * PURE_BOARD_MAX)
-    memcpy(dst.rollout_row_probs, src.rollout_row_probs, sizeof(double) * S_OB * PURE_BOARD_SIZE)
-    memcpy(dst.rollout_logits, src.rollout_logits, sizeof(double) * S_OB * PURE_BOARD_MAX)
+    memcpy(dst.rollout_logits, src.rollout_logits, sizeof(rollout_prob_t) * S_OB * PURE_BOARD_MAX)
+    memcpy(dst.rollout_logits_fenwick, src.rollout_logits_fenwick, sizeof(rollout_prob_t) * S_OB * (PURE_BOARD_MAX + 1))
     memcpy(dst.rollout_logits_sum, src.rollout_logits_sum, sizeof(double) * S_OB)
 
     for i in range(MAX_STRING):
@@ -138,10 +145,220 @@ cdef void copy_game(game_state_t *dst, game_state_t *src) nogil:
     dst.ko_pos = src.ko_pos
 
 
+# bytes journal starts with, it is doubled when full
+cdef int journal_initial_capacity = 65536
+
+
+cdef board_journal_t *allocate_journal() nogil:
+    cdef board_journal_t *journal
+
+    journal = <board_journal_t *>malloc(sizeof(board_journal_t))
+    journal.data = <char *>malloc(journal_initial_capacity)
+    journal.size = 0
+    journal.capacity = journal_initial_capacity
+
+    return journal
+
+
+cdef void free_journal(board_journal_t *journal) nogil:
+    if journal:
+        free(journal.data)
+        free(journal)
+
+
+cdef inline void journal_save(board_journal_t *journal, void *addr, int size) nogil:
+    """ Append size bytes at addr and the entry to write them back.
+    Data is padded to 8 bytes, so that entries are walked back from the end.
+    """
+    cdef int padded = (size + 7) & ~7
+    cdef journal_entry_t entry
+
+    while journal.size + padded + <int>sizeof(journal_entry_t) > journal.capacity:
+        journal.capacity *= 2
+        journal.data = <char *>realloc(journal.data, journal.capacity)
+
+    memcpy(journal.data + journal.size, addr, size)
+    journal.size += padded
+
+    entry.addr = addr
+    entry.size = size
+    memcpy(journal.data + journal.size, &entry, sizeof(journal_entry_t))
+    journal.size += sizeof(journal_entry_t)
+
+
+cdef inline void journal_save_point(board_journal_t *journal, game_state_t *game, int pos) nogil:
+    journal_save(journal, &game.board[pos], sizeof(char))
+    journal_save(journal, &game.birth_move[pos], sizeof(board_int_t))
+    journal_save(journal, &game.string_id[pos], sizeof(board_int_t))
+    journal_save(journal, &game.string_next[pos], sizeof(board_int_t))
+    journal_save(journal, &game.empty_pos_index[pos], sizeof(board_int_t))
+
+
+cdef inline void journal_save_md2(board_journal_t *journal, game_state_t *game, int pos) nogil:
+    cdef int i
+
+    for i in range(12):
+        journal_save(journal, &game.pat[md2_pos[pos][i]], sizeof(unsigned int))
+
+
+cdef inline void journal_save_string(board_journal_t *journal, game_state_t *game,
+                                     int string_id, char *saved) nogil:
+    if not saved[string_id]:
+        journal_save(journal, &game.string[string_id], sizeof(string_t))
+        saved[string_id] = True
+
+
+cdef inline void journal_save_neighbor_strings(board_journal_t *journal, game_state_t *game,
+                                               string_t *string, char *saved) nogil:
+    cdef int neighbor = next_link(string.neighbor, 0)
+
+    while neighbor != NEIGHBOR_END:
+        journal_save_string(journal, game, neighbor, saved)
+        neighbor = next_link(string.neighbor, neighbor)
+
+
+cdef inline bint is_listed(int *ids, int num, int string_id) nogil:
+    cdef int i
+
+    for i in range(num):
+        if ids[i] == string_id:
+            return True
+    return False
+
+
+cdef bint put_stone_undoable(game_state_t *game, int pos, char color, board_journal_t *journal) nogil:
+    """ put_stone, saving to journal whatever the move overwrites, so that undo_put_stone takes it back.
+    Instead of the whole board, only points and strings around the move and captured strings are saved.
+    """
+    cdef journal_entry_t entry
+    cdef int start = journal.size
+    cdef char other = FLIP_COLOR(color)
+    cdef char saved[288]            # MAX_STRING
+    cdef int own_id[4]
+    cdef int own_num = 0
+    cdef int captured_id[4]
+    cdef int captured_num = 0
+    cdef int captured = 0
+    cdef int neighbor_pos, string_id, stone
+    cdef string_t *string
+    cdef int i
+
+    if not is_legal(game, pos, color):
+        return False
+
+    journal_save(journal, &game.current_color, sizeof(char))
+    journal_save(journal, &game.moves, sizeof(int))
+    journal_save(journal, &game.pass_count, sizeof(int))
+    journal_save(journal, &game.ko_pos, sizeof(int))
+    journal_save(journal, &game.ko_move, sizeof(int))
+    journal_save(journal, &game.current_hash, sizeof(unsigned long long))
+    journal_save(journal, &game.positional_hash, sizeof(unsigned long long))
+    if game.moves < max_records:
+        journal_save(journal, &game.record[game.moves], sizeof(move_t))
+
+    if pos != PASS:
+        journal_save(journal, &game.prisoner[<int>color], sizeof(int))
+        journal_save(journal, game.stone_num, sizeof(int) * S_OB)
+        journal_save(journal, game.capture_num, sizeof(int) * S_OB)
+        journal_save(journal, game.updated_string_num, sizeof(int) * S_OB)
+
+        # pos is replaced by the last empty point, and captured stones are appended after it
+        journal_save(journal, &game.empty_pos_num, sizeof(int))
+        journal_save(journal, &game.empty_pos[game.empty_pos_index[pos]], sizeof(board_int_t))
+        journal_save(journal, &game.empty_pos[game.empty_pos_num - 1], sizeof(board_int_t))
+        journal_save(journal, &game.empty_pos_index[game.empty_pos[game.empty_pos_num - 1]], sizeof(board_int_t))
+
+        journal_save_point(journal, game, pos)
+        journal_save_md2(journal, game, pos)
+        # bitboards are small enough to save whole
+        journal_save(journal, game.stones, sizeof(game.stones))
+        journal_save(journal, game.atari, sizeof(game.atari))
+
+        memset(saved, 0, sizeof(saved))
+        for i in range(8):
+            string_id = game.string_id[neighbor8_pos[pos][i]]
+            if game.string[string_id].flag:
+                journal_save_string(journal, game, string_id, saved)
+
+        for i in range(4):
+            neighbor_pos = neighbor4_pos[pos][i]
+            string_id = game.string_id[neighbor_pos]
+            string = &game.string[string_id]
+            if game.board[neighbor_pos] == color:
+                if not is_listed(own_id, own_num, string_id):
+                    own_id[own_num] = string_id
+                    own_num += 1
+                    # stones are linked into string in place of pos
+                    stone = string.origin
+                    while stone != string_end:
+                        journal_save_point(journal, game, stone)
+                        stone = game.string_next[stone]
+            elif game.board[neighbor_pos] == other and string.libs == 1:
+                if not is_listed(captured_id, captured_num, string_id):
+                    captured_id[captured_num] = string_id
+                    captured_num += 1
+                    stone = string.origin
+                    while stone != string_end:
+                        journal_save_point(journal, game, stone)
+                        journal_save_md2(journal, game, stone)
+                        captured += 1
+                        stone = game.string_next[stone]
+                    journal_save_neighbor_strings(journal, game, string, saved)
+
+        if captured > 0:
+            # put_stone clears captures of color, and remove_string appends them to those of current color
+            if game.current_color == color:
+                journal_save(journal, game.capture_pos[<int>color], sizeof(board_int_t) * captured)
+            else:
+                journal_save(journal,
+                             &game.capture_pos[<int>game.current_color][game.capture_num[<int>game.current_color]],
+                             sizeof(board_int_t) * captured)
+
+        if own_num == 0:
+            # new string takes first free id unless a captured string frees smaller one
+            string_id = 1
+            while game.string[string_id].flag:
+                string_id += 1
+            journal_save(journal, &game.string[string_id].flag, sizeof(bint))
+        elif own_num > 1:
+            # neighbors of merged strings are linked to the string they are merged into
+            for i in range(own_num):
+                journal_save_neighbor_strings(journal, game, &game.string[own_id[i]], saved)
+
+    put_stone(game, pos, color)
+
+    entry.addr = NULL
+    entry.size = start
+    journal_save(journal, &entry, sizeof(journal_entry_t))
+
+    return True
+
+
+cdef void undo_put_stone(game_state_t *game, board_journal_t *journal) nogil:
+    """ Take back the last move put by put_stone_undoable.
+    """
+    cdef journal_entry_t entry
+    cdef int start, padded
+
+    # last entry holds journal size at start of move
+    journal.size -= sizeof(journal_entry_t) + ((sizeof(journal_entry_t) + 7) & ~7)
+    memcpy(&entry, journal.data + journal.size, sizeof(journal_entry_t))
+    start = entry.size
+
+    if game.moves - 1 < max_records:
+        remove_superko_hash(game, game.moves - 1)
+
+    while journal.size > start:
+        memcpy(&entry, journal.data + journal.size - sizeof(journal_entry_t), sizeof(journal_entry_t))
+        padded = (entry.size + 7) & ~7
+        journal.size -= sizeof(journal_entry_t) + padded
+        memcpy(entry.addr, journal.data + journal.size, entry.size)
+
 cdef void initialize_board(game_state_t *game):
     cdef int i, j, x, y, pos
 
     memset(game.record, 0, sizeof(move_t) * MAX_RECORDS)
+    memset(game.superko_table, 0, sizeof(short) * SUPERKO_TABLE_SIZE)
     memset(game.pat, 0, sizeof(int) * BOARD_MAX)
 
     game.current_color = S_BLACK
@@ -153,9 +370,10 @@ cdef void initialize_board(game_state_t *game):
     game.positional_hash = 0
 
     fill_n_char(game.board, BOARD_MAX, 0)
-    fill_n_int(game.birth_move, BOARD_MAX, 0)
+    memset(game.birth_move, 0, sizeof(board_int_t) * BOARD_MAX)
     fill_n_int(game.capture_num, S_OB, 0)
     fill_n_int(game.updated_string_num, S_OB, 0)
+    fill_n_int(game.stone_num, S_OB, 0)
 
     for y in range(board_size):
         for x in range(OB_SIZE):
@@ -167,9 +385,19 @@ cdef void initialize_board(game_state_t *game):
     for i in range(max_string):
         game.string[i].flag = False
 
+    memset(game.empty_pos_index, 0, sizeof(board_int_t) * BOARD_MAX)
+    memset(game.stones, 0, sizeof(game.stones))
+    memset(game.atari, 0, sizeof(game.atari))
+    for i in range(pure_board_max):
+        game.empty_pos[i] = onboard_pos[i]
+        game.empty_pos_index[onboard_pos[i]] = i
+        set_bit(game.stones[<int>S_EMPTY], onboard_pos[i])
+    game.empty_pos_num = pure_board_max
+
     pat.clear_pattern(game.pat)
 
     initialize_neighbor()
+    initialize_eye_shape()
     initialize_territory()
     initialize_eye()
 
@@ -191,6 +419,7 @@ cdef bint put_stone(game_state_t *game, int pos, char color) nogil:
     cdef int prisoner = 0
     cdef int neighbor_pos, neighbor_string_id
     cdef string_t *neighbor_string
+    cdef bint own_atari = False
     cdef int i
 
     if not is_legal(game, pos, color):
@@ -203,6 +432,8 @@ cdef bint put_stone(game_state_t *game, int pos, char color) nogil:
     if pos == PASS:
         game.current_hash ^= hash_bit[game.pass_count][<int>HASH_PASS]
         game.pass_count += 1
+        if game.moves < max_records:
+            add_superko_hash(game)
         game.moves += 1
         return True
 
@@ -211,6 +442,10 @@ cdef bint put_stone(game_state_t *game, int pos, char color) nogil:
     game.capture_num[<int>color] = 0
 
     game.board[pos] = color
+    game.stone_num[<int>color] += 1
+    remove_empty_pos(game, pos)
+    clear_bit(game.stones[<int>S_EMPTY], pos)
+    set_bit(game.stones[<int>color], pos)
 
     game.current_hash ^= hash_bit[pos][<int>color]
     game.positional_hash ^= hash_bit[pos][<int>color]
@@ -227,12 +462,15 @@ cdef bint put_stone(game_state_t *game, int pos, char color) nogil:
                 connect[connection] = neighbor_string_id
                 connection += 1
                 memorize_updated_string(game, neighbor_string_id)
+                own_atari |= test_bit(game.atari, neighbor_pos)
             elif game.board[neighbor_pos] == other:
                 remove_liberty(neighbor_string, pos)
                 if game.string[game.string_id[neighbor_pos]].libs == 0:
                     prisoner += remove_string(game, neighbor_string)
                 else:
                     memorize_updated_string(game, neighbor_string_id)
+                    if neighbor_string.libs == 1:
+                        set_atari_bits(game, neighbor_string, True)
 
         if neighbor_string.flag:
             remove_empty(neighbor_string, pos)
@@ -243,13 +481,23 @@ cdef bint put_stone(game_state_t *game, int pos, char color) nogil:
         make_string(game, pos, color)
         if prisoner == 1 and game.string[game.string_id[pos]].libs == 1:
             game.ko_move = game.moves
-            game.ko_pos = game.string[game.string_id[pos]].lib[0]
+            game.ko_pos = next_link(game.string[game.string_id[pos]].lib, 0)
             game.current_hash ^= hash_bit[game.ko_pos][<int>HASH_KO]
     elif connection == 1:
         add_stone(game, pos, color, connect[0])
     else:
         connect_string(game, pos, color, connection, connect)
 
+    # stones of strings merged into the string at pos may have been in atari
+    neighbor_string = &game.string[game.string_id[pos]]
+    if neighbor_string.libs == 1:
+        set_atari_bits(game, neighbor_string, True)
+    elif own_atari:
+        set_atari_bits(game, neighbor_string, False)
+
+    if game.moves < max_records:
+        add_superko_hash(game)
+
     game.moves += 1
 
     game.birth_move[pos] = game.moves
@@ -294,10 +542,10 @@ cdef void merge_string(game_state_t *game, string_t *dst, string_t *src[3], int
         removed_string_id = game.string_id[src[i].origin]
 
         prev = 0
-        pos = src[i].lib[0]
+        pos = next_link(src[i].lib, 0)
         while pos != liberty_end:
             prev = add_liberty(dst, pos, prev)
-            pos = src[i].lib[pos]
+            pos = next_link(src[i].lib, pos)
 
         prev = 0
         pos = src[i].origin
@@ -309,19 +557,19 @@ cdef void merge_string(game_state_t *game, string_t *dst, string_t *src[3], int
             pos = tmp
 
         prev = 0
-        neighbor = src[i].neighbor[0]
+        neighbor = next_link(src[i].neighbor, 0)
         while neighbor != NEIGHBOR_END:
             remove_neighbor_string(&game.string[neighbor], removed_string_id)
             add_neighbor(dst, neighbor, prev)
             add_neighbor(&game.string[neighbor], string_id, prev)
             prev = neighbor
-            neighbor = src[i].neighbor[neighbor]
+            neighbor = next_link(src[i].neighbor, neighbor)
 
         prev = 0
-        pos = src[i].empty[0]
+        pos = next_link(src[i].empty, 0)
         while pos != STRING_EMPTY_END:
             prev = add_empty(dst, pos, prev)
-            pos = src[i].empty[pos]
+            pos = next_link(src[i].empty, pos)
 
         src[i].flag = False
 
@@ -395,16 +643,13 @@ cdef void make_string(game_state_t *game, int pos, char color) nogil:
 
     new_string = &game.string[string_id]
 
-    fill_n_short(new_string.lib, string_lib_max, 0)
-    fill_n_short(new_string.neighbor, max_neighbor, 0)
-    fill_n_short(new_string.empty, STRING_EMPTY_MAX, 0)
+    clear_links(new_string.lib, string_lib_max, liberty_end)
+    clear_links(new_string.neighbor, max_neighbor, NEIGHBOR_END)
+    clear_links(new_string.empty, STRING_EMPTY_MAX, STRING_EMPTY_END)
 
     new_string.libs = 0
-    new_string.lib[0] = liberty_end
     new_string.neighbors = 0
-    new_string.neighbor[0] = NEIGHBOR_END
     new_string.empties = 0
-    new_string.empty[0] = STRING_EMPTY_END
     new_string.color = color
     new_string.origin = pos
     new_string.size = 1
@@ -438,16 +683,21 @@ cdef int remove_string(game_state_t *game, string_t *string) nogil:
     cdef int remove_string_id = game.string_id[pos]
     cdef int remove_color = game.board[pos]
     cdef int *capture_num = &game.capture_num[color]
-    cdef int *capture_pos = game.capture_pos[color]
+    cdef board_int_t *capture_pos = game.capture_pos[color]
     cdef int lib
 
-    neighbor = string.neighbor[0]
+    neighbor = next_link(string.neighbor, 0)
     while neighbor != NEIGHBOR_END:
         memorize_updated_string(game, neighbor)
-        neighbor = string.neighbor[neighbor]
+        neighbor = next_link(string.neighbor, neighbor)
 
     while True:
         game.board[pos] = S_EMPTY
+        game.stone_num[remove_color] -= 1
+        add_empty_pos(game, pos)
+        clear_bit(game.stones[remove_color], pos)
+        clear_bit(game.atari, pos)
+        set_bit(game.stones[<int>S_EMPTY], pos)
 
         game.birth_move[pos] = 0
 
@@ -483,114 +733,63 @@ cdef int remove_string(game_state_t *game, string_t *string) nogil:
         if pos == string_end:
             break
 
-    neighbor = string.neighbor[0]
+    neighbor = next_link(string.neighbor, 0)
     while neighbor != NEIGHBOR_END:
         remove_neighbor_string(&game.string[neighbor], remove_string_id)
-        neighbor = string.neighbor[neighbor]
+        if game.string[neighbor].libs > 1 and test_bit(game.atari, game.string[neighbor].origin):
+            set_atari_bits(game, &game.string[neighbor], False)
+        neighbor = next_link(string.neighbor, neighbor)
 
     string.flag = False
 
     return string.size
 
 
-cdef int add_liberty(string_t *string, int pos, int head) nogil:
-    cdef int lib
-
-    if string.lib[pos] != 0:
-        return pos
-
-    lib = head
+cdef inline void set_atari_bits(game_state_t *game, string_t *string, bint atari) nogil:
+    """ Set or clear atari bits of stones of the string, as its liberties become one or more.
+    """
+    cdef int pos = string.origin
 
-    while string.lib[lib] < pos:
-        lib = string.lib[lib]
+    while pos != string_end:
+        if atari:
+            set_bit(game.atari, pos)
+        else:
+            clear_bit(game.atari, pos)
+        pos = game.string_next[pos]
 
-    string.lib[pos] = string.lib[lib]
-    string.lib[lib] = <short>pos
 
-    string.libs += 1
+cdef int add_liberty(string_t *string, int pos, int head) nogil:
+    if add_link(string.lib, pos, head):
+        string.libs += 1
 
     return pos
 
 
 cdef int add_empty(string_t *string, int pos, int head) nogil:
-    cdef int empty
-
-    if string.empty[pos] != 0:
-        return pos
-
-    empty = head
-
-    while string.empty[empty] < pos:
-        empty = string.empty[empty]
-
-    string.empty[pos] = string.empty[empty]
-    string.empty[empty] = <short>pos
-
-    string.empties += 1
+    if add_link(string.empty, pos, head):
+        string.empties += 1
 
     return pos
 
 
 cdef void remove_liberty(string_t *string, int pos) nogil:
-    cdef int lib = 0
-
-    if string.lib[pos] == 0:
-        return
-
-    while string.lib[lib] != pos:
-        lib = string.lib[lib]
-
-    string.lib[lib] = string.lib[string.lib[lib]]
-    string.lib[pos] = <short>0
-
-    string.libs -= 1
+    if remove_link(string.lib, pos):
+        string.libs -= 1
 
 
 cdef void remove_empty(string_t *string, int pos) nogil:
-    cdef int empty = 0
-
-    if string.empty[pos] == 0:
-        return
-
-    while string.empty[empty] != pos:
-        empty = string.empty[empty]
-
-    string.empty[empty] = string.empty[string.empty[empty]]
-    string.empty[pos] = <short>0
-
-    string.empties -= 1
+    if remove_link(string.empty, pos):
+        string.empties -= 1
 
 
 cdef void add_neighbor(string_t *string, int string_id, int head) nogil:
-    cdef int neighbor = 0
-
-    if string.neighbor[string_id] != 0:
-        return
-
-    neighbor = head
-
-    while string.neighbor[neighbor] < string_id:
-        neighbor = string.neighbor[neighbor]
-
-    string.neighbor[string_id] = string.neighbor[neighbor]
-    string.neighbor[neighbor] = <short>string_id
-
-    string.neighbors += 1
+    if add_link(string.neighbor, string_id, head):
+        string.neighbors += 1
 
 
 cdef void remove_neighbor_string(string_t *string, int string_id) nogil:
-    cdef int neighbor = 0
-
-    if string.neighbor[string_id] == 0:
-        return
-
-    while string.neighbor[neighbor] != string_id:
-        neighbor = string.neighbor[neighbor]
-
-    string.neighbor[neighbor] = string.neighbor[string.neighbor[neighbor]]
-    string.neighbor[string_id] = 0
-
-    string.neighbors -= 1
+    if remove_link(string.neighbor, string_id):
+        string.neighbors -= 1
 
 
 cdef void get_diagonals(int diagonals[4], int pos) nogil:
@@ -785,6 +984,48 @@ cdef void initialize_neighbor():
         nb4_empty[i] = empty
 
 
+cdef void initialize_eye_shape():
+    """ Classify 3x3 patterns whether the center is a true eye of black and white.
+    Only the patterns with empty diagonals left to be undecided need to look at the board.
+    """
+    cdef int neighbor_shift[4]
+    cdef int diagonal_shift[4]
+    cdef int i, j, color, stone
+    cdef int num_bad_diagonal, num_empty_diagonal, allowable_bad_diagonal
+    cdef unsigned char shape
+
+    neighbor_shift[:] = [2, 6, 8, 12]
+    diagonal_shift[:] = [0, 4, 10, 14]
+
+    for i in range(pat.PAT3_MAX):
+        eye_shape[i] = 0
+        for color in range(S_BLACK, S_WHITE + 1):
+            shape = EYE_SHAPE_TRUE
+            allowable_bad_diagonal = 1
+            for j in range(4):
+                stone = (i >> neighbor_shift[j]) & 0x3
+                if stone == S_EMPTY or stone == FLIP_COLOR(color):
+                    shape = EYE_SHAPE_NONE
+                elif stone == S_OB:
+                    allowable_bad_diagonal = 0
+
+            num_bad_diagonal = 0
+            num_empty_diagonal = 0
+            for j in range(4):
+                stone = (i >> diagonal_shift[j]) & 0x3
+                if stone == FLIP_COLOR(color):
+                    num_bad_diagonal += 1
+                elif stone == S_EMPTY:
+                    num_empty_diagonal += 1
+
+            if num_bad_diagonal > allowable_bad_diagonal:
+                shape = EYE_SHAPE_NONE
+            elif shape == EYE_SHAPE_TRUE and num_bad_diagonal + num_empty_diagonal > allowable_bad_diagonal:
+                shape = EYE_SHAPE_CHECK
+
+            eye_shape[i] |= shape << (2*(color - 1))
+
+
 cdef void initialize_territory():
     cdef int i
 
@@ -1066,10 +1307,11 @@ cdef bint is_legal_not_eye(game_state_t *game, int pos, char color) nogil:
         return False
 
     if nb4_empty[pat.pat3(game.pat, pos)] == 0:
-        if is_suicide(game, pos, color):
+        # eye shape is looked up from 3x3 pattern, so it goes before walking neighbor strings
+        if is_true_eye(game, pos, color, other_color, empty_diagonal_stack, empty_diagonal_top):
             return False
 
-        if is_true_eye(game, pos, color, other_color, empty_diagonal_stack, empty_diagonal_top):
+        if is_suicide(game, pos, color):
             return False
 
     if game.ko_pos == pos and game.ko_move == (game.moves - 1):
@@ -1093,10 +1335,11 @@ cdef bint is_legal_not_eye_rollout(game_state_t *game, int pos, char color) nogi
         return False
 
     if nb4_empty[pat.pat3(game.pat, pos)] == 0:
-        if is_suicide(game, pos, color):
+        # eye shape is looked up from 3x3 pattern, so it goes before walking neighbor strings
+        if is_true_eye(game, pos, color, other_color, empty_diagonal_stack, empty_diagonal_top):
             return False
 
-        if is_true_eye(game, pos, color, other_color, empty_diagonal_stack, empty_diagonal_top):
+        if is_suicide(game, pos, color):
             return False
 
     if game.ko_pos == pos and game.ko_move == (game.moves - 1):
@@ -1116,17 +1359,17 @@ cdef bint is_true_eye(game_state_t *game,
     cdef int dpos, dcolor
     cdef int i, j
     cdef bint found
+    cdef int shape
+
+    # most of points are decided by 3x3 pattern alone.
+    # eye owner is taken from other_color since some callers pass color of the (empty) point itself
+    shape = (eye_shape[pat.pat3(game.pat, pos)] >> (2*(FLIP_COLOR(other_color) - 1))) & 0x3
+    if shape != EYE_SHAPE_CHECK:
+        return shape == EYE_SHAPE_TRUE
 
     allowable_bad_diagonal = 1
     num_bad_diagonal = 0
 
-    if nb4_empty[pat.pat3(game.pat, pos)] != 0:
-        return False
-
-    for i in range(4):
-        if game.board[neighbor4_pos[pos][i]] == other_color:
-            return False
-
     if board_dis_x[pos] == 1 or board_dis_y[pos] == 1:
         allowable_bad_diagonal = 0
 
@@ -1156,17 +1399,18 @@ cdef bint is_true_eye(game_state_t *game,
 
 
 cdef bint is_suicide(game_state_t *game, int pos, char color) nogil:
+    """ Whether a move at pos has no liberty, ignoring empty neighbors.
+    A neighbor gives a liberty if it is an opponent stone in atari, or own stone not in atari,
+    which is looked up from bitboards instead of strings.
+    """
     cdef int other = FLIP_COLOR(color)
-    cdef int i, neighbor_pos, neighbor_id
+    cdef int i, neighbor_pos, word
 
     for i in range(4):
         neighbor_pos = neighbor4_pos[pos][i]
-        neighbor_id = game.string_id[neighbor_pos]
-        if (game.board[neighbor_pos] == other and
-            game.string[neighbor_id].libs == 1):
-            return False
-        elif (game.board[neighbor_pos] == color and
-              game.string[neighbor_id].libs > 1):
+        word = neighbor_pos >> 6
+        if (((game.stones[other][word] & game.atari[word]) |
+             (game.stones[<int>color][word] & ~game.atari[word])) >> (neighbor_pos & 63)) & 1:
             return False
 
     return True
@@ -1177,6 +1421,7 @@ cdef bint is_superko(game_state_t *game, int pos, char color) nogil:
     cdef int check[4]
     cdef int checked = 0
     cdef int string_id, string_pos
+    cdef string_t *string
     cdef unsigned long long hash = game.positional_hash
     cdef bint flag
     cdef int i, j
@@ -1184,31 +1429,84 @@ cdef bint is_superko(game_state_t *game, int pos, char color) nogil:
     for i in range(4):
         if game.board[neighbor4_pos[pos][i]] == other:
             string_id = game.string_id[neighbor4_pos[pos][i]]
-            string = game.string[string_id]
+            string = &game.string[string_id]
             if string.flag and string.libs == 1:
                 flag = False
                 for j in range(checked):
                     if check[j] == string_id:
                         flag = True
-                    if flag:
-                        continue
+                        break
+                if flag:
+                    continue
                 string_pos = string.origin
                 while string_pos != string_end:
                     hash ^= hash_bit[string_pos][other]
                     string_pos = game.string_next[string_pos]
-            check[checked] = string_id
-            checked += 1
+                check[checked] = string_id
+                checked += 1
 
     hash ^= hash_bit[pos][color]
-    
-    for i in range(1, game.moves + 1):
-        if game.record[game.moves - i].hash == hash:
+
+    return find_superko_hash(game, hash)
+
+
+cdef void add_superko_hash(game_state_t *game) nogil:
+    """ Record positional hash after current move, and index the move by it.
+    """
+    cdef unsigned long long hash = game.positional_hash
+    cdef int i = <int>(hash & (SUPERKO_TABLE_SIZE - 1))
+
+    game.record[game.moves].hash = hash
+
+    while game.superko_table[i] != 0:
+        i = (i + 1) & (SUPERKO_TABLE_SIZE - 1)
+    game.superko_table[i] = game.moves + 1
+
+
+cdef void remove_superko_hash(game_state_t *game, int move) nogil:
+    """ Remove the move added last. Moves must be removed in reverse order to keep probe sequences.
+    """
+    cdef int i = <int>(game.record[move].hash & (SUPERKO_TABLE_SIZE - 1))
+
+    while game.superko_table[i] != move + 1:
+        i = (i + 1) & (SUPERKO_TABLE_SIZE - 1)
+    game.superko_table[i] = 0
+
+
+cdef bint find_superko_hash(game_state_t *game, unsigned long long hash) nogil:
+    cdef int i = <int>(hash & (SUPERKO_TABLE_SIZE - 1))
+    cdef int move
+
+    while game.superko_table[i] != 0:
+        move = game.superko_table[i] - 1
+        if game.record[move].hash == hash:
             return True
+        i = (i + 1) & (SUPERKO_TABLE_SIZE - 1)
 
     return False
 
 
+cdef void add_empty_pos(game_state_t *game, int pos) nogil:
+    game.empty_pos[game.empty_pos_num] = pos
+    game.empty_pos_index[pos] = game.empty_pos_num
+    game.empty_pos_num += 1
+
+
+cdef void remove_empty_pos(game_state_t *game, int pos) nogil:
+    """ Remove pos from the empty point list by moving the last entry into its place.
+    """
+    cdef int index = game.empty_pos_index[pos]
+    cdef int last = game.empty_pos[game.empty_pos_num - 1]
+
+    game.empty_pos[index] = last
+    game.empty_pos_index[last] = index
+    game.empty_pos_num -= 1
+
+
 cdef int calculate_score(game_state_t *game) nogil:
+    """ Area score for black. Stones are counted incrementally by put_stone and remove_string,
+    so only empty points are visited unless seki has to be excluded under japanese rule.
+    """
     cdef int i
     cdef int pos
     cdef int color
@@ -1219,14 +1517,21 @@ cdef int calculate_score(game_state_t *game) nogil:
 
     check_bent_four_in_the_corner(game)
 
-    for i in range(pure_board_max):
-        pos = onboard_pos[i]
-        if japanese_rule_flag and game.seki[pos]:
-            continue
-        color = game.board[pos]
-        if color == S_EMPTY:
-            color = territory[pat.pat3(game.pat, pos)]
-        scores[color] += 1
+    if japanese_rule_flag:
+        for i in range(pure_board_max):
+            pos = onboard_pos[i]
+            if game.seki[pos]:
+                continue
+            color = game.board[pos]
+            if color == S_EMPTY:
+                color = territory[pat.pat3(game.pat, pos)]
+            scores[color] += 1
+    else:
+        scores[<int>S_BLACK] = game.stone_num[<int>S_BLACK]
+        scores[<int>S_WHITE] = game.stone_num[<int>S_WHITE]
+        for i in range(game.empty_pos_num):
+            pos = game.empty_pos[i]
+            scores[territory[pat.pat3(game.pat, pos)]] += 1
 
     return scores[<int>S_BLACK] - scores[<int>S_WHITE]
 
@@ -1234,8 +1539,8 @@ cdef int calculate_score(game_state_t *game) nogil:
 cdef void check_bent_four_in_the_corner(game_state_t *game) nogil:
     cdef char *board = game.board
     cdef string_t *string = game.string
-    cdef int *string_id = game.string_id
-    cdef int *string_next = game.string_next
+    cdef board_int_t *string_id = game.string_id
+    cdef board_int_t *string_next = game.string_next
     cdef int pos
     cdef int i
     cdef int id
@@ -1252,46 +1557,67 @@ cdef void check_bent_four_in_the_corner(game_state_t *game) nogil:
             string[id].libs == 2 and
             string[id].neighbors == 1):
             color = string[id].color
-            lib1 = string[id].lib[0]
-            lib2 = string[id].lib[lib1]
+            lib1 = next_link(string[id].lib, 0)
+            lib2 = next_link(string[id].lib, lib1)
             if ((board[corner_neighbor[i][0]] == S_EMPTY or board[corner_neighbor[i][0]] == color) and
                 (board[corner_neighbor[i][1]] == S_EMPTY or board[corner_neighbor[i][1]] == color)):
-                neighbor = string[id].neighbor[0];
+                neighbor = next_link(string[id].neighbor, 0);
                 if string[neighbor].libs == 2 and string[neighbor].size > 6:
                     # 呼吸点を共有しているかの確認
-                    neighbor_lib1 = string[neighbor].lib[0];
-                    neighbor_lib2 = string[neighbor].lib[neighbor_lib1];
+                    neighbor_lib1 = next_link(string[neighbor].lib, 0);
+                    neighbor_lib2 = next_link(string[neighbor].lib, neighbor_lib1);
                     if ((neighbor_lib1 == lib1 and neighbor_lib2 == lib2) or
                         (neighbor_lib1 == lib2 and neighbor_lib2 == lib1)):
                         pos = string[neighbor].origin
                         while pos != string_end:
-                            board[pos] = <char>color
+                            set_bent_four_color(game, pos, color)
                             pos = string_next[pos]
-                        pos = string[neighbor].lib[0]
-                        board[pos] = <char>color
-                        pos = string[neighbor].lib[pos]
-                        board[pos] = <char>color
+                        pos = next_link(string[neighbor].lib, 0)
+                        set_bent_four_color(game, pos, color)
+                        pos = next_link(string[neighbor].lib, pos)
+                        set_bent_four_color(game, pos, color)
+
+
+cdef inline void set_bent_four_color(game_state_t *game, int pos, int color) nogil:
+    """ Recolor pos keeping stone counts and empty point list. Recoloring twice changes nothing.
+    """
+    cdef int old_color = game.board[pos]
+
+    if old_color == color:
+        return
+
+    if old_color == S_EMPTY:
+        remove_empty_pos(game, pos)
+    else:
+        game.stone_num[old_color] -= 1
+    game.stone_num[color] += 1
+    game.board[pos] = <char>color
+    clear_bit(game.stones[old_color], pos)
+    set_bit(game.stones[color], pos)
 
 
 cdef void memorize_updated_string(game_state_t *game, int string_id) nogil:
     """ Memorized string_id for incremental rollout feature calculation.
         Number of memorized string is cleared after feature calculation.
+        Number exceeding UPDATED_STRING_MAX means overflow, and all strings are updated.
     """
     cdef int *num_for_black
-    cdef int *id_for_black
     cdef int *num_for_white
-    cdef int *id_for_white
 
     num_for_black = &game.updated_string_num[<int>S_BLACK]
     num_for_white = &game.updated_string_num[<int>S_WHITE]
 
-    if num_for_black[0] < MAX_RECORDS:
+    if num_for_black[0] < UPDATED_STRING_MAX:
         game.updated_string_id[<int>S_BLACK][num_for_black[0]] = string_id
         num_for_black[0] += 1
+    else:
+        num_for_black[0] = UPDATED_STRING_MAX + 1
 
-    if num_for_white[0] < MAX_RECORDS:
+    if num_for_white[0] < UPDATED_STRING_MAX:
         game.updated_string_id[<int>S_WHITE][num_for_white[0]] = string_id
         num_for_white[0] += 1
+    else:
+        num_for_white[0] = UPDATED_STRING_MAX + 1
 
 
 cdef cppvector[int] get_legal_moves(game_state_t *game, char color) nogil:
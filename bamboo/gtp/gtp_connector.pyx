@@ -31,7 +31,15 @@ class MCTSConnector(object):
                  const_playout=0,
                  n_threads=1,
                  intuition=False,
-                 nogpu=False):
+                 nogpu=False,
+                 pn_batch_size=1,
+                 pn_batch_wait_us=0,
+                 vn_batch_size=1,
+                 lock_free=False,
+                 transposition=False,
+                 root_parallel=1,
+                 game_pool_size=0,
+                 seed=-1):
         self.mcts = PyMCTS(
                 const_time=const_time,
                 playout_limit=playout_limit,
@@ -40,7 +48,15 @@ class MCTSConnector(object):
                 intuition=intuition,
                 nogpu=nogpu,
                 read_ahead=False,
-                self_play=False)
+                self_play=False,
+                pn_batch_size=pn_batch_size,
+                pn_batch_wait_us=pn_batch_wait_us,
+                vn_batch_size=vn_batch_size,
+                lock_free=lock_free,
+                transposition=transposition,
+                root_parallel=root_parallel,
+                game_pool_size=game_pool_size,
+                seed=seed)
         if pn_path:
             pn = cnn_policy()
             pn.load_weights(pn_path)
@@ -0,0 +1,33 @@
+#ifndef _ATOMIC_OP_H_
+#define _ATOMIC_OP_H_
+
+// double への不可分な加算 (CAS ループ)
+static inline void ATOMIC_ADD_DOUBLE(double *ptr, double value)
+{
+  double expected, desired;
+
+  __atomic_load(ptr, &expected, __ATOMIC_RELAXED);
+
+  do {
+    desired = expected + value;
+  } while (!__atomic_compare_exchange(ptr, &expected, &desired, 1, __ATOMIC_RELAXED, __ATOMIC_RELAXED));
+}
+
+static inline double ATOMIC_LOAD_DOUBLE(double *ptr)
+{
+  double value;
+
+  __atomic_load(ptr, &value, __ATOMIC_RELAXED);
+  return value;
+}
+
+static inline void ATOMIC_STORE_DOUBLE(double *ptr, double value)
+{
+  __atomic_store(ptr, &value, __ATOMIC_RELAXED);
+}
+
+// 展開したノードの子を他スレッドから見えるようにする
+#define ATOMIC_RELEASE_FENCE() __atomic_thread_fence(__ATOMIC_RELEASE)
+#define ATOMIC_ACQUIRE_FENCE() __atomic_thread_fence(__ATOMIC_ACQUIRE)
+
+#endif
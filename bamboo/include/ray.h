@@ -1,3 +1,5 @@
+#include <string.h>
+
 /*************
  * Pattern.h *
  *************/
@@ -43,8 +45,12 @@ const int NEIGHBOR_END = (MAX_NEIGHBOR - 1);  // 隣接する敵連の終端を
 const int LIBERTY_END = (STRING_LIB_MAX - 1); // 呼吸点の終端を表す値
 const int STRING_EMPTY_END = (STRING_EMPTY_MAX - 1);
 
+const int BITBOARD_WORDS = ((BOARD_MAX + 63) / 64);     // 盤外を含めた盤のビットボードの語数
+
 const int MAX_RECORDS = (PURE_BOARD_MAX * 3); // 記録する着手の最大数 
+const int ROLLOUT_FENWICK_TOP = 256;  // PURE_BOARD_MAX 以下の最大の 2 の冪
 const int MAX_MOVES = (MAX_RECORDS - 1);      // 着手数の最大値
+const int SUPERKO_TABLE_SIZE = 2048;  // MAX_RECORDS より大きい 2 の冪
 
 const int PASS = 0;     // パスに相当する値
 const int RESIGN = -1;  // 投了に相当する値
@@ -77,6 +83,26 @@ const int MAX_POLICY_FEATURE = 48;
 #define DIS(pos1, pos2, board_x, board_y, move_dis) (move_dis[DX(pos1, pos2, board_x)][DY(pos1, pos2, board_y)])
 
 
+// COMPACT_GAME_STATE を定義してビルドすると盤面サイズの配列を short,
+// ロールアウトの確率を float で持ち, 更新された連の記録を MAX_STRING で打ち切る.
+// 連の呼吸点, 隣接する敵連, 周囲の空点の集合は連結リストの代わりにビット列で持つ
+#ifdef COMPACT_GAME_STATE
+typedef short board_int_t;          // 座標, 連番号, 着手数を持つ配列の要素
+typedef float rollout_prob_t;       // ロールアウトの確率とロジット
+typedef unsigned long long string_link_t;   // 集合の要素ごとに 1 bit
+#define STRING_LINKS(n) (((n) + 63) / 64)
+const int UPDATED_STRING_MAX = MAX_STRING;  // 溢れたら全ての連を更新する
+const bool COMPACT_GAME_STATE_ENABLED = true;
+#else
+typedef int board_int_t;
+typedef double rollout_prob_t;
+typedef short string_link_t;        // 昇順の連結リスト (0 が先頭, 要素でなければ 0)
+#define STRING_LINKS(n) (n)
+const int UPDATED_STRING_MAX = MAX_RECORDS;
+const bool COMPACT_GAME_STATE_ENABLED = false;
+#endif
+
+
 enum stone {
     S_EMPTY,
     S_BLACK,
@@ -105,21 +131,136 @@ typedef struct move {
 } move_t;
 
 
-// 連を表す構造体 (19x19 : 1987bytes)
+// 連を表す構造体 (19x19 : 2540bytes, COMPACT_GAME_STATE では 208bytes)
 typedef struct {
     char color;                    // 連の色
     int libs;                      // 連の持つ呼吸点数
-    short lib[STRING_LIB_MAX];     // 連の持つ呼吸点の座標
+    string_link_t lib[STRING_LINKS(STRING_LIB_MAX)];      // 連の持つ呼吸点の座標
     int neighbors;                 // 隣接する敵の連の数
-    short neighbor[MAX_NEIGHBOR];  // 隣接する敵の連の連番号
+    string_link_t neighbor[STRING_LINKS(MAX_NEIGHBOR)];   // 隣接する敵の連の連番号
     int empties;                   // 連の周りの空座標数
-    short empty[STRING_EMPTY_MAX];   // 連の周りの空座標
+    string_link_t empty[STRING_LINKS(STRING_EMPTY_MAX)];  // 連の周りの空座標
     int origin;                    // 連の始点の座標
     int size;                      // 連を構成する石の数
     bool flag;                     // 連の存在フラグ
 } string_t;
 
 
+// 連の持つ集合 (呼吸点, 隣接する敵連, 周囲の空点) の操作.
+// どちらの表現でも 0 から辿ると昇順に要素を返し, 終端 end で止まる
+#ifdef COMPACT_GAME_STATE
+// i より大きい最初の要素 (end のビットは常に立っている)
+static inline int next_link(const string_link_t *links, int i)
+{
+    int w = (i + 1) >> 6;
+    string_link_t bits = links[w] & (~0ULL << ((i + 1) & 63));
+
+    while (bits == 0) {
+        bits = links[++w];
+    }
+    return (w << 6) | __builtin_ctzll(bits);
+}
+
+static inline bool has_link(const string_link_t *links, int i)
+{
+    return (links[i >> 6] >> (i & 63)) & 1;
+}
+
+static inline void clear_links(string_link_t *links, int n, int end)
+{
+    memset(links, 0, sizeof(string_link_t) * STRING_LINKS(n > end ? n : end + 1));
+    links[end >> 6] |= 1ULL << (end & 63);
+}
+
+// head は連結リストの探索開始位置で, ビット列では使わない
+static inline bool add_link(string_link_t *links, int i, int head)
+{
+    string_link_t bit = 1ULL << (i & 63);
+
+    if (links[i >> 6] & bit) {
+        return false;
+    }
+    links[i >> 6] |= bit;
+    return true;
+}
+
+static inline bool remove_link(string_link_t *links, int i)
+{
+    string_link_t bit = 1ULL << (i & 63);
+
+    if (!(links[i >> 6] & bit)) {
+        return false;
+    }
+    links[i >> 6] &= ~bit;
+    return true;
+}
+#else
+static inline int next_link(const string_link_t *links, int i)
+{
+    return links[i];
+}
+
+static inline bool has_link(const string_link_t *links, int i)
+{
+    return links[i] != 0;
+}
+
+static inline void clear_links(string_link_t *links, int n, int end)
+{
+    memset(links, 0, sizeof(string_link_t) * n);
+    links[0] = (string_link_t)end;
+}
+
+// 挿入位置は head から探す
+static inline bool add_link(string_link_t *links, int i, int head)
+{
+    int link = head;
+
+    if (links[i] != 0) {
+        return false;
+    }
+    while (links[link] < i) {
+        link = links[link];
+    }
+    links[i] = links[link];
+    links[link] = (string_link_t)i;
+    return true;
+}
+
+static inline bool remove_link(string_link_t *links, int i)
+{
+    int link = 0;
+
+    if (links[i] == 0) {
+        return false;
+    }
+    while (links[link] != i) {
+        link = links[link];
+    }
+    links[link] = links[i];
+    links[i] = 0;
+    return true;
+}
+#endif
+
+
+// 座標ごとに 1 bit のビットボードの操作
+static inline bool test_bit(const unsigned long long *bits, int pos)
+{
+    return (bits[pos >> 6] >> (pos & 63)) & 1;
+}
+
+static inline void set_bit(unsigned long long *bits, int pos)
+{
+    bits[pos >> 6] |= 1ULL << (pos & 63);
+}
+
+static inline void clear_bit(unsigned long long *bits, int pos)
+{
+    bits[pos >> 6] &= ~(1ULL << (pos & 63));
+}
+
+
 enum rollout_feature_e {
     F_RESPONSE,
     F_SAVE_ATARI,
@@ -142,7 +283,7 @@ typedef struct {
     int prev_d12[12];
     int prev_d12_num;
     int prev_nakade;
-    int updated[BOARD_MAX];
+    board_int_t updated[BOARD_MAX];
     int updated_num;
 } rollout_feature_t;
 
@@ -150,6 +291,7 @@ typedef struct {
 typedef struct {
     char current_color; 
     struct move record[MAX_RECORDS];    // 着手箇所と色の記録
+    short superko_table[SUPERKO_TABLE_SIZE];  // 局面ハッシュから引く着手番号 + 1 (開番地法, 0 は空き)
     int moves;                          // 着手数の記録
     int prisoner[S_MAX];                // アゲハマ
     int ko_pos;                         // 劫となっている箇所
@@ -161,29 +303,36 @@ typedef struct {
     unsigned long long positional_hash;  // 超劫用の局面ハッシュ
 
     char board[BOARD_MAX];              // 盤面 
-    int birth_move[BOARD_MAX];          // 打たれた着手数
+    board_int_t birth_move[BOARD_MAX];  // 打たれた着手数
 
     int pass_count;                   // パスした回数
 
     unsigned int pat[BOARD_MAX];      // 周囲の石の配置 
 
+    unsigned long long stones[S_OB][BITBOARD_WORDS];  // 空点(S_EMPTY), 黒石, 白石のビットボード
+    unsigned long long atari[BITBOARD_WORDS];         // 呼吸点が1つの連の石のビットボード
+
     string_t string[MAX_STRING];        // 連のデータ(19x19 : 573,845bytes)
-    int string_id[STRING_POS_MAX];    // 各座標の連のID
-    int string_next[STRING_POS_MAX];  // 連を構成する石のデータ構造
+    board_int_t string_id[STRING_POS_MAX];    // 各座標の連のID
+    board_int_t string_next[STRING_POS_MAX];  // 連を構成する石のデータ構造
 
-    int candidates[BOARD_MAX];  // 候補手かどうかのフラグ 
-    int seki[BOARD_MAX];
+    board_int_t candidates[BOARD_MAX];  // 候補手かどうかのフラグ 
+    board_int_t seki[BOARD_MAX];
+
+    int stone_num[S_OB];                        // 盤上の石の数
+    board_int_t empty_pos[PURE_BOARD_MAX];      // 空点の一覧
+    board_int_t empty_pos_index[BOARD_MAX];     // 空点の一覧での位置
+    int empty_pos_num;                          // 空点の数
   
     int capture_num[S_OB];                   // 前の着手で打ち上げた石の数
-    int capture_pos[S_OB][PURE_BOARD_MAX];   // 前の着手で石を打ち上げた座標 
+    board_int_t capture_pos[S_OB][PURE_BOARD_MAX];   // 前の着手で石を打ち上げた座標 
 
-    int updated_string_num[S_OB];               // 前の着手から更新された連の数
-    int updated_string_id[S_OB][MAX_RECORDS];   // 前の着手から更新された連のID
+    int updated_string_num[S_OB];                           // 前の着手から更新された連の数
+    board_int_t updated_string_id[S_OB][UPDATED_STRING_MAX];  // 前の着手から更新された連のID
 
     rollout_feature_t rollout_feature_planes[S_OB];
-    double rollout_probs[S_OB][PURE_BOARD_MAX];
-    double rollout_row_probs[S_OB][PURE_BOARD_SIZE];
-    double rollout_logits[S_OB][PURE_BOARD_MAX];
+    rollout_prob_t rollout_logits[S_OB][PURE_BOARD_MAX];
+    rollout_prob_t rollout_logits_fenwick[S_OB][PURE_BOARD_MAX + 1];  // ロジットの Fenwick 木 (1 始まり)
     double rollout_logits_sum[S_OB];
 } game_state_t;
 
@@ -205,6 +354,7 @@ typedef struct {
   int color;
   int moves;
   bool flag;
+  bool deleted;     // deleted entry, kept for probes passing through it
 } node_hash_t;
 
 
@@ -278,5 +428,10 @@ const int EXPLORATION_CONSTANT = 5;
 const int MIXING_PARAMETER = 0.6;
 
 const int PLAYOUT_LIMIT = 1000000;
+
+// 方策ネットワークで一度に評価する局面数の最大値
+const int POLICY_BATCH_MAX = 128;
+// 価値ネットワークで一度に評価する局面数の最大値
+const int VALUE_BATCH_MAX = 128;
 const double THINKING_TIME_LIMIT = 3600.0;
 
@@ -0,0 +1,66 @@
+#ifndef _THREAD_COND_H_
+#define _THREAD_COND_H_
+
+#include <errno.h>
+#include <pthread.h>
+#include <sys/time.h>
+
+// 条件変数とそれを保護する mutex の組
+typedef struct {
+  pthread_mutex_t mutex;
+  pthread_cond_t cond;
+} cond_lock_t;
+
+static inline void COND_INIT(cond_lock_t *c)
+{
+  pthread_mutex_init(&c->mutex, NULL);
+  pthread_cond_init(&c->cond, NULL);
+}
+
+static inline void COND_DESTROY(cond_lock_t *c)
+{
+  pthread_cond_destroy(&c->cond);
+  pthread_mutex_destroy(&c->mutex);
+}
+
+static inline void COND_LOCK(cond_lock_t *c)
+{
+  pthread_mutex_lock(&c->mutex);
+}
+
+static inline void COND_UNLOCK(cond_lock_t *c)
+{
+  pthread_mutex_unlock(&c->mutex);
+}
+
+static inline void COND_SIGNAL(cond_lock_t *c)
+{
+  pthread_cond_signal(&c->cond);
+}
+
+static inline void COND_BROADCAST(cond_lock_t *c)
+{
+  pthread_cond_broadcast(&c->cond);
+}
+
+// mutex を保持した状態で呼ぶ
+static inline void COND_WAIT(cond_lock_t *c)
+{
+  pthread_cond_wait(&c->cond, &c->mutex);
+}
+
+// mutex を保持した状態で呼ぶ. タイムアウトしたら 1 を返す
+static inline int COND_TIMEDWAIT(cond_lock_t *c, long usec)
+{
+  struct timeval now;
+  struct timespec deadline;
+
+  gettimeofday(&now, NULL);
+  usec += now.tv_usec;
+  deadline.tv_sec = now.tv_sec + usec / 1000000;
+  deadline.tv_nsec = (usec % 1000000) * 1000;
+
+  return pthread_cond_timedwait(&c->cond, &c->mutex, &deadline) == ETIMEDOUT;
+}
+
+#endif
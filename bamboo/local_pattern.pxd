@@ -15,6 +15,25 @@ cdef unordered_map[unsigned long long, int] x33_hashmap
 cdef unordered_map[unsigned long long, int] d12_rsp_hashmap
 cdef unordered_map[unsigned long long, int] d12_hashmap
 
+ctypedef struct pattern_entry_t:
+    unsigned long long hash
+    int id                      # -1 for empty slot
+
+ctypedef struct pattern_table_t:
+    pattern_entry_t *entries    # open addressing with linear probing
+    unsigned long long mask     # number of slots - 1
+    int size
+    unsigned long long lookups
+    unsigned long long hits
+    unsigned long long probes
+
+# read-only copies of hashmaps looked up in rollouts
+cdef pattern_table_t x33_table
+cdef pattern_table_t d12_rsp_table
+cdef pattern_table_t d12_table
+
+cdef bint pattern_table_stats_flag
+
 cpdef void initialize_rands()
 cpdef void read_rands(object mt_file)
 cpdef void write_rands(object mt_file, int n=?)
@@ -29,6 +48,13 @@ cpdef void put_d12_rspos_hash(unsigned long long bits, int id)
 cpdef void put_x33_hash(unsigned long long bits, int id)
 cpdef void put_d12_hash(unsigned long long bits, int id)
 
+cdef void build_pattern_table(pattern_table_t *table, unordered_map[unsigned long long, int] &hashmap)
+cdef void free_pattern_table(pattern_table_t *table)
+cpdef void finalize_pattern_tables()
+cdef int lookup_pattern_table(pattern_table_t *table, unsigned long long hash) nogil
+cpdef void set_pattern_table_stats(bint flag)
+cpdef dict get_pattern_table_stats()
+
 # 12 diamond pattern
 cdef unsigned long long d12_rsp_hash(game_state_t *game, int pos, int color,
                                  int empty_ix[12], int empty_pos[12], int *n_empty) nogil except? -1
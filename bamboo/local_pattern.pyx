@@ -3,7 +3,10 @@ import pandas as pd
 
 cimport numpy as np
 
+from cython.operator cimport dereference as deref, preincrement as inc
+
 from libc.stdio cimport printf
+from libc.stdlib cimport malloc, free
 
 from libcpp.string cimport string as cppstring
 
@@ -68,6 +71,7 @@ cpdef int init_d12_rsp_hash(object d12_csv):
             id_map[min_hash] = id_max
             id_max += 1
         d12_rsp_hashmap[hash] = id_map[min_hash]
+    build_pattern_table(&d12_rsp_table, d12_rsp_hashmap)
     printf('Response 12 diamond pattern loaded. #%d\n', id_max+1)
     return id_max + 1
 
@@ -88,6 +92,7 @@ cpdef int init_d12_rspos_hash(object d12_csv):
             id_map[min_hash] = id_max
             id_max += 1
         d12_rsp_hashmap[hash] = id_map[min_hash]
+    build_pattern_table(&d12_rsp_table, d12_rsp_hashmap)
     printf('Response 12 diamond move pattern loaded. #%d\n', id_max+1)
     return id_max + 1
 
@@ -108,6 +113,7 @@ cpdef int init_x33_hash(object x33_csv):
             id_map[min_hash] = id_max
             id_max += 1
         x33_hashmap[hash] = id_map[min_hash]
+    build_pattern_table(&x33_table, x33_hashmap)
     printf('Non-response 3x3 pattern loaded. #%d\n', id_max+1)
     return id_max + 1
 
@@ -128,6 +134,7 @@ cpdef int init_d12_hash(object d12_csv):
             id_map[min_hash] = id_max
             id_max += 1
         d12_hashmap[hash] = id_map[min_hash]
+    build_pattern_table(&d12_table, d12_hashmap)
     printf('Non-response 12 diamond pattern loaded. #%d\n', id_max+1)
     return id_max + 1
 
@@ -156,6 +163,117 @@ cpdef void put_d12_hash(unsigned long long bits, int id):
     d12_hashmap[hash] = id
 
 
+""" Flat pattern tables
+"""
+cdef void build_pattern_table(pattern_table_t *table, unordered_map[unsigned long long, int] &hashmap):
+    """ Copy hashmap into open addressing table whose load factor is at most 1/2.
+    Zobrist hashes are uniform, so low bits are used as home slot as they are.
+    """
+    cdef unordered_map[unsigned long long, int].iterator it
+    cdef unsigned long long n_slots = 2
+    cdef unsigned long long i
+
+    while n_slots < 2 * hashmap.size():
+        n_slots <<= 1
+
+    free_pattern_table(table)
+    table.entries = <pattern_entry_t *>malloc(n_slots * sizeof(pattern_entry_t))
+    table.mask = n_slots - 1
+    table.size = hashmap.size()
+    for i in range(n_slots):
+        table.entries[i].hash = 0
+        table.entries[i].id = -1
+
+    it = hashmap.begin()
+    while it != hashmap.end():
+        i = deref(it).first & table.mask
+        while table.entries[i].id != -1:
+            i = (i + 1) & table.mask
+        table.entries[i].hash = deref(it).first
+        table.entries[i].id = deref(it).second
+        inc(it)
+
+
+cdef void free_pattern_table(pattern_table_t *table):
+    if table.entries:
+        free(table.entries)
+    table.entries = NULL
+    table.mask = 0
+    table.size = 0
+    clear_pattern_table_stats(table)
+
+
+cpdef void finalize_pattern_tables():
+    """ Build tables again from hashmaps. put_*_hash only changes hashmaps,
+    so this must be called after them, before tables are looked up.
+    """
+    build_pattern_table(&x33_table, x33_hashmap)
+    build_pattern_table(&d12_rsp_table, d12_rsp_hashmap)
+    build_pattern_table(&d12_table, d12_hashmap)
+
+
+cdef int lookup_pattern_table(pattern_table_t *table, unsigned long long hash) nogil:
+    """ Return pattern id of hash, or -1 if it is not in table.
+    """
+    cdef unsigned long long i
+    cdef int n_probes = 1
+    cdef int id
+
+    if table.size == 0:
+        return -1
+
+    i = hash & table.mask
+    while table.entries[i].id != -1 and table.entries[i].hash != hash:
+        i = (i + 1) & table.mask
+        n_probes += 1
+    id = table.entries[i].id
+
+    if pattern_table_stats_flag:
+        # not atomic, counts of parallel search are approximate
+        table.lookups += 1
+        table.hits += id != -1
+        table.probes += n_probes
+
+    return id
+
+
+cpdef void set_pattern_table_stats(bint flag):
+    """ Enable counting lookups of pattern tables and reset counts.
+    """
+    global pattern_table_stats_flag
+    pattern_table_stats_flag = flag
+    clear_pattern_table_stats(&x33_table)
+    clear_pattern_table_stats(&d12_rsp_table)
+    clear_pattern_table_stats(&d12_table)
+
+
+cpdef dict get_pattern_table_stats():
+    """ Return size, number of slots, lookups, hits and mean probes of each pattern table.
+    """
+    return {'x33': pattern_table_stats(&x33_table),
+            'd12_rsp': pattern_table_stats(&d12_rsp_table),
+            'd12': pattern_table_stats(&d12_table)}
+
+
+cdef void clear_pattern_table_stats(pattern_table_t *table):
+    table.lookups = 0
+    table.hits = 0
+    table.probes = 0
+
+
+cdef dict pattern_table_stats(pattern_table_t *table):
+    cdef double mean_probes = .0
+
+    if table.lookups > 0:
+        mean_probes = table.probes/<double>table.lookups
+
+    return {'size': table.size,
+            'slots': table.mask + 1 if table.entries else 0,
+            'lookups': table.lookups,
+            'hits': table.hits,
+            'mean_probes': mean_probes}
+
+
 """ 12 diamond(MD2) Pattern functions
 """
 cdef unsigned long long d12_rsp_hash(game_state_t *game, int pos, int color,
@@ -1,6 +1,6 @@
 from libcpp.unordered_map cimport unordered_map
 
-from bamboo.board cimport game_state_t
+from bamboo.board cimport game_state_t, board_int_t
 
 
 cdef enum:
@@ -27,10 +27,10 @@ cdef unordered_map[long long, int] string_hashmap
 
 cpdef int initialize_nakade_hash()
 
-cdef int get_nakade_index(int capture_num, int *capture_pos) nogil
+cdef int get_nakade_index(int capture_num, board_int_t *capture_pos) nogil
 
 cdef int get_nakade_id(int capture_num, int nakade_index) nogil
 
-cdef int get_nakade_pos(int capture_num, int *capture_pos, int nakade_index) nogil
+cdef int get_nakade_pos(int capture_num, board_int_t *capture_pos, int nakade_index) nogil
 
 cdef int nakade_at_captured_stone(game_state_t *game, int color) nogil
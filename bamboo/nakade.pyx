@@ -9,7 +9,7 @@ from libcpp.unordered_map cimport unordered_map
 from bamboo.board cimport BOARD_MAX 
 from bamboo.board cimport FLIP_COLOR 
 from bamboo.board cimport board_size
-from bamboo.board cimport game_state_t
+from bamboo.board cimport game_state_t, board_int_t
 from bamboo.zobrist_hash cimport shape_bit 
 
 
@@ -159,7 +159,7 @@ cpdef int initialize_nakade_hash():
     return 6
 
 
-cdef int get_nakade_index(int capture_num, int *capture_pos) nogil:
+cdef int get_nakade_index(int capture_num, board_int_t *capture_pos) nogil:
     cdef unsigned long long hash = 0
     cdef int reviser
     cdef int i
@@ -180,13 +180,13 @@ cdef int get_nakade_id(int capture_num, int nakade_index) nogil:
     return nakade_id[capture_num - 3][nakade_index]
 
 
-cdef int get_nakade_pos(int capture_num, int *capture_pos, int nakade_index) nogil:
+cdef int get_nakade_pos(int capture_num, board_int_t *capture_pos, int nakade_index) nogil:
     return capture_pos[0] + nakade_pos[capture_num - 3][nakade_index]
 
 
 cdef int nakade_at_captured_stone(game_state_t *game, int color) nogil:
     cdef int capture_num = game.capture_num[FLIP_COLOR(color)]
-    cdef int *capture_pos = game.capture_pos[FLIP_COLOR(color)]
+    cdef board_int_t *capture_pos = game.capture_pos[FLIP_COLOR(color)]
     cdef unsigned long long hash = 0
     cdef int reviser
 
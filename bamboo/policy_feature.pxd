@@ -9,6 +9,66 @@ cdef enum:
     MAX_VALUE_PLANES = 49
     MAX_LADDER_DEPTH = 80
     MAX_LADDER_MOVES = 1000
+    LADDER_CACHE_SIZE = 65536
+
+cdef enum:
+    LADDER_CAPTURE = 0
+    LADDER_ESCAPE = 1
+
+# ladder planes set at liberties of a string
+cdef enum:
+    FIRST_LADDER_CAPTURE = 1
+    SECOND_LADDER_CAPTURE = 2
+    LADDER_ESCAPED = 4
+
+# layouts of update_batch output
+cdef enum:
+    PLANES_NCHW = 0     # (positions, planes, rows, columns)
+    PLANES_NHWC = 1     # (positions, rows, columns, planes)
+
+ctypedef struct ladder_cache_entry_t:
+    unsigned long long hash     # positional hash
+    int move                    # string origin, ladder move and its kind
+    int ko_pos                  # 0 unless ko is active
+    int board_size
+    int result
+    int region[4]               # bounding box of points the reading depends on
+    int prev                    # LRU list, most recently used first
+    int next
+    int chain                   # next entry of same bucket
+
+ctypedef struct ladder_cache_t:
+    ladder_cache_entry_t *entries
+    int *buckets
+    int mask                    # number of buckets - 1
+    int capacity
+    int size
+    int head
+    int tail
+    unsigned long long lookups
+    unsigned long long hits
+
+# ladder results shared by policy and value features
+cdef ladder_cache_t ladder_cache
+
+
+ctypedef struct feature_scratch_t:
+    # points and strings are marked with current stamp
+    unsigned int stamp
+    unsigned int libpos_stamp[483]  # STRING_LIB_MAX
+    unsigned int string_stamp[288]  # MAX_STRING
+    unsigned int neighbor_stamp[288]    # MAX_STRING
+    # copy of position ladders are read on, taken at first ladder search of each update
+    board.game_state_t *read_game
+    bint has_read_game
+    # moves played while reading ladders, taken back on the way out
+    board.board_journal_t *journal
+
+
+ctypedef struct ladder_read_t:
+    unsigned int stamp          # valid if equal to stamp of cached position
+    int region[4]               # bounding box of points the readings depend on
+    int result                  # ladder planes set at liberties
 
 
 cdef class PolicyFeature:
@@ -16,7 +76,20 @@ cdef class PolicyFeature:
         int n_planes
         int[:, ::1] planes
         bint do_not_put[361]   # PURE_BOARD_MAX
-        board.game_state_t *search_games
+        feature_scratch_t scratch
+        # last planes, board and legality of each color to move for incremental update
+        int[:, :, ::1] cached_planes
+        char cached_board[3][529]       # S_OB, BOARD_MAX
+        bint cached_legal[3][361]       # S_OB, PURE_BOARD_MAX
+        bint has_cache[3]               # S_OB
+        # ladders read on cached position, by string origin
+        ladder_read_t cached_ladder[3][529]     # S_OB, BOARD_MAX
+        unsigned int cached_ladder_stamp[3]     # S_OB
+        int cached_ko_pos[3]                    # S_OB
+        # planes and scratch of each thread of update_batch
+        int batch_threads
+        int[:, :, ::1] batch_planes
+        feature_scratch_t *batch_scratch
 
 
 cdef PolicyFeature allocate_feature(int n_planes)
@@ -25,9 +98,18 @@ cdef void free_feature(PolicyFeature feature)
 cdef void free_feature_games(PolicyFeature feature)
 
 cdef void update(PolicyFeature feature, board.game_state_t *game)
+cdef void update_incremental(PolicyFeature feature, board.game_state_t *game)
+cdef void update_planes(int[:, ::1] F, int n_planes, feature_scratch_t *scratch, board.game_state_t *game) nogil
+cdef void initialize_batch(PolicyFeature feature, int n_threads)
+cdef void update_batch(PolicyFeature feature, board.game_state_t **games, int n_games,
+                       int[:, :, :, :] out, int layout) except *
+
+cpdef void set_ladder_cache_size(int size)
+cpdef void clear_ladder_cache()
+cpdef dict get_ladder_cache_stats()
 
 cdef int is_ladder_capture(board.game_state_t *game, int string_id, int pos, int othre_pos,
-                           board.game_state_t *search_games, int depth, int *ladder_moves)
+                           board.board_journal_t *journal, int depth, int *ladder_moves, int region[4]) nogil
 
 cdef int is_ladder_escape(board.game_state_t *game, int string_id, int pos, bint is_atari_pos,
-                          board.game_state_t *search_games, int depth, int *ladder_moves)
+                          board.board_journal_t *journal, int depth, int *ladder_moves, int region[4]) nogil
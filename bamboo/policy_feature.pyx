@@ -10,10 +10,13 @@ from libc.string cimport memset, memcpy
 from libc.stdint cimport intptr_t
 from libc.stdio cimport printf
 
+from cython.parallel cimport prange, threadid
+cimport openmp
+
 from . cimport board 
 from . cimport printer
 
-from .board cimport PURE_BOARD_MAX, LIBERTY_END, NEIGHBOR_END
+from .board cimport PURE_BOARD_MAX
 from .board cimport NORTH, WEST, EAST, SOUTH
 from .board cimport board_size, liberty_end, string_end, onboard_index, board_dis_x, board_dis_y
 from .board cimport is_true_eye, get_neighbor4
@@ -28,12 +31,15 @@ cdef class PolicyFeature:
     def __cinit__(self, n_planes):
         self.planes = np.zeros((n_planes, board.pure_board_max), dtype=np.int32)
         self.n_planes = n_planes
-        self.search_games = NULL
+        self.scratch.read_game = NULL
+        self.scratch.journal = NULL
+        self.cached_planes = np.zeros((board.S_OB, n_planes, board.pure_board_max), dtype=np.int32)
+        self.batch_threads = 1
+        self.batch_scratch = NULL
     
     def __dealloc__(self):
-        if self.search_games:
-            free(self.search_games)
-            self.search_games = NULL
+        free_scratch(&self.scratch)
+        free_batch(self)
 
 
 cdef PolicyFeature allocate_feature(int n_planes):
@@ -42,21 +48,16 @@ cdef PolicyFeature allocate_feature(int n_planes):
 
 
 cdef void initialize_feature(PolicyFeature feature):
-    cdef game_state_t *game
-    
     feature.planes[...] = 0
 
-    game = <game_state_t *>malloc(80 * sizeof(game_state_t))
-    memset(game, 0, 80 * sizeof(game_state_t))
-
-    for i in range(80):
-        board.initialize_board(&game[i])
-
-    feature.search_games = game
+    initialize_scratch(&feature.scratch)
 
     for i in range(PURE_BOARD_MAX):
         feature.do_not_put[i] = False
 
+    for i in range(board.S_OB):
+        feature.has_cache[i] = False
+
 
 cdef void free_feature(PolicyFeature feature):
     if feature:
@@ -64,43 +65,132 @@ cdef void free_feature(PolicyFeature feature):
 
 
 cdef void free_feature_games(PolicyFeature feature):
-    if feature.search_games:
-        free(feature.search_games)
-        feature.search_games = NULL
+    free_scratch(&feature.scratch)
+    free_batch(feature)
+
+
+cdef void initialize_scratch(feature_scratch_t *scratch) nogil:
+    scratch.stamp = 0
+    memset(scratch.libpos_stamp, 0, sizeof(scratch.libpos_stamp))
+    memset(scratch.string_stamp, 0, sizeof(scratch.string_stamp))
+    memset(scratch.neighbor_stamp, 0, sizeof(scratch.neighbor_stamp))
+    if not scratch.read_game:
+        scratch.read_game = board.allocate_game()
+    scratch.has_read_game = False
+    if not scratch.journal:
+        scratch.journal = board.allocate_journal()
+
+
+cdef void free_scratch(feature_scratch_t *scratch) nogil:
+    if scratch.read_game:
+        board.free_game(scratch.read_game)
+        scratch.read_game = NULL
+    if scratch.journal:
+        board.free_journal(scratch.journal)
+        scratch.journal = NULL
+
+
+cdef void initialize_batch(PolicyFeature feature, int n_threads):
+    """ Give each of n_threads threads of update_batch its own planes and scratch.
+    With a single thread, update_batch encodes positions on planes of feature.
+    """
+    cdef int t
+
+    free_batch(feature)
+
+    if n_threads > 1:
+        feature.batch_planes = np.zeros((n_threads, feature.n_planes, board.pure_board_max), dtype=np.int32)
+        feature.batch_scratch = <feature_scratch_t *>malloc(n_threads * sizeof(feature_scratch_t))
+        for t in range(n_threads):
+            feature.batch_scratch[t].read_game = NULL
+            feature.batch_scratch[t].journal = NULL
+            initialize_scratch(&feature.batch_scratch[t])
+        feature.batch_threads = n_threads
+
+
+cdef void free_batch(PolicyFeature feature):
+    cdef int t
+
+    if feature.batch_scratch:
+        for t in range(feature.batch_threads):
+            free_scratch(&feature.batch_scratch[t])
+        free(feature.batch_scratch)
+        feature.batch_scratch = NULL
+    feature.batch_planes = None
+    feature.batch_threads = 1
 
 
 cdef void update(PolicyFeature feature, board.game_state_t *game):
-    cdef int[:, ::1] F = feature.planes
+    update_planes(feature.planes, feature.n_planes, &feature.scratch, game)
+
+
+cdef void update_batch(PolicyFeature feature,
+                       board.game_state_t **games,
+                       int n_games,
+                       int[:, :, :, :] out,
+                       int layout) except *:
+    """ Encode n_games positions directly into out, shaped (n_games, planes, 19, 19) in PLANES_NCHW
+    or (n_games, 19, 19, planes) in PLANES_NHWC layout. Positions are split among threads
+    given to initialize_batch. Games are only read, as ladders are read on a copy in scratch.
+    Raise ValueError if out does not fit, as planes are written without bounds checks.
+    """
+    cdef int n, t
+    cdef int size = board.pure_board_size
+    cdef tuple shape = (out.shape[0], out.shape[1], out.shape[2], out.shape[3])
+
+    if layout == PLANES_NCHW:
+        expected = (feature.n_planes, size, size)
+    elif layout == PLANES_NHWC:
+        expected = (size, size, feature.n_planes)
+    else:
+        raise ValueError('unknown layout {}'.format(layout))
+    if n_games < 0 or n_games > shape[0] or shape[1:] != expected:
+        raise ValueError('out of shape {} cannot hold {} games of shape {}'.format(shape, n_games, expected))
+
+    with nogil:
+        if feature.batch_threads <= 1:
+            for n in range(n_games):
+                update_planes(feature.planes, feature.n_planes, &feature.scratch, games[n])
+                write_planes(feature.planes, out, n, layout)
+        else:
+            for n in prange(n_games, num_threads=feature.batch_threads, schedule='dynamic'):
+                t = threadid()
+                update_planes(feature.batch_planes[t], feature.n_planes, &feature.batch_scratch[t], games[n])
+                write_planes(feature.batch_planes[t], out, n, layout)
+
 
+cdef void write_planes(int[:, ::1] F, int[:, :, :, :] out, int n, int layout) nogil:
+    cdef int x, y, i, j
+
+    if layout == PLANES_NCHW:
+        for j in range(F.shape[0]):
+            for i in range(board.pure_board_max):
+                y = i // board.pure_board_size
+                x = i - y * board.pure_board_size
+                out[n, j, y, x] = F[j, i]
+    else:
+        for i in range(board.pure_board_max):
+            y = i // board.pure_board_size
+            x = i - y * board.pure_board_size
+            for j in range(F.shape[0]):
+                out[n, y, x, j] = F[j, i]
+
+
+cdef void update_planes(int[:, ::1] F,
+                        int n_planes,
+                        feature_scratch_t *scratch,
+                        board.game_state_t *game) nogil:
     cdef char current_color = game.current_color
     cdef char other_color = board.FLIP_COLOR(game.current_color)
-    cdef int neighbor4[4]
-    cdef int pos, npos, nlib
-    cdef char color, ncolor
-    cdef int string_id, nstring_id
+    cdef int pos
+    cdef char color
+    cdef int string_id
     cdef board.string_t *string
-    cdef board.string_t *nstring
-    cdef int capture_size, self_atari_size, libs_after_move
-    cdef short neighbor_checked[361][288]   # PURE_BOARD_MAX:MAX_STRING
-    cdef board.string_t *capture_string
-    cdef int capture_pos
-    cdef int neighbor[361][288]
-    cdef int north_string_id, west_string_id, east_string_id, south_string_id
-    cdef int libpos_after_move[361][483]    # PURE_BOARD_MAX:STRING_LIB_MAX
-    cdef int libpos
     cdef int empty_diagonal_stack[200]
     cdef int empty_diagonal_top
     cdef short ladder_checked[288]          # MAX_STRING
-    cdef int ladder_capture, ladder_escape, ladder_x, ladder_y
-    cdef int escape_options[288]
-    cdef int escape_options_num
-    cdef int ladder_moves_value = 0
-    cdef int *ladder_moves = &ladder_moves_value
-    cdef int first_ladder_capture, first_ladder_escape
-    cdef int second_ladder_capture, second_ladder_escape
-    cdef int ladder_result
-    cdef int i, j, n
-    #cdef tree_node_t *child
+    cdef int region[4]
+    cdef int i
 
     F[...] = 0
 
@@ -108,28 +198,17 @@ cdef void update(PolicyFeature feature, board.game_state_t *game):
     F[3, :] = 1
 
     # Player color(1): Whether current player is black (value network only)
-    if feature.n_planes == MAX_VALUE_PLANES:
+    if n_planes == MAX_VALUE_PLANES:
         F[48, :] = (current_color == board.S_BLACK)
 
-    for i in range(361):
-        if i < 288:
-            ladder_checked[i] = False
-        for j in range(483):
-            if j < 288:
-                neighbor_checked[i][j] = False
-                neighbor[i][j] = 0
-            libpos_after_move[i][j] = 0
-        neighbor[i][0] = NEIGHBOR_END
-        libpos_after_move[i][0] = LIBERTY_END
+    memset(ladder_checked, 0, sizeof(ladder_checked))
+    scratch.has_read_game = False
 
     for i in range(361):
         # workaround for ut board size
         if board.pure_board_max - 1 < i:
             break
 
-        capture_size = 0
-        self_atari_size = 1
-        libs_after_move = 0
         pos = board.onboard_pos[i]
         color = game.board[pos]
 
@@ -144,86 +223,7 @@ cdef void update(PolicyFeature feature, board.game_state_t *game):
             F[2, i] = 1
 
         if board.is_legal(game, pos, current_color):
-            board.get_neighbor4(neighbor4, pos)
-
-            for n in range(4):
-                npos = neighbor4[n]
-                nstring_id = game.string_id[npos]
-                nstring = &game.string[nstring_id]
-                if nstring.flag:
-                    if nstring.color == current_color:
-                        if not neighbor_checked[i][nstring_id]:
-                            self_atari_size += nstring.size
-                            nlib = nstring.lib[0]
-                            while nlib != liberty_end:
-                                if nlib != pos and libpos_after_move[i][nlib] == 0:
-                                    libpos_after_move[i][nlib] = libpos_after_move[i][0]
-                                    libpos_after_move[i][0] = nlib
-                                nlib = nstring.lib[nlib]
-                            if neighbor[i][nstring_id] == 0:
-                                neighbor[i][nstring_id] = neighbor[i][0]
-                                neighbor[i][0] = nstring_id
-                            neighbor_checked[i][nstring_id] = True
-                elif game.board[npos] == board.S_EMPTY:
-                    if libpos_after_move[i][npos] == 0:
-                        libpos_after_move[i][npos] = libpos_after_move[i][0]
-                        libpos_after_move[i][0] = npos
-
-            for n in range(4):
-                npos = neighbor4[n]
-                nstring_id = game.string_id[npos]
-                nstring = &game.string[nstring_id]
-                if nstring.flag:
-                    if nstring.color != current_color and nstring.libs == 1 and nstring.lib[pos] != 0:
-                        # add neighbor pos
-                        if libpos_after_move[i][npos] == 0:
-                            libpos_after_move[i][npos] = libpos_after_move[i][0]
-                            libpos_after_move[i][0] = npos
-                        # add captured pos at own string neighbor 
-                        if not neighbor_checked[i][nstring_id]:
-                            capture_size += nstring.size
-                            capture_string = &game.string[nstring_id]
-                            capture_pos = capture_string.origin
-                            while capture_pos != string_end:
-                                if capture_pos != npos and libpos_after_move[i][capture_pos] == 0:
-                                    north_string_id = game.string_id[NORTH(capture_pos, board_size)]
-                                    if north_string_id and neighbor[i][north_string_id] != 0:
-                                        libpos_after_move[i][capture_pos] = libpos_after_move[i][0]
-                                        libpos_after_move[i][0] = capture_pos
-                                        capture_pos = game.string_next[capture_pos]
-                                        continue
-                                    west_string_id = game.string_id[WEST(capture_pos)]
-                                    if west_string_id and neighbor[i][west_string_id] != 0:
-                                        libpos_after_move[i][capture_pos] = libpos_after_move[i][0]
-                                        libpos_after_move[i][0] = capture_pos
-                                        capture_pos = game.string_next[capture_pos]
-                                        continue
-                                    east_string_id = game.string_id[EAST(capture_pos)]
-                                    if east_string_id and neighbor[i][east_string_id] != 0:
-                                        libpos_after_move[i][capture_pos] = libpos_after_move[i][0]
-                                        libpos_after_move[i][0] = capture_pos
-                                        capture_pos = game.string_next[capture_pos]
-                                        continue
-                                    south_string_id = game.string_id[SOUTH(capture_pos, board_size)]
-                                    if south_string_id and neighbor[i][south_string_id] != 0:
-                                        libpos_after_move[i][capture_pos] = libpos_after_move[i][0]
-                                        libpos_after_move[i][0] = capture_pos
-                                        capture_pos = game.string_next[capture_pos]
-                                        continue
-                                capture_pos = game.string_next[capture_pos]
-                            neighbor_checked[i][nstring_id] = True
-            # count libs_after_move
-            libpos = libpos_after_move[i][0]
-            while libpos != LIBERTY_END:
-                libs_after_move += 1
-                libpos = libpos_after_move[i][libpos]
-            # Capture size(8): How many opponent stones would be captured
-            F[20 + board.MIN(capture_size, 7), i] = 1
-            # Self-atari size(8): How many of own stones would be captured
-            if libs_after_move == 1:
-                F[28 + board.MIN(self_atari_size, 8) - 1, i] = 1
-            # Liberties after move(8): Number of liberties after this move is played
-            F[36 + board.MIN(libs_after_move, 8) - 1, i] = 1
+            update_move_planes(scratch, F, game, i, pos)
             # Whether a move is legal and does not fill its own eyes
             if not is_true_eye(game, pos, color, other_color, empty_diagonal_stack, empty_diagonal_top):
                 F[46, i] = 1
@@ -237,78 +237,654 @@ cdef void update(PolicyFeature feature, board.game_state_t *game):
                 # Liberties(8): Number of liberties (empty adjacent points)
                 F[12 + board.MIN(string.libs, 8) - 1, i] = 1
                 if not ladder_checked[string_id]:
-                    # Ladder capture(1): Whether a move at this point is a successful ladder capture
-                    if string.libs == 2 and string.color == other_color:
-                        # 1st candidate
-                        ladder_moves[0] = 0
-                        first_ladder_capture = string.lib[0]
-                        first_ladder_escape = string.lib[string.lib[0]]
-                        capture_result = is_ladder_capture(game,
-                                            string_id,
-                                            first_ladder_capture,
-                                            first_ladder_escape,
-                                            feature.search_games,
-                                            0,
-                                            ladder_moves)
-                        if capture_result == 1:
-                            F[44, onboard_index[first_ladder_capture]] = 1
-
-                        # 2nd candidate
-                        ladder_moves[0] = 0
-                        second_ladder_capture = first_ladder_escape
-                        second_ladder_escape = first_ladder_capture
-                        capture_result = is_ladder_capture(game,
-                                            string_id,
-                                            second_ladder_capture,
-                                            second_ladder_escape,
-                                            feature.search_games,
-                                            0,
-                                            ladder_moves)
-                        if capture_result == 1:
-                            F[44, onboard_index[second_ladder_capture]] = 1
-                    # Ladder escape(1): Whether a move at this point is a successful ladder escape
-                    elif string.libs == 1 and string.color == current_color:
-                        ladder_moves[0] = 0
-                        ladder_result =  is_ladder_escape(game,
-                                            string_id,
-                                            string.lib[0],
-                                            True, # is atari-pos
-                                            feature.search_games,
-                                            0,
-                                            ladder_moves)
-                        if ladder_result == 1:
-                            F[45, onboard_index[string.lib[0]]] = 1
-                        #else:
-                        #    # Cannot escape !!!
-                        #    if board.is_legal_not_eye(game, string.lib[0], current_color):
-                        #        child = node.children[onboard_index[string.lib[0]]]
-                        #        child.do_not_put = True
-
-                        """ Add capturing opponent stones to escape options
-                        escape_option_num = get_escape_options(game,
-                                                               escape_options,
-                                                               string.lib[0],
-                                                               current_color,
-                                                               string_id)
-                        for j in range(escape_option_num):
-                            ladder_moves[0] = 0
-                            if is_ladder_escape(game,
-                                                string_id,
-                                                escape_options[j],
-                                                j == escape_option_num - 1, # is atari-pos
-                                                feature.search_games,
-                                                0,
-                                                ladder_moves):
-                                F[45, onboard_index[escape_options[j]]] = 1
-                        """
+                    clear_ladder_region(region)
+                    update_ladder_planes(scratch, F, game, string_id, region)
                     ladder_checked[string_id] = True
 
 
+cdef void update_incremental(PolicyFeature feature, board.game_state_t *game):
+    """ Update planes recomputing capture size, self-atari size and liberties after move
+    only at points affected by strings changed since the last position of the same color to move.
+    Ladders are read again only if changed points are in the region their last readings depended on.
+    Other planes are cheap, and are recomputed at every point as update does.
+    """
+    cdef int[:, ::1] F = feature.planes
+    cdef int[:, ::1] cached_F
+
+    cdef char current_color = game.current_color
+    cdef char other_color = board.FLIP_COLOR(game.current_color)
+    cdef bint has_cache = feature.has_cache[<int>current_color]
+    cdef int pos, npos, lib
+    cdef char color
+    cdef int string_id
+    cdef board.string_t *string
+    cdef char dirty[529]                    # BOARD_MAX
+    cdef bint string_dirty[288]             # MAX_STRING
+    cdef int changed_pos[361]               # PURE_BOARD_MAX
+    cdef int changed_num = 0
+    cdef int empty_diagonal_stack[200]
+    cdef int empty_diagonal_top
+    cdef short ladder_checked[288]          # MAX_STRING
+    cdef ladder_read_t *read
+    cdef unsigned int ladder_stamp = feature.cached_ladder_stamp[<int>current_color]
+    cdef int ko_pos = 0
+    cdef bint reuse_ladders
+    cdef bint legal
+    cdef int i, j, n
+
+    cached_F = feature.cached_planes[<int>current_color]
+
+    memset(string_dirty, 0, sizeof(string_dirty))
+    memset(ladder_checked, 0, sizeof(ladder_checked))
+    feature.scratch.has_read_game = False
+
+    if game.ko_move == game.moves - 1:
+        ko_pos = game.ko_pos
+
+    if has_cache:
+        memset(dirty, 0, sizeof(dirty))
+    else:
+        # first position of this color to move is encoded at every point
+        memset(dirty, 1, sizeof(dirty))
+
+    # features of a point depend only on board configuration around it, except for legality
+    for i in range(board.pure_board_max):
+        pos = board.onboard_pos[i]
+        if has_cache and game.board[pos] != feature.cached_board[<int>current_color][pos]:
+            changed_pos[changed_num] = pos
+            changed_num += 1
+
+    # strings touching changed points may have different stones and liberties,
+    # and moves at their liberties may capture or connect differently
+    for n in range(changed_num):
+        pos = changed_pos[n]
+        dirty[pos] = True
+        for j in range(4):
+            npos = board.neighbor4_pos[pos][j]
+            dirty[npos] = True
+            string_id = game.string_id[npos]
+            if game.string[string_id].flag:
+                string_dirty[string_id] = True
+        string_id = game.string_id[pos]
+        if game.string[string_id].flag:
+            string_dirty[string_id] = True
+
+    for string_id in range(board.max_string):
+        if string_dirty[string_id]:
+            string = &game.string[string_id]
+            lib = board.next_link(string.lib, 0)
+            while lib != liberty_end:
+                dirty[lib] = True
+                lib = board.next_link(string.lib, lib)
+
+    for i in range(board.pure_board_max):
+        pos = board.onboard_pos[i]
+        color = game.board[pos]
+
+        empty_diagonal_top = 0
+
+        # Stone colour(3): Player stone(0) / opponent stone(1) / empty(2)
+        F[0, i] = color == current_color
+        F[1, i] = color == other_color
+        F[2, i] = color == board.S_EMPTY
+        # Ones: A constant plane filled with 1
+        F[3, i] = 1
+        for j in range(4, 20):
+            F[j, i] = 0
+        F[44, i] = 0
+        F[45, i] = 0
+        F[46, i] = 0
+        F[47, i] = 0
+        # Player color(1): Whether current player is black (value network only)
+        if feature.n_planes == MAX_VALUE_PLANES:
+            F[48, i] = (current_color == board.S_BLACK)
+
+        # ko and superko change legality without changing points around
+        legal = board.is_legal(game, pos, current_color)
+        if dirty[pos] or legal != feature.cached_legal[<int>current_color][i]:
+            for j in range(20, 44):
+                F[j, i] = 0
+            if legal:
+                update_move_planes(&feature.scratch, F, game, i, pos)
+        else:
+            for j in range(20, 44):
+                F[j, i] = cached_F[j, i]
+        feature.cached_legal[<int>current_color][i] = legal
+
+        if legal:
+            # Whether a move is legal and does not fill its own eyes
+            if not is_true_eye(game, pos, color, other_color, empty_diagonal_stack, empty_diagonal_top):
+                F[46, i] = 1
+        elif color != board.S_EMPTY:
+            string_id = game.string_id[pos]
+            string = &game.string[string_id]
+            # Turns since(8): How many turns since a move was played
+            if game.birth_move[pos]:
+                F[4 + board.MIN(game.moves - game.birth_move[pos], 7), i] = 1
+            # Liberties(8): Number of liberties (empty adjacent points)
+            F[12 + board.MIN(string.libs, 8) - 1, i] = 1
+
+    # ladders are read far from strings, so regions of last readings are checked instead
+    reuse_ladders = has_cache and ko_pos == feature.cached_ko_pos[<int>current_color]
+    for i in range(board.pure_board_max):
+        pos = board.onboard_pos[i]
+        if game.board[pos] != board.S_EMPTY:
+            string_id = game.string_id[pos]
+            if not ladder_checked[string_id]:
+                string = &game.string[string_id]
+                read = &feature.cached_ladder[<int>current_color][string.origin]
+                if (reuse_ladders and
+                        read.stamp == ladder_stamp and
+                        not string_dirty[string_id] and
+                        not ladder_region_changed(read.region, changed_pos, changed_num)):
+                    set_ladder_planes(F, string, read.result)
+                else:
+                    clear_ladder_region(read.region)
+                    read.result = update_ladder_planes(&feature.scratch, F, game, string_id, read.region)
+                read.stamp = ladder_stamp + 1
+                ladder_checked[string_id] = True
+
+    feature.cached_ladder_stamp[<int>current_color] = ladder_stamp + 1
+    feature.cached_ko_pos[<int>current_color] = ko_pos
+    save_cache(feature, game)
+
+
+cdef void save_cache(PolicyFeature feature, board.game_state_t *game):
+    """ Keep planes and board for the next incremental update of the same color to move.
+    Legality and ladders are kept by update_incremental as it computes them.
+    """
+    cdef int color = <int>game.current_color
+
+    feature.cached_planes[color, ...] = feature.planes
+    memcpy(feature.cached_board[color], game.board, sizeof(char) * board.board_max)
+    feature.has_cache[color] = True
+
+
+cdef unsigned int next_scratch_stamp(feature_scratch_t *scratch) nogil:
+    """ Invalidate marks of scratch arrays by advancing stamp, and return new stamp.
+    Arrays are cleared only when stamp wraps around.
+    """
+    scratch.stamp += 1
+    if scratch.stamp == 0:
+        memset(scratch.libpos_stamp, 0, sizeof(scratch.libpos_stamp))
+        memset(scratch.string_stamp, 0, sizeof(scratch.string_stamp))
+        memset(scratch.neighbor_stamp, 0, sizeof(scratch.neighbor_stamp))
+        scratch.stamp = 1
+    return scratch.stamp
+
+
+cdef void update_move_planes(feature_scratch_t *scratch,
+                             int[:, ::1] F,
+                             board.game_state_t *game,
+                             int i,
+                             int pos) nogil:
+    """ Set capture size, self-atari size and liberties after move planes of legal move at pos.
+    """
+    cdef unsigned int stamp = next_scratch_stamp(scratch)
+    cdef unsigned int *libpos_after_move = scratch.libpos_stamp
+    cdef unsigned int *neighbor_checked = scratch.string_stamp
+    cdef unsigned int *neighbor = scratch.neighbor_stamp
+    cdef char current_color = game.current_color
+    cdef int neighbor4[4]
+    cdef int npos, nlib
+    cdef int nstring_id
+    cdef board.string_t *nstring
+    cdef int capture_size = 0
+    cdef int self_atari_size = 1
+    cdef int libs_after_move = 0
+    cdef board.string_t *capture_string
+    cdef int capture_pos
+    cdef int n
+
+    board.get_neighbor4(neighbor4, pos)
+
+    for n in range(4):
+        npos = neighbor4[n]
+        nstring_id = game.string_id[npos]
+        nstring = &game.string[nstring_id]
+        if nstring.flag:
+            if nstring.color == current_color:
+                if neighbor_checked[nstring_id] != stamp:
+                    self_atari_size += nstring.size
+                    nlib = board.next_link(nstring.lib, 0)
+                    while nlib != liberty_end:
+                        if nlib != pos and libpos_after_move[nlib] != stamp:
+                            libpos_after_move[nlib] = stamp
+                            libs_after_move += 1
+                        nlib = board.next_link(nstring.lib, nlib)
+                    neighbor[nstring_id] = stamp
+                    neighbor_checked[nstring_id] = stamp
+        elif game.board[npos] == board.S_EMPTY:
+            if libpos_after_move[npos] != stamp:
+                libpos_after_move[npos] = stamp
+                libs_after_move += 1
+
+    for n in range(4):
+        npos = neighbor4[n]
+        nstring_id = game.string_id[npos]
+        nstring = &game.string[nstring_id]
+        if nstring.flag:
+            if nstring.color != current_color and nstring.libs == 1 and board.has_link(nstring.lib, pos):
+                # add neighbor pos
+                if libpos_after_move[npos] != stamp:
+                    libpos_after_move[npos] = stamp
+                    libs_after_move += 1
+                # add captured pos at own string neighbor 
+                if neighbor_checked[nstring_id] != stamp:
+                    capture_size += nstring.size
+                    capture_string = &game.string[nstring_id]
+                    capture_pos = capture_string.origin
+                    while capture_pos != string_end:
+                        if capture_pos != npos and libpos_after_move[capture_pos] != stamp:
+                            if (neighbor[game.string_id[NORTH(capture_pos, board_size)]] == stamp or
+                                    neighbor[game.string_id[WEST(capture_pos)]] == stamp or
+                                    neighbor[game.string_id[EAST(capture_pos)]] == stamp or
+                                    neighbor[game.string_id[SOUTH(capture_pos, board_size)]] == stamp):
+                                libpos_after_move[capture_pos] = stamp
+                                libs_after_move += 1
+                        capture_pos = game.string_next[capture_pos]
+                    neighbor_checked[nstring_id] = stamp
+    # Capture size(8): How many opponent stones would be captured
+    F[20 + board.MIN(capture_size, 7), i] = 1
+    # Self-atari size(8): How many of own stones would be captured
+    if libs_after_move == 1:
+        F[28 + board.MIN(self_atari_size, 8) - 1, i] = 1
+    # Liberties after move(8): Number of liberties after this move is played
+    F[36 + board.MIN(libs_after_move, 8) - 1, i] = 1
+
+
+cdef int update_ladder_planes(feature_scratch_t *scratch,
+                              int[:, ::1] F,
+                              board.game_state_t *game,
+                              int string_id,
+                              int region[4]) nogil:
+    """ Set ladder capture and ladder escape planes at liberties of the string, and return which are set.
+    Region is extended by points the readings depend on.
+    """
+    cdef char current_color = game.current_color
+    cdef char other_color = board.FLIP_COLOR(game.current_color)
+    cdef board.string_t *string = &game.string[string_id]
+    cdef int first_ladder_capture, first_ladder_escape
+    cdef int second_ladder_capture, second_ladder_escape
+    cdef int capture_result, ladder_result
+    cdef int neighbor_id
+    cdef int result = 0
+
+    if ((string.libs == 2 and string.color == other_color) or
+            (string.libs == 1 and string.color == current_color)):
+        # escapes depend on liberties of neighbors, which capturing them gives
+        add_ladder_region_string(game, string_id, region)
+        neighbor_id = board.next_link(string.neighbor, 0)
+        while neighbor_id != board.NEIGHBOR_END:
+            add_ladder_region_string(game, neighbor_id, region)
+            neighbor_id = board.next_link(string.neighbor, neighbor_id)
+
+    # Ladder capture(1): Whether a move at this point is a successful ladder capture
+    if string.libs == 2 and string.color == other_color:
+        # 1st candidate
+        first_ladder_capture = board.next_link(string.lib, 0)
+        first_ladder_escape = board.next_link(string.lib, first_ladder_capture)
+        capture_result = search_ladder(scratch,
+                            game,
+                            string_id,
+                            first_ladder_capture,
+                            first_ladder_escape,
+                            LADDER_CAPTURE,
+                            region)
+        if capture_result == 1:
+            result |= FIRST_LADDER_CAPTURE
+
+        # 2nd candidate
+        second_ladder_capture = first_ladder_escape
+        second_ladder_escape = first_ladder_capture
+        capture_result = search_ladder(scratch,
+                            game,
+                            string_id,
+                            second_ladder_capture,
+                            second_ladder_escape,
+                            LADDER_CAPTURE,
+                            region)
+        if capture_result == 1:
+            result |= SECOND_LADDER_CAPTURE
+    # Ladder escape(1): Whether a move at this point is a successful ladder escape
+    elif string.libs == 1 and string.color == current_color:
+        ladder_result = search_ladder(scratch,
+                            game,
+                            string_id,
+                            board.next_link(string.lib, 0),
+                            0,
+                            LADDER_ESCAPE,
+                            region)
+        if ladder_result == 1:
+            result |= LADDER_ESCAPED
+        #else:
+        #    # Cannot escape !!!
+        #    if board.is_legal_not_eye(game, string.lib[0], current_color):
+        #        child = node.children[onboard_index[string.lib[0]]]
+        #        child.do_not_put = True
+
+        """ Add capturing opponent stones to escape options
+        escape_option_num = get_escape_options(game,
+                                               escape_options,
+                                               board.next_link(string.lib, 0),
+                                               current_color,
+                                               string_id)
+        for j in range(escape_option_num):
+            ladder_moves[0] = 0
+            if is_ladder_escape(game,
+                                string_id,
+                                escape_options[j],
+                                j == escape_option_num - 1, # is atari-pos
+                                scratch.journal,
+                                0,
+                                ladder_moves):
+                F[45, onboard_index[escape_options[j]]] = 1
+        """
+
+    set_ladder_planes(F, string, result)
+    return result
+
+
+cdef void set_ladder_planes(int[:, ::1] F, board.string_t *string, int result) nogil:
+    cdef int first_lib = board.next_link(string.lib, 0)
+
+    if result & FIRST_LADDER_CAPTURE:
+        F[44, onboard_index[first_lib]] = 1
+    if result & SECOND_LADDER_CAPTURE:
+        F[44, onboard_index[board.next_link(string.lib, first_lib)]] = 1
+    if result & LADDER_ESCAPED:
+        F[45, onboard_index[first_lib]] = 1
+
+
+""" Ladder regions
+Bounding boxes of points ladder readings depend on, that is moves read, stones of strings
+next to them and of the string read. Liberties of these stones are within one point around.
+"""
+cdef inline void clear_ladder_region(int region[4]) nogil:
+    region[0] = board.board_size
+    region[1] = board.board_size
+    region[2] = -1
+    region[3] = -1
+
+
+cdef inline void add_ladder_region(int region[4], int pos) nogil:
+    cdef int x = board.X(pos, board.board_size)
+    cdef int y = board.Y(pos, board.board_size)
+
+    region[0] = board.MIN(region[0], x)
+    region[1] = board.MIN(region[1], y)
+    region[2] = board.MAX(region[2], x)
+    region[3] = board.MAX(region[3], y)
+
+
+cdef inline void merge_ladder_region(int region[4], int other[4]) nogil:
+    region[0] = board.MIN(region[0], other[0])
+    region[1] = board.MIN(region[1], other[1])
+    region[2] = board.MAX(region[2], other[2])
+    region[3] = board.MAX(region[3], other[3])
+
+
+cdef void add_ladder_region_string(board.game_state_t *game, int string_id, int region[4]) nogil:
+    cdef int pos = game.string[string_id].origin
+
+    while pos != string_end:
+        add_ladder_region(region, pos)
+        pos = game.string_next[pos]
+
+
+cdef void add_ladder_region_move(board.game_state_t *game, int pos, int region[4]) nogil:
+    cdef int npos, j
+    cdef char color
+
+    add_ladder_region(region, pos)
+    for j in range(4):
+        npos = board.neighbor4_pos[pos][j]
+        color = game.board[npos]
+        if color == board.S_BLACK or color == board.S_WHITE:
+            add_ladder_region_string(game, game.string_id[npos], region)
+
+
+cdef bint ladder_region_changed(int region[4], int *changed_pos, int changed_num) nogil:
+    """ Whether any of changed points is in region or next to it.
+    """
+    cdef int x, y, n
+
+    for n in range(changed_num):
+        x = board.X(changed_pos[n], board.board_size)
+        y = board.Y(changed_pos[n], board.board_size)
+        if (region[0] - 1 <= x <= region[2] + 1 and
+                region[1] - 1 <= y <= region[3] + 1):
+            return True
+    return False
+
+
+cdef int search_ladder(feature_scratch_t *scratch,
+                       board.game_state_t *game,
+                       int string_id,
+                       int pos,
+                       int atari_pos,
+                       int kind,
+                       int region[4]) nogil:
+    """ Read ladder capture or escape at pos from the top, looking up ladder cache first.
+    Results are keyed by position, and superko history is not taken into account.
+    Cache is shared by threads of update_batch, and is accessed under lock.
+    Region is extended by points the reading depends on.
+    """
+    cdef bint found
+    cdef board.string_t *string = &game.string[string_id]
+    cdef board.game_state_t *read_game
+    cdef int ladder_moves = 0
+    cdef int move = (string.origin * board.BOARD_MAX + pos) * 2 + kind
+    cdef int ko_pos = 0
+    cdef int read_region[4]
+    cdef int result
+
+    if game.ko_move == game.moves - 1:
+        ko_pos = game.ko_pos
+
+    openmp.omp_set_lock(&ladder_cache_lock)
+    found = lookup_ladder_cache(game.positional_hash, move, ko_pos, &result, read_region)
+    openmp.omp_unset_lock(&ladder_cache_lock)
+    if found:
+        merge_ladder_region(region, read_region)
+        return result
+
+    # game may be read by other threads, so moves are played on a copy
+    read_game = scratch.read_game
+    if not scratch.has_read_game:
+        board.copy_game(read_game, game)
+        scratch.has_read_game = True
+
+    clear_ladder_region(read_region)
+    if kind == LADDER_CAPTURE:
+        result = is_ladder_capture(read_game,
+                                   string_id,
+                                   pos,
+                                   atari_pos,
+                                   scratch.journal,
+                                   0,
+                                   &ladder_moves,
+                                   read_region)
+    else:
+        result = is_ladder_escape(read_game,
+                                  string_id,
+                                  pos,
+                                  True, # is atari-pos
+                                  scratch.journal,
+                                  0,
+                                  &ladder_moves,
+                                  read_region)
+
+    openmp.omp_set_lock(&ladder_cache_lock)
+    store_ladder_cache(game.positional_hash, move, ko_pos, result, read_region)
+    openmp.omp_unset_lock(&ladder_cache_lock)
+    merge_ladder_region(region, read_region)
+    return result
+
+
+""" Ladder cache
+"""
+cdef openmp.omp_lock_t ladder_cache_lock
+openmp.omp_init_lock(&ladder_cache_lock)
+
+
+cpdef void set_ladder_cache_size(int size):
+    """ Allocate LRU cache holding results of size ladder searches. Zero disables cache.
+    Cache is disabled by default, as keys are meaningless until zobrist hash is initialized.
+    """
+    cdef int n_buckets = 1
+
+    if ladder_cache.entries:
+        free(ladder_cache.entries)
+        free(ladder_cache.buckets)
+    ladder_cache.entries = NULL
+    ladder_cache.buckets = NULL
+    ladder_cache.capacity = 0
+    ladder_cache.mask = 0
+
+    if size > 0:
+        while n_buckets < size:
+            n_buckets <<= 1
+        ladder_cache.entries = <ladder_cache_entry_t *>malloc(size * sizeof(ladder_cache_entry_t))
+        ladder_cache.buckets = <int *>malloc(n_buckets * sizeof(int))
+        ladder_cache.capacity = size
+        ladder_cache.mask = n_buckets - 1
+
+    clear_ladder_cache()
+
+
+cpdef void clear_ladder_cache():
+    """ Remove all results and reset lookup counts.
+    """
+    cdef int i
+
+    if ladder_cache.buckets:
+        for i in range(ladder_cache.mask + 1):
+            ladder_cache.buckets[i] = -1
+    ladder_cache.size = 0
+    ladder_cache.head = -1
+    ladder_cache.tail = -1
+    ladder_cache.lookups = 0
+    ladder_cache.hits = 0
+
+
+cpdef dict get_ladder_cache_stats():
+    """ Return size, capacity, lookups, hits and hit rate of ladder cache.
+    """
+    cdef double hit_rate = .0
+
+    if ladder_cache.lookups > 0:
+        hit_rate = ladder_cache.hits/<double>ladder_cache.lookups
+
+    return {'size': ladder_cache.size,
+            'capacity': ladder_cache.capacity,
+            'lookups': ladder_cache.lookups,
+            'hits': ladder_cache.hits,
+            'hit_rate': hit_rate}
+
+
+cdef inline int ladder_cache_bucket(unsigned long long hash, int move) nogil:
+    return <int>((hash ^ (<unsigned long long>move * 2654435761ULL)) & <unsigned long long>ladder_cache.mask)
+
+
+cdef bint lookup_ladder_cache(unsigned long long hash, int move, int ko_pos, int *result, int region[4]) nogil:
+    cdef ladder_cache_entry_t *entry
+    cdef int i
+
+    if ladder_cache.capacity == 0:
+        return False
+
+    ladder_cache.lookups += 1
+
+    i = ladder_cache.buckets[ladder_cache_bucket(hash, move)]
+    while i != -1:
+        entry = &ladder_cache.entries[i]
+        if (entry.hash == hash and
+                entry.move == move and
+                entry.ko_pos == ko_pos and
+                entry.board_size == board.pure_board_size):
+            ladder_cache.hits += 1
+            # most recently used
+            if ladder_cache.head != i:
+                unlink_ladder_cache_lru(i)
+                push_ladder_cache_lru(i)
+            result[0] = entry.result
+            memcpy(region, entry.region, sizeof(entry.region))
+            return True
+        i = entry.chain
+
+    return False
+
+
+cdef void store_ladder_cache(unsigned long long hash, int move, int ko_pos, int result, int region[4]) nogil:
+    cdef ladder_cache_entry_t *entry
+    cdef int bucket
+    cdef int i, j
+
+    if ladder_cache.capacity == 0:
+        return
+
+    if ladder_cache.size < ladder_cache.capacity:
+        i = ladder_cache.size
+        ladder_cache.size += 1
+    else:
+        # evict least recently used
+        i = ladder_cache.tail
+        entry = &ladder_cache.entries[i]
+        unlink_ladder_cache_lru(i)
+        bucket = ladder_cache_bucket(entry.hash, entry.move)
+        if ladder_cache.buckets[bucket] == i:
+            ladder_cache.buckets[bucket] = entry.chain
+        else:
+            j = ladder_cache.buckets[bucket]
+            while ladder_cache.entries[j].chain != i:
+                j = ladder_cache.entries[j].chain
+            ladder_cache.entries[j].chain = entry.chain
+
+    entry = &ladder_cache.entries[i]
+    entry.hash = hash
+    entry.move = move
+    entry.ko_pos = ko_pos
+    entry.board_size = board.pure_board_size
+    entry.result = result
+    memcpy(entry.region, region, sizeof(entry.region))
+
+    bucket = ladder_cache_bucket(hash, move)
+    entry.chain = ladder_cache.buckets[bucket]
+    ladder_cache.buckets[bucket] = i
+    push_ladder_cache_lru(i)
+
+
+cdef void unlink_ladder_cache_lru(int i) nogil:
+    cdef ladder_cache_entry_t *entry = &ladder_cache.entries[i]
+
+    if entry.prev == -1:
+        ladder_cache.head = entry.next
+    else:
+        ladder_cache.entries[entry.prev].next = entry.next
+    if entry.next == -1:
+        ladder_cache.tail = entry.prev
+    else:
+        ladder_cache.entries[entry.next].prev = entry.prev
+
+
+cdef void push_ladder_cache_lru(int i) nogil:
+    cdef ladder_cache_entry_t *entry = &ladder_cache.entries[i]
+
+    entry.prev = -1
+    entry.next = ladder_cache.head
+    if ladder_cache.head != -1:
+        ladder_cache.entries[ladder_cache.head].prev = i
+    ladder_cache.head = i
+    if ladder_cache.tail == -1:
+        ladder_cache.tail = i
+
+
 cdef int get_escape_options(board.game_state_t *game,
                             int escape_options[288],
                             int atari_pos,
                             int escape_color,
-                            int string_id):
+                            int string_id) nogil:
     cdef board.string_t *string
     cdef board.string_t *neighbor
     cdef int neighbor_id, next_neighbor_id
@@ -316,13 +892,13 @@ cdef int get_escape_options(board.game_state_t *game,
 
     # Add capturing atari neighbor to options
     string = &game.string[string_id]
-    neighbor_id = string.neighbor[0]
+    neighbor_id = board.next_link(string.neighbor, 0)
     while neighbor_id != board.NEIGHBOR_END:
         neighbor = &game.string[neighbor_id]
-        if neighbor.libs == 1 and board.is_legal(game, neighbor.lib[0], escape_color):
-            escape_options[escape_options_num] = neighbor.lib[0]
+        if neighbor.libs == 1 and board.is_legal(game, board.next_link(neighbor.lib, 0), escape_color):
+            escape_options[escape_options_num] = board.next_link(neighbor.lib, 0)
             escape_options_num += 1
-        next_neighbor_id = string.neighbor[neighbor_id]
+        next_neighbor_id = board.next_link(string.neighbor, neighbor_id)
         if next_neighbor_id == neighbor_id:
             # todo. test the cases that come here.
             break
@@ -340,16 +916,19 @@ cdef int is_ladder_capture(board.game_state_t *game,
                             int string_id,
                             int pos,
                             int atari_pos,
-                            board.game_state_t *search_games,
+                            board.board_journal_t *journal,
                             int depth,
-                            int *ladder_moves):
-    cdef board.game_state_t *ladder_game = &search_games[depth]
-    cdef board.string_t *string
+                            int *ladder_moves,
+                            int region[4]) nogil:
+    """ Read ladder by playing on game itself. Moves are taken back with journal before return.
+    Region is extended by moves read and strings next to them.
+    """
     cdef char capture_color = game.current_color
     cdef char escape_color = board.FLIP_COLOR(game.current_color)
     cdef int escape_options[288]
     cdef int escape_options_num
     cdef int escape_result
+    cdef int result = 1
     cdef int i
 
     if depth >= MAX_LADDER_DEPTH:
@@ -367,6 +946,7 @@ cdef int is_ladder_capture(board.game_state_t *game,
         str(board.is_legal(game, pos, capture_color)),
         depth))
     """
+    add_ladder_region_move(game, pos, region)
     if not board.is_legal(game, pos, capture_color):
         """
         printer.print_board(game)
@@ -377,50 +957,50 @@ cdef int is_ladder_capture(board.game_state_t *game,
 
     ladder_moves[0] += 1
 
-    board.copy_game(ladder_game, game)
-    board.put_stone(ladder_game, pos, ladder_game.current_color)
-    ladder_game.current_color = board.FLIP_COLOR(ladder_game.current_color)
+    board.put_stone_undoable(game, pos, capture_color, journal)
+    game.current_color = escape_color
 
     # printf(">> Put stone to capture. color=%d, depth=%d, moves=%d\n", capture_color, depth, ladder_moves[0])
-    # printer.print_board(ladder_game)
+    # printer.print_board(game)
 
-    escape_options_num = get_escape_options(ladder_game,
+    escape_options_num = get_escape_options(game,
                                             escape_options,
                                             atari_pos,
                                             escape_color,
                                             string_id)
 
     for i in range(escape_options_num):
-        escape_result =  is_ladder_escape(ladder_game,
+        escape_result =  is_ladder_escape(game,
                             string_id,
                             escape_options[i],
                             i == escape_options_num - 1, # is atari-pos
-                            search_games,
+                            journal,
                             depth+1,
-                            ladder_moves)
+                            ladder_moves,
+                            region)
         if escape_result == 1:
-            return -1
+            result = -1
+            break
+
+    board.undo_put_stone(game, journal)
 
-    return 1
+    return result
 
 
 cdef int is_ladder_escape(board.game_state_t *game,
                           int string_id,
                           int pos,
                           bint is_atari_pos,
-                          board.game_state_t *search_games,
+                          board.board_journal_t *journal,
                           int depth,
-                          int *ladder_moves):
-    cdef board.game_state_t *ladder_game = &search_games[depth]
+                          int *ladder_moves,
+                          int region[4]) nogil:
     cdef board.string_t *string
     cdef char escape_color = game.current_color
     cdef char capture_color = board.FLIP_COLOR(game.current_color)
-    cdef int neighbor_id
-    cdef board.string_t *neighbor_string
     cdef int first_ladder_capture, first_ladder_escape
     cdef int second_ladder_capture, second_ladder_escape
-    cdef int capture_result
-    cdef int j
+    cdef int result
 
     if depth >= MAX_LADDER_DEPTH:
        return 0
@@ -437,6 +1017,7 @@ cdef int is_ladder_escape(board.game_state_t *game,
         str(board.is_legal(game, pos, capture_color)),
         depth))
     """
+    add_ladder_region_move(game, pos, region)
     if not board.is_legal(game, pos, escape_color):
         """
         printer.print_board(game)
@@ -447,49 +1028,48 @@ cdef int is_ladder_escape(board.game_state_t *game,
 
     ladder_moves[0] += 1
 
-    board.copy_game(ladder_game, game)
-    board.put_stone(ladder_game, pos, ladder_game.current_color)
-    ladder_game.current_color = board.FLIP_COLOR(ladder_game.current_color)
+    board.put_stone_undoable(game, pos, escape_color, journal)
+    game.current_color = capture_color
 
     # printf(">> Put stone to escape. color=%d, depth=%d, moves=%d\n", escape_color, depth, ladder_moves[0])
-    # printer.print_board(ladder_game)
+    # printer.print_board(game)
 
     # May change string_id by string merge
     if is_atari_pos:
-        string_id = ladder_game.string_id[pos]
+        string_id = game.string_id[pos]
 
-    string = &ladder_game.string[string_id]
+    string = &game.string[string_id]
     if string.libs == 1:
         # printf('>> Captured !!\n')
-        # printer.print_board(ladder_game)
-        return -1
+        result = -1
     elif string.libs >= 3:
         # printf('>> Escaped !!\n')
-        # printer.print_board(ladder_game)
-        return 1
+        result = 1
     else:
-        first_ladder_capture = string.lib[0]
-        first_ladder_escape = string.lib[string.lib[0]]
+        first_ladder_capture = board.next_link(string.lib, 0)
+        first_ladder_escape = board.next_link(string.lib, first_ladder_capture)
         second_ladder_capture = first_ladder_escape
         second_ladder_escape = first_ladder_capture
-        capture_result = is_ladder_capture(ladder_game,
-                             string_id,
-                             first_ladder_capture,
-                             first_ladder_escape,
-                             search_games,
-                             depth+1,
-                             ladder_moves)
-        if capture_result == 1:
-            return -1
+        if (is_ladder_capture(game,
+                              string_id,
+                              first_ladder_capture,
+                              first_ladder_escape,
+                              journal,
+                              depth+1,
+                              ladder_moves,
+                              region) == 1 or
+            is_ladder_capture(game,
+                              string_id,
+                              second_ladder_capture,
+                              second_ladder_escape,
+                              journal,
+                              depth+1,
+                              ladder_moves,
+                              region) == 1):
+            result = -1
         else:
-            capture_result = is_ladder_capture(ladder_game,
-                                 string_id,
-                                 second_ladder_capture,
-                                 second_ladder_escape,
-                                 search_games,
-                                 depth+1,
-                                 ladder_moves)
-            if capture_result == 1:
-                return -1
-            else:
-                return 1
+            result = 1
+
+    board.undo_put_stone(game, journal)
+
+    return result
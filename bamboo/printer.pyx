@@ -74,7 +74,7 @@ cdef void print_rollout_count(tree_node_t *root) nogil:
 
     for i in range(root.num_child):
         pos = root.children_pos[i]
-        rollout_count[pos] = <int>root.children[pos].Nr
+        rollout_count[pos] = <int>root.children[i].Nr
 
     printf(">> Number of rollout: %d\n", <int>root.Nr)
     printf("Player: %s\n", cppstring(1, stone[root.player_color]).c_str())
@@ -123,7 +123,7 @@ cdef void print_winning_ratio(tree_node_t *root) nogil:
     if root.Nr > 0:
         for i in range(root.num_child):
             pos = root.children_pos[i]
-            child = root.children[pos]
+            child = root.children[i]
             if child.Nr > .0:
                 winning_ratio[pos] = child.Wr/child.Nr
             else:
@@ -176,7 +176,7 @@ cdef void print_PN(tree_node_t *root) nogil:
 
     for i in range(root.num_child):
         pos = root.children_pos[i]
-        prior_prob[pos] = root.children[pos].P*100.0
+        prior_prob[pos] = root.children_P[i]*100.0
 
     printf(">> PN evaluation\n")
     printf("Player: %s\n", cppstring(1, stone[root.player_color]).c_str())
@@ -225,7 +225,7 @@ cdef void print_VN(tree_node_t *root) nogil:
 
     for i in range(root.num_child):
         pos = root.children_pos[i]
-        values[pos] = root.children[pos].Wv*100.0
+        values[pos] = root.children[i].Wv*100.0
 
     printf(">> VN evaluation: %3.2lf\n", root.Wv*100.0)
     printf("Player: %s\n", cppstring(1, stone[root.player_color]).c_str())
@@ -274,7 +274,7 @@ cdef void print_Q(tree_node_t *root) nogil:
 
     for i in range(root.num_child):
         pos = root.children_pos[i]
-        action_value[pos] = root.children[pos].Q
+        action_value[pos] = root.children[i].Q
 
     printf(">> Action-Value(Q)\n")
     printf("Player: %s\n", cppstring(1, stone[root.player_color]).c_str())
@@ -323,11 +323,11 @@ cdef void print_u(tree_node_t *root) nogil:
 
     for i in range(root.num_child):
         pos = root.children_pos[i]
-        child = root.children[pos]
+        child = root.children[i]
         if root.Nr > .0:
-            bonus[pos] = EXPLORATION_CONSTANT * child.P * (csqrt(root.Nr) / (1 + child.Nr))
+            bonus[pos] = EXPLORATION_CONSTANT * root.children_P[i] * (csqrt(root.Nr) / (1 + child.Nr))
         else:
-            bonus[pos] = EXPLORATION_CONSTANT * child.P
+            bonus[pos] = EXPLORATION_CONSTANT * root.children_P[i]
 
     printf(">> Bonus(u)\n")
     printf("Player: %s\n", cppstring(1, stone[root.player_color]).c_str())
@@ -376,11 +376,11 @@ cdef void print_selection_value(tree_node_t *root) nogil:
 
     for i in range(root.num_child):
         pos = root.children_pos[i]
-        child = root.children[pos]
+        child = root.children[i]
         if root.Nr > .0:
-            selection[pos] = child.Q + EXPLORATION_CONSTANT * child.P * (csqrt(root.Nr) / (1 + child.Nr))
+            selection[pos] = child.Q + EXPLORATION_CONSTANT * root.children_P[i] * (csqrt(root.Nr) / (1 + child.Nr))
         else:
-            selection[pos] = child.Q + EXPLORATION_CONSTANT * child.P
+            selection[pos] = child.Q + EXPLORATION_CONSTANT * root.children_P[i]
 
     printf(">> Action-Value(Q) + Bonus(u)\n")
     printf("Player: %s\n", cppstring(1, stone[root.player_color]).c_str())
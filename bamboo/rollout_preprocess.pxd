@@ -1,4 +1,4 @@
-from bamboo.board cimport game_state_t, rollout_feature_t, string_t
+from bamboo.board cimport game_state_t, rollout_feature_t, string_t, board_int_t, rollout_prob_t
 
 cdef extern from "ray.h":
     ctypedef enum:
@@ -15,6 +15,10 @@ cdef extern from "ray.h":
 cdef enum:
     MOVE_DISTANCE_MAX = 17
 
+ctypedef struct rollout_rng_t:
+    unsigned long long s[4]     # xoshiro256** state
+    unsigned long long pad[4]   # keep generators of search threads on separate cache lines
+
 cdef bint debug
 
 cdef int rollout_feature_size
@@ -40,8 +44,12 @@ cdef int self_atari_start
 cdef int last_move_distance_start
 cdef int d12_start
 
-cdef double rollout_weights[100000]
-cdef double tree_weights[100000]
+# weights indexed by feature, where index -1 (no feature) reads zero weight
+cdef double *rollout_weights
+cdef double *tree_weights
+# exp of weights, where index -1 reads one
+cdef double *rollout_exp_weights
+cdef double *tree_exp_weights
 
 cdef bint use_pos_aware_d12 = False
 
@@ -66,12 +74,17 @@ cdef void clear_onehot_index(rollout_feature_t *feature, int pos) nogil
 cdef void clear_updated_string_cache(game_state_t *game) nogil
 cdef bint memorize_updated(rollout_feature_t *feature, int pos) nogil
 
+cdef void seed_rollout_rng(rollout_rng_t *rng, unsigned long long seed) nogil
+cdef double rollout_rng_uniform(rollout_rng_t *rng) nogil
+
 cdef void initialize_probs(game_state_t *game) nogil
 cdef void update_probs(game_state_t *game) nogil
 cdef void update_all_probs(game_state_t *game) nogil
-cdef void norm_probs(double *probs, double *row_probs, double *logits, double logits_sum) nogil
+cdef void build_logits_fenwick(rollout_prob_t *fenwick, rollout_prob_t *logits) nogil
+cdef void add_logits_fenwick(rollout_prob_t *fenwick, int pure_pos, double delta) nogil
+cdef int search_logits_fenwick(rollout_prob_t *fenwick, rollout_prob_t *logits, double value) nogil
 cdef void set_illegal(game_state_t *game, int pos) nogil
-cdef int choice_rollout_move(game_state_t *game) nogil
+cdef int choice_rollout_move(game_state_t *game, rollout_rng_t *rng) nogil
 cdef void get_rollout_probs(game_state_t *game, double *probs) nogil
 
 cdef void update_tree_planes_all(game_state_t *game) nogil
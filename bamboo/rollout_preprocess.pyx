@@ -10,20 +10,47 @@ cimport numpy as np
 
 from libc.math cimport exp as cexp
 from libc.math cimport round as cround
-from libc.stdlib cimport rand, RAND_MAX
 from libc.stdio cimport printf
 
 from bamboo.board cimport PURE_BOARD_SIZE, BOARD_MAX, PURE_BOARD_MAX, S_EMPTY, S_BLACK, S_WHITE, S_OB, PASS, STRING_EMPTY_END
 from bamboo.board cimport FLIP_COLOR, POS, Y, DIS, NORTH, WEST, EAST, SOUTH
-from bamboo.board cimport game_state_t, rollout_feature_t, pure_board_max
+from bamboo.board cimport game_state_t, rollout_feature_t, string_t, board_int_t, rollout_prob_t, pure_board_max
+from bamboo.board cimport MAX_STRING, UPDATED_STRING_MAX, ROLLOUT_FENWICK_TOP
 from bamboo.board cimport board_size, onboard_index, onboard_pos, board_x, board_y, move_dis, liberty_end
 from bamboo.board cimport neighbor4_pos, neighbor8_pos, neighbor8_seq_pos
-from bamboo.board cimport is_legal, is_legal_not_eye
+from bamboo.board cimport is_legal, is_legal_not_eye, next_link
 
 from bamboo.nakade cimport NOT_NAKADE, get_nakade_index, get_nakade_id, get_nakade_pos
-from bamboo.local_pattern cimport x33_hash, x33_hashmap
-from bamboo.local_pattern cimport d12_rsp_hash, d12_rspos_hash, d12_pos_mt, d12_rsp_hashmap
-from bamboo.local_pattern cimport d12_hash, d12_hashmap
+from bamboo.local_pattern cimport x33_hash, x33_table
+from bamboo.local_pattern cimport d12_rsp_hash, d12_rspos_hash, d12_pos_mt, d12_rsp_table
+from bamboo.local_pattern cimport d12_hash, d12_table
+from bamboo.local_pattern cimport lookup_pattern_table
+
+
+cdef double rollout_weights_buffer[100001]
+cdef double tree_weights_buffer[100001]
+cdef double rollout_exp_weights_buffer[100001]
+cdef double tree_exp_weights_buffer[100001]
+
+# leading zero makes index -1 of empty feature add nothing, so sum of weights needs no branch
+rollout_weights = &rollout_weights_buffer[1]
+tree_weights = &tree_weights_buffer[1]
+
+# exp(sum of weights) is computed as product of exp of weights, with leading one for index -1
+rollout_exp_weights = &rollout_exp_weights_buffer[1]
+tree_exp_weights = &tree_exp_weights_buffer[1]
+
+
+cdef void initialize_exp_weights():
+    cdef int i
+
+    # exp of zero weights before parameters are set
+    for i in range(100001):
+        rollout_exp_weights_buffer[i] = 1.0
+        tree_exp_weights_buffer[i] = 1.0
+
+
+initialize_exp_weights()
 
 
 cpdef void initialize_rollout_const(int nakade_feature_size,
@@ -99,15 +126,14 @@ cdef void initialize_planes(game_state_t *game) nogil:
 
 
 cdef void initialize_probs(game_state_t *game) nogil:
-    cdef int i, j, k
+    cdef int i, j
 
     for i in range(S_OB):
         game.rollout_logits_sum[i] = .0
         for j in range(PURE_BOARD_MAX):
-            game.rollout_probs[i][j] = .0
             game.rollout_logits[i][j] = .0
-        for k in range(PURE_BOARD_SIZE):
-            game.rollout_row_probs[i][k] = .0
+        for j in range(PURE_BOARD_MAX + 1):
+            game.rollout_logits_fenwick[i][j] = .0
 
 
 cdef void update_rollout(game_state_t *game) nogil:
@@ -121,7 +147,8 @@ cdef void update_planes(game_state_t *game) nogil:
     cdef int prev_pos, prev_color
     cdef int prev2_pos
     cdef int updated_string_num
-    cdef int *updated_string_id
+    cdef board_int_t *updated_string_id
+    cdef bint updated_string_overflow
     cdef string_t *updated_string
     cdef int update_pos
     cdef int i
@@ -157,14 +184,18 @@ cdef void update_planes(game_state_t *game) nogil:
 
     updated_string_num = game.updated_string_num[current_color]
     updated_string_id = game.updated_string_id[current_color]
+    # memo is bounded. when it overflowed, every string is updated
+    updated_string_overflow = updated_string_num > UPDATED_STRING_MAX
+    if updated_string_overflow:
+        updated_string_num = MAX_STRING
     for i in range(updated_string_num):
-        updated_string = &game.string[updated_string_id[i]]
+        updated_string = &game.string[i if updated_string_overflow else updated_string_id[i]]
         if updated_string.flag:
             update_save_atari(current_feature, game, updated_string)
-            update_pos = updated_string.empty[0]
+            update_pos = next_link(updated_string.empty, 0)
             while update_pos != STRING_EMPTY_END:
                 update_3x3(current_feature, game, update_pos, current_color)
-                update_pos = updated_string.empty[update_pos]
+                update_pos = next_link(updated_string.empty, update_pos)
 
     # clear updated string memo for next feature calculation
     clear_updated_string_cache(game)
@@ -184,7 +215,7 @@ cdef void update_save_atari(rollout_feature_t *feature, game_state_t *game, stri
 
     libs_after_move = 0
     if string.libs == 1 and string.color == game.current_color:
-        last_lib = string.lib[0]
+        last_lib = next_link(string.lib, 0)
         for i in range(4):
             neighbor_pos = neighbor4_pos[last_lib][i]
             neighbor_string = &game.string[game.string_id[neighbor_pos]]
@@ -229,7 +260,7 @@ cdef void update_neighbor(rollout_feature_t *feature, game_state_t *game, int po
 
 cdef void update_nakade(rollout_feature_t *feature, game_state_t *game, int prev_color) nogil:
     cdef int capture_num
-    cdef int *capture_pos
+    cdef board_int_t *capture_pos
     cdef int nakade_index, nakade_id, nakade_pos, nakade_pure_pos
 
     global nakade_start
@@ -262,7 +293,7 @@ cdef void update_d12_rsp(rollout_feature_t *feature, game_state_t *game, int pre
     cdef int n_empty_val = 0
     cdef int *n_empty = &n_empty_val
     cdef unsigned long long hash, positional_hash
-    cdef int pax_ix
+    cdef int pat_id, pat_ix
     cdef int empty_onboard_ix
 
     global response_start, d12_rsp_start
@@ -280,11 +311,12 @@ cdef void update_d12_rsp(rollout_feature_t *feature, game_state_t *game, int pre
         for i in range(n_empty_val):
             positional_hash = hash ^ d12_pos_mt[1 << empty_ix[i]] 
             each_empty_pos = empty_pos[i]
-            if d12_rsp_hashmap.find(positional_hash) == d12_rsp_hashmap.end():
+            pat_id = lookup_pattern_table(&d12_rsp_table, positional_hash)
+            if pat_id == -1:
                 feature.tensor[F_RESPONSE][each_empty_pos] = -1 
                 feature.tensor[F_D12_RSP_PAT][each_empty_pos] = -1
             else:
-                pat_ix = d12_rsp_start + d12_rsp_hashmap[positional_hash]
+                pat_ix = d12_rsp_start + pat_id
                 # set response(?) and response pattern
                 feature.tensor[F_RESPONSE][each_empty_pos] = response_start
                 feature.tensor[F_D12_RSP_PAT][each_empty_pos] = pat_ix
@@ -295,13 +327,14 @@ cdef void update_d12_rsp(rollout_feature_t *feature, game_state_t *game, int pre
             memorize_updated(feature, each_empty_pos)
     else:
         hash = d12_rsp_hash(game, prev_pos, prev_color, empty_ix, empty_pos, n_empty)
+        pat_id = lookup_pattern_table(&d12_rsp_table, hash)
         for i in range(n_empty_val):
             each_empty_pos = empty_pos[i]
-            if d12_rsp_hashmap.find(hash) == d12_rsp_hashmap.end():
+            if pat_id == -1:
                 feature.tensor[F_RESPONSE][each_empty_pos] = -1 
                 feature.tensor[F_D12_RSP_PAT][each_empty_pos] = -1
             else:
-                pat_ix = d12_rsp_start + d12_rsp_hashmap[hash]
+                pat_ix = d12_rsp_start + pat_id
                 # set response(?) and response pattern
                 feature.tensor[F_RESPONSE][each_empty_pos] = response_start
                 feature.tensor[F_D12_RSP_PAT][each_empty_pos] = pat_ix
@@ -316,15 +349,16 @@ cdef void update_3x3(rollout_feature_t *feature, game_state_t *game, int pos, in
     """ Move matches 3 × 3 pattern around move
     """
     cdef unsigned long long hash
-    cdef int pat_ix
+    cdef int pat_id, pat_ix
 
     global x33_start
 
     hash = x33_hash(game, pos, color)
-    if x33_hashmap.find(hash) == x33_hashmap.end():
+    pat_id = lookup_pattern_table(&x33_table, hash)
+    if pat_id == -1:
         feature.tensor[F_X33_PAT][pos] = -1
     else:
-        pat_ix = x33_start + x33_hashmap[hash]
+        pat_ix = x33_start + pat_id
         feature.tensor[F_X33_PAT][pos] = pat_ix
 
     memorize_updated(feature, pos)
@@ -392,6 +426,7 @@ cpdef void set_rollout_parameter(object weights_hdf5):
     W = weights_data['W']
     for i in range(W.shape[0]):
         rollout_weights[i] = W[i]
+        rollout_exp_weights[i] = cexp(rollout_weights[i])
 
 
 cpdef void set_tree_parameter(object weights_hdf5):
@@ -403,37 +438,38 @@ cpdef void set_tree_parameter(object weights_hdf5):
     W = weights_data['W']
     for i in range(W.shape[0]):
         tree_weights[i] = W[i]
+        tree_exp_weights[i] = cexp(tree_weights[i])
 
 
 cdef void update_probs(game_state_t *game) nogil:
     cdef int color
     cdef rollout_feature_t *feature
-    cdef double *probs
-    cdef double *row_probs
-    cdef double *logits
+    cdef rollout_prob_t *logits
+    cdef rollout_prob_t *fenwick
     cdef int pos, tmp_pos
-    cdef int pure_pos, pure_row
+    cdef int pure_pos
+    cdef double logit
     cdef double updated_sum = .0
     cdef double updated_old_sum = .0
     cdef int i, j
 
     color = <int>game.current_color
     feature = &game.rollout_feature_planes[color]
-    probs = game.rollout_probs[color]
-    row_probs = game.rollout_row_probs[color]
     logits = game.rollout_logits[color]
+    fenwick = game.rollout_logits_fenwick[color]
 
     pos = feature.updated[0]
     while pos != BOARD_MAX:
         pure_pos = onboard_index[pos]
-        updated_old_sum += logits[pure_pos]
-        logits[pure_pos] = .0
+        logit = .0
         if is_legal(game, pos, color):
+            logit = 1.0
             for j in range(6):
-                if feature.tensor[j][pos] != -1:
-                    logits[pure_pos] += rollout_weights[feature.tensor[j][pos]]
-            logits[pure_pos] = cexp(logits[pure_pos])
-            updated_sum += logits[pure_pos]
+                logit *= rollout_exp_weights[feature.tensor[j][pos]]
+        updated_old_sum += logits[pure_pos]
+        updated_sum += logit
+        add_logits_fenwick(fenwick, pure_pos, logit - logits[pure_pos])
+        logits[pure_pos] = logit
         # Must be cleared for next feature calculation
         tmp_pos = feature.updated[pos]
         feature.updated[pos] = 0
@@ -441,108 +477,165 @@ cdef void update_probs(game_state_t *game) nogil:
 
     game.rollout_logits_sum[color] = game.rollout_logits_sum[color] - updated_old_sum + updated_sum
 
-    if game.rollout_logits_sum[color] > .0:
-        norm_probs(probs, row_probs, logits, game.rollout_logits_sum[color])
-
 
 cdef void update_all_probs(game_state_t *game) nogil:
     cdef int color
     cdef rollout_feature_t *feature
-    cdef int pos
-    cdef double *probs
-    cdef double *row_probs
-    cdef double *logits
-    cdef int i
+    cdef int *plane
+    cdef rollout_prob_t *logits
+    cdef bint legal[361]
+    cdef int i, j
 
     color = <int>game.current_color
     feature = &game.rollout_feature_planes[color]
-    probs = game.rollout_probs[color]
-    row_probs = game.rollout_row_probs[color]
     logits = game.rollout_logits[color]
 
+    for i in range(PURE_BOARD_MAX):
+        legal[i] = is_legal(game, onboard_pos[i], color)
+        logits[i] = 1.0
+
+    for j in range(6):
+        plane = feature.tensor[j]
+        for i in range(PURE_BOARD_MAX):
+            logits[i] *= rollout_exp_weights[plane[onboard_pos[i]]]
+
     game.rollout_logits_sum[color] = .0
     for i in range(PURE_BOARD_MAX):
-        logits[i] = .0
-        pos = onboard_pos[i]
-        if is_legal(game, pos, color):
-            for j in range(6):
-                if feature.tensor[j][pos] != -1:
-                    logits[i] += rollout_weights[feature.tensor[j][pos]]
-            logits[i] = cexp(logits[i])
-            game.rollout_logits_sum[color] += logits[i]
+        if not legal[i]:
+            logits[i] = .0
+        game.rollout_logits_sum[color] += logits[i]
 
-    if game.rollout_logits_sum[color] > .0:
-        norm_probs(probs, row_probs, logits, game.rollout_logits_sum[color])
+    build_logits_fenwick(game.rollout_logits_fenwick[color], logits)
 
 
-cdef void norm_probs(double *probs, double *row_probs, double *logits, double logits_sum) nogil:
-    cdef int pure_row
-    cdef int i
+cdef void build_logits_fenwick(rollout_prob_t *fenwick, rollout_prob_t *logits) nogil:
+    """ Build Fenwick tree of unnormalized logits in O(n).
+    """
+    cdef int i, parent
 
+    fenwick[0] = .0
     for i in range(PURE_BOARD_MAX):
-        pure_row = Y(i, PURE_BOARD_SIZE)
-        row_probs[pure_row] -= probs[i]
-        probs[i] = logits[i]/logits_sum
-        row_probs[pure_row] += probs[i]
+        fenwick[i+1] = logits[i]
+
+    for i in range(1, PURE_BOARD_MAX + 1):
+        parent = i + (i & -i)
+        if parent <= PURE_BOARD_MAX:
+            fenwick[parent] += fenwick[i]
+
+
+cdef void add_logits_fenwick(rollout_prob_t *fenwick, int pure_pos, double delta) nogil:
+    cdef int i = pure_pos + 1
+
+    while i <= PURE_BOARD_MAX:
+        fenwick[i] += delta
+        i += i & -i
+
+
+cdef int search_logits_fenwick(rollout_prob_t *fenwick, rollout_prob_t *logits, double value) nogil:
+    """ Return the point where cumulative logits exceed value, or -1 if there is no legal point.
+    """
+    cdef int pos = 0
+    cdef int step = ROLLOUT_FENWICK_TOP
+    cdef int i
+
+    while step > 0:
+        if pos + step <= PURE_BOARD_MAX and fenwick[pos + step] <= value:
+            pos += step
+            value -= fenwick[pos]
+        step >>= 1
+
+    if pos < PURE_BOARD_MAX and logits[pos] > .0:
+        return pos
+
+    # Rounding error of the running sums may point at illegal point. Take the nearest legal one
+    for i in range(min(pos, PURE_BOARD_MAX - 1), -1, -1):
+        if logits[i] > .0:
+            return i
+    for i in range(pos, PURE_BOARD_MAX):
+        if logits[i] > .0:
+            return i
+    return -1
 
 
 cdef void set_illegal(game_state_t *game, int pos) nogil:
     cdef int color
-    cdef rollout_feature_t *feature
-    cdef double *probs
-    cdef double *row_probs
-    cdef double *logits
+    cdef rollout_prob_t *logits
     cdef int pure_pos
-    cdef int i, j
 
     color = <int>game.current_color
-    probs = game.rollout_probs[color]
-    row_probs = game.rollout_row_probs[color]
     logits = game.rollout_logits[color]
 
     pure_pos = onboard_index[pos]
     game.rollout_logits_sum[color] -= logits[pure_pos]
+    add_logits_fenwick(game.rollout_logits_fenwick[color], pure_pos, -logits[pure_pos])
     logits[pure_pos] = .0
 
-    norm_probs(probs, row_probs, logits, game.rollout_logits_sum[color])
 
+cdef inline unsigned long long rotl(unsigned long long x, int k) nogil:
+    return (x << k) | (x >> (64 - k))
+
+
+cdef void seed_rollout_rng(rollout_rng_t *rng, unsigned long long seed) nogil:
+    """ Fill xoshiro256** state from seed by splitmix64.
+    """
+    cdef unsigned long long z
+    cdef int i
+
+    for i in range(4):
+        seed += 0x9e3779b97f4a7c15ULL
+        z = seed
+        z = (z ^ (z >> 30)) * 0xbf58476d1ce4e5b9ULL
+        z = (z ^ (z >> 27)) * 0x94d049bb133111ebULL
+        rng.s[i] = z ^ (z >> 31)
+
+
+cdef double rollout_rng_uniform(rollout_rng_t *rng) nogil:
+    """ Return uniform random number in [0, 1) and advance xoshiro256** state.
+    """
+    cdef unsigned long long *s = rng.s
+    cdef unsigned long long result = rotl(s[1] * 5, 7) * 9
+    cdef unsigned long long t = s[1] << 17
+
+    s[2] ^= s[0]
+    s[3] ^= s[1]
+    s[1] ^= s[2]
+    s[0] ^= s[3]
+    s[2] ^= t
+    s[3] = rotl(s[3], 45)
+
+    return (result >> 11) * (1.0 / 9007199254740992.0)
 
-cdef int choice_rollout_move(game_state_t *game) nogil:
+
+cdef int choice_rollout_move(game_state_t *game, rollout_rng_t *rng) nogil:
     cdef int color
-    cdef double *probs
-    cdef double *row_probs
     cdef double random_number
-    cdef int row, pos
+    cdef int pure_pos
 
     color = <int>game.current_color
-    probs = game.rollout_probs[color]
-    row_probs = game.rollout_row_probs[color]
 
     if game.rollout_logits_sum[color] <= .001:
         return PASS
 
-    random_number = <double>rand() / RAND_MAX
-    row = 0
-    while random_number > row_probs[row]:
-        random_number -= row_probs[row]
-        row += 1
-
-    pos = row * PURE_BOARD_SIZE
-    while True:
-        random_number -= probs[pos]
-        if random_number <= 0:
-            break
-        pos += 1
+    random_number = rollout_rng_uniform(rng) * game.rollout_logits_sum[color]
+    pure_pos = search_logits_fenwick(game.rollout_logits_fenwick[color],
+                                     game.rollout_logits[color],
+                                     random_number)
+    if pure_pos < 0:
+        return PASS
 
-    return onboard_pos[pos]
+    return onboard_pos[pure_pos]
 
 
 cdef void get_rollout_probs(game_state_t *game, double *probs) nogil:
     cdef int i
     cdef int color = <int>game.current_color
+    cdef double logits_sum = game.rollout_logits_sum[color]
 
     for i in range(PURE_BOARD_MAX):
-        probs[i] = game.rollout_probs[color][i]
+        if logits_sum > .0:
+            probs[i] = game.rollout_logits[color][i]/logits_sum
+        else:
+            probs[i] = .0
 
 
 cdef void update_tree_planes_all(game_state_t *game) nogil:
@@ -567,25 +660,34 @@ cdef void update_tree_planes_all(game_state_t *game) nogil:
 
 
 cdef void get_tree_probs(game_state_t *game, double probs[361]) nogil:
+    """ Softmax of tree policy over legal points. Legality and product of exp of weights are
+    done in separate passes over all points, and weights are gathered plane by plane.
+    """
     cdef int color
     cdef rollout_feature_t *feature
+    cdef int *plane
     cdef double logits[361]
+    cdef bint legal[361]
     cdef double logits_sum
-    cdef int i
+    cdef int i, j
 
     color = <int>game.current_color
     feature = &game.rollout_feature_planes[color]
-    logits_sum = .0
 
     for i in range(PURE_BOARD_MAX):
-        logits[i] = .0
-        pos = onboard_pos[i]
-        if is_legal_not_eye(game, pos, color):
-            for j in range(9):
-                if feature.tensor[j][pos] != -1:
-                    logits[i] += tree_weights[feature.tensor[j][pos]]
-            logits[i] = cexp(logits[i])
-            logits_sum += logits[i]
+        legal[i] = is_legal_not_eye(game, onboard_pos[i], color)
+        logits[i] = 1.0
+
+    for j in range(9):
+        plane = feature.tensor[j]
+        for i in range(PURE_BOARD_MAX):
+            logits[i] *= tree_exp_weights[plane[onboard_pos[i]]]
+
+    logits_sum = .0
+    for i in range(PURE_BOARD_MAX):
+        if not legal[i]:
+            logits[i] = .0
+        logits_sum += logits[i]
 
     for i in range(PURE_BOARD_MAX):
         probs[i] = logits[i]/logits_sum
@@ -594,7 +696,7 @@ cdef void get_tree_probs(game_state_t *game, double probs[361]) nogil:
 cdef void update_self_atari(rollout_feature_t *feature, game_state_t *game, int pos, int color) nogil:
     cdef char *board = game.board
     cdef string_t *string = game.string
-    cdef int *string_id = game.string_id
+    cdef board_int_t *string_id = game.string_id
     cdef int other = FLIP_COLOR(color)
     cdef int already[4]
     cdef int already_num = 0
@@ -637,7 +739,7 @@ cdef void update_self_atari(rollout_feature_t *feature, game_state_t *game, int
         if string[id].libs > 2:
             feature.tensor[F_SELF_ATARI][pos] = -1
             return
-        lib = string[id].lib[0]
+        lib = next_link(string[id].lib, 0)
         count = 0
         while lib != liberty_end:
             if lib != pos:
@@ -649,7 +751,7 @@ cdef void update_self_atari(rollout_feature_t *feature, game_state_t *game, int
                 if not checked:
                     lib_candidate[libs + count] = lib
                     count += 1
-            lib = string[id].lib[lib]
+            lib = next_link(string[id].lib, lib)
         libs += count
         already[already_num] = id
         already_num += 1
@@ -667,7 +769,7 @@ cdef void update_self_atari(rollout_feature_t *feature, game_state_t *game, int
             if string[id].libs > 2:
                 feature.tensor[F_SELF_ATARI][pos] = -1
                 return
-            lib = string[id].lib[0]
+            lib = next_link(string[id].lib, 0)
             count = 0
             while lib != liberty_end:
                 if lib != pos:
@@ -679,7 +781,7 @@ cdef void update_self_atari(rollout_feature_t *feature, game_state_t *game, int
                     if not checked:
                         lib_candidate[libs + count] = lib
                         count += 1
-                lib = string[id].lib[lib]
+                lib = next_link(string[id].lib, lib)
             libs += count
             already[already_num] = id
             already_num += 1
@@ -697,7 +799,7 @@ cdef void update_self_atari(rollout_feature_t *feature, game_state_t *game, int
             if string[id].libs > 2:
                 feature.tensor[F_SELF_ATARI][pos] = -1
                 return
-            lib = string[id].lib[0]
+            lib = next_link(string[id].lib, 0)
             count = 0
             while lib != liberty_end:
                 if lib != pos:
@@ -709,7 +811,7 @@ cdef void update_self_atari(rollout_feature_t *feature, game_state_t *game, int
                     if not checked:
                         lib_candidate[libs + count] = lib
                         count += 1
-                lib = string[id].lib[lib]
+                lib = next_link(string[id].lib, lib)
             libs += count
             already[already_num] = id
             already_num += 1
@@ -727,7 +829,7 @@ cdef void update_self_atari(rollout_feature_t *feature, game_state_t *game, int
             if string[id].libs > 2:
                 feature.tensor[F_SELF_ATARI][pos] = -1
                 return
-            lib = string[id].lib[0]
+            lib = next_link(string[id].lib, 0)
             count = 0
             while lib != liberty_end:
                 if lib != pos:
@@ -739,7 +841,7 @@ cdef void update_self_atari(rollout_feature_t *feature, game_state_t *game, int
                     if not checked:
                         lib_candidate[libs + count] = lib
                         count += 1
-                lib = string[id].lib[lib]
+                lib = next_link(string[id].lib, lib)
             libs += count
             already[already_num] = id
             already_num += 1
@@ -778,15 +880,16 @@ cdef void update_d12(rollout_feature_t *feature, game_state_t *game, int pos, in
     """ Move matches 12-point diamond pattern centred around move 
     """
     cdef unsigned long long hash
-    cdef int pat_ix
+    cdef int pat_id, pat_ix
 
     global d12_start
 
     hash = d12_hash(game, pos, color)
-    if d12_hashmap.find(hash) == d12_hashmap.end():
+    pat_id = lookup_pattern_table(&d12_table, hash)
+    if pat_id == -1:
         feature.tensor[F_D12_PAT][pos] = -1
     else:
-        pat_ix = d12_start + d12_hashmap[hash]
+        pat_ix = d12_start + pat_id
         feature.tensor[F_D12_PAT][pos] = pat_ix
 
 
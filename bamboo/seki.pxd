@@ -1,3 +1,3 @@
-from bamboo.board cimport game_state_t
+from bamboo.board cimport game_state_t, board_int_t
 
-cdef void check_seki(game_state_t *game, int *seki) nogil
+cdef void check_seki(game_state_t *game, board_int_t *seki) nogil
@@ -11,19 +11,19 @@ from libc.stdio cimport printf
 from bamboo.board cimport S_EMPTY, S_BLACK, S_WHITE, BOARD_MAX, PURE_BOARD_MAX, MAX_STRING, E_NOT_EYE
 from bamboo.board cimport FLIP_COLOR, NORTH, WEST, EAST, SOUTH
 from bamboo.board cimport onboard_pos, eye_condition, pure_board_max, board_size, liberty_end, string_end
-from bamboo.board cimport game_state_t, string_t
+from bamboo.board cimport game_state_t, string_t, board_int_t, next_link
 from bamboo.board cimport is_true_eye, fill_n_int, fill_n_bint
 from bamboo.pattern cimport pat3, print_input_pat3
 
 
-cdef void check_seki(game_state_t *game, int *seki) nogil:
+cdef void check_seki(game_state_t *game, board_int_t *seki) nogil:
     cdef int i
     cdef string_t *string = game.string
     cdef bint seki_candidate[529]
     cdef int lib1, lib2
     cdef int string_pos
 
-    fill_n_int(seki, BOARD_MAX, 0)
+    memset(seki, 0, sizeof(board_int_t) * BOARD_MAX)
     fill_n_bint(seki_candidate, BOARD_MAX, 0)
 
     for i in range(pure_board_max):
@@ -36,8 +36,8 @@ cdef void check_seki(game_state_t *game, int *seki) nogil:
         if string[i].flag == False or string[i].libs != 2:
             continue
 
-        lib1 = string[i].lib[0]
-        lib2 = string[i].lib[lib1]
+        lib1 = next_link(string[i].lib, 0)
+        lib2 = next_link(string[i].lib, lib1)
 
         if seki_candidate[lib1] and seki_candidate[lib2]: 
             seki[lib1] = seki[lib2] = 1 
@@ -58,7 +58,7 @@ cdef void check_seki(game_state_t *game, int *seki) nogil:
 cdef bint is_self_atari(game_state_t *game, int pos, int color) nogil:
     cdef char *board = game.board
     cdef string_t *string = game.string
-    cdef int *string_id = game.string_id
+    cdef board_int_t *string_id = game.string_id
     cdef int other = FLIP_COLOR(color)
     cdef int already[4]
     cdef int already_num = 0
@@ -97,7 +97,7 @@ cdef bint is_self_atari(game_state_t *game, int pos, int color) nogil:
         id = string_id[north]
         if string[id].libs > 2:
             return False
-        lib = string[id].lib[0]
+        lib = next_link(string[id].lib, 0)
         count = 0
         while lib != liberty_end:
             if lib != pos:
@@ -109,7 +109,7 @@ cdef bint is_self_atari(game_state_t *game, int pos, int color) nogil:
                 if not checked:
                     lib_candidate[libs + count] = lib
                     count += 1
-            lib = string[id].lib[lib]
+            lib = next_link(string[id].lib, lib)
         libs += count
         already[already_num] = id
         already_num += 1
@@ -124,7 +124,7 @@ cdef bint is_self_atari(game_state_t *game, int pos, int color) nogil:
         if already[0] != id:
             if string[id].libs > 2:
                 return False
-            lib = string[id].lib[0]
+            lib = next_link(string[id].lib, 0)
             count = 0
             while lib != liberty_end:
                 if lib != pos:
@@ -136,7 +136,7 @@ cdef bint is_self_atari(game_state_t *game, int pos, int color) nogil:
                     if not checked:
                         lib_candidate[libs + count] = lib
                         count += 1
-                lib = string[id].lib[lib]
+                lib = next_link(string[id].lib, lib)
             libs += count
             already[already_num] = id
             already_num += 1
@@ -151,7 +151,7 @@ cdef bint is_self_atari(game_state_t *game, int pos, int color) nogil:
         if already[0] != id and already[1] != id:
             if string[id].libs > 2:
                 return False
-            lib = string[id].lib[0]
+            lib = next_link(string[id].lib, 0)
             count = 0
             while lib != liberty_end:
                 if lib != pos:
@@ -163,7 +163,7 @@ cdef bint is_self_atari(game_state_t *game, int pos, int color) nogil:
                     if not checked:
                         lib_candidate[libs + count] = lib
                         count += 1
-                lib = string[id].lib[lib]
+                lib = next_link(string[id].lib, lib)
             libs += count
             already[already_num] = id
             already_num += 1
@@ -178,7 +178,7 @@ cdef bint is_self_atari(game_state_t *game, int pos, int color) nogil:
         if already[0] != id and already[1] != id and already[2] != id:
             if string[id].libs > 2:
                 return False
-            lib = string[id].lib[0]
+            lib = next_link(string[id].lib, 0)
             count = 0
             while lib != liberty_end:
                 if lib != pos:
@@ -190,7 +190,7 @@ cdef bint is_self_atari(game_state_t *game, int pos, int color) nogil:
                     if not checked:
                         lib_candidate[libs + count] = lib
                         count += 1
-                lib = string[id].lib[lib]
+                lib = next_link(string[id].lib, lib)
             libs += count
             already[already_num] = id
             already_num += 1
@@ -28,7 +28,7 @@ from .printer cimport print_board, print_PN
 
 from . cimport policy_feature as pf
 from .policy_feature cimport PolicyFeature
-from .policy_feature cimport MAX_POLICY_PLANES
+from .policy_feature cimport MAX_POLICY_PLANES, PLANES_NHWC
 
 from .player cimport PolicyPlayer
 
@@ -37,14 +37,11 @@ from .sgf_util cimport save_gamestate_to_sgf
 ctypedef np.int32_t INT_t
 
 
-cdef np.ndarray[INT_t, ndim=4] state_to_tensor(PolicyFeature policy_feature, game_state_t *game):
+cdef np.ndarray[INT_t, ndim=4] states_to_tensor(PolicyFeature policy_feature, game_state_t **games, int n_games):
     cdef np.ndarray[INT_t, ndim=4] state_tensor
 
-    pf.update(policy_feature, game)
-
-    state_tensor = np.asarray(policy_feature.planes) \
-        .reshape((1, MAX_POLICY_PLANES, PURE_BOARD_SIZE, PURE_BOARD_SIZE))
-    state_tensor = np.transpose(state_tensor, (0, 2, 3, 1)) 
+    state_tensor = np.empty((n_games, PURE_BOARD_SIZE, PURE_BOARD_SIZE, MAX_POLICY_PLANES), dtype=np.int32)
+    pf.update_batch(policy_feature, games, n_games, state_tensor, PLANES_NHWC)
 
     return state_tensor
 
@@ -55,16 +52,19 @@ cpdef run_n_games(object player_pn,
                   int move_limit=361,
                   double temperature=0.67,
                   bint greedy=0,
-                  int verbose=0):
+                  int verbose=0,
+                  int feature_threads=1):
     cdef int i, j
     cdef game_state_t *games, *game
+    cdef game_state_t **batch_games
+    cdef int n_batch
     cdef bint legal
     cdef int pos, ob_pos
     cdef double score
     cdef PolicyPlayer player, opponent, current, other
     cdef np.ndarray[INT_t, ndim=4] state_tensor
+    cdef np.ndarray[INT_t, ndim=4] state_batch
     cdef PolicyFeature policy_feature
-    cdef list states = []
     cdef list masks = []
     cdef int[:] moves
     cdef int[:] games_in_play = np.ones(n_games, dtype=np.int32)
@@ -81,8 +81,11 @@ cpdef run_n_games(object player_pn,
     for i in range(n_games):
         initialize_board(&games[i])
 
+    batch_games = <game_state_t **>malloc(n_games * sizeof(game_state_t *))
+
     feature = pf.allocate_feature(MAX_POLICY_PLANES)
     pf.initialize_feature(feature)
+    pf.initialize_batch(feature, feature_threads)
 
     # Create one list of features (aka state tensors) and one of moves for each game being played.
     state_tensors = [[] for _ in range(n_games)]
@@ -99,13 +102,12 @@ cpdef run_n_games(object player_pn,
     
     # Start all odd games with moves by 'opponent' because First current player is learner.
     if n_games > 1:
-        states = []
+        n_batch = 0
         for i in range(1, n_games, 2):
-            game = &games[i]
-            state_tensor = state_to_tensor(feature, game)
-            states.append(state_tensor)
+            batch_games[n_batch] = &games[i]
+            n_batch += 1
         
-        moves = opponent.genmove(np.vstack(states))
+        moves = opponent.genmove(states_to_tensor(feature, batch_games, n_batch))
 
         for j, i in enumerate(range(1, n_games, 2)):
             game = &games[i]
@@ -117,32 +119,33 @@ cpdef run_n_games(object player_pn,
     current, other = player, opponent
 
     while n_games_in_play > 0:
-        del states[:]
         del i_games_in_play[:]
         del masks[:]
+        n_batch = 0
         for i in range(n_games):
             if games_in_play[i]:
                 i_games_in_play.append(i)
                 game = &games[i]
-                state_tensor = state_to_tensor(feature, game)
-                states.append(state_tensor)
+                batch_games[n_batch] = game
+                n_batch += 1
 
                 legal_moves_mask = get_legal_moves_mask(game, game.current_color)
                 masks.append(legal_moves_mask)
 
         legal_moves_masks = np.vstack(masks)
-        moves = current.gen_masked_move(np.vstack(states), legal_moves_masks)
+        state_batch = states_to_tensor(feature, batch_games, n_batch)
+        moves = current.gen_masked_move(state_batch, legal_moves_masks)
 
-        #moves = current.genmove(np.vstack(states))
+        #moves = current.genmove(state_batch)
 
-        assert len(states) == len(moves) == n_games_in_play
+        assert len(state_batch) == len(moves) == n_games_in_play
 
         for j in range(n_games_in_play):
             i = i_games_in_play[j]
             pos = moves[j]
             ob_pos = onboard_pos[pos]
             game = &games[i]
-            state_tensor = states[j]
+            state_tensor = state_batch[j:j+1]
 
             #if pos == PASS or pos == RESIGN:
             #    print(gtp.gtp_vertex(pos))
@@ -187,6 +190,7 @@ cpdef run_n_games(object player_pn,
 
             current, other = other, current
 
+    free(batch_games)
     free_game(games)
 
     win_ratio = sum(learner_won) / n_games
@@ -1,4 +1,5 @@
-from libc.stdlib cimport malloc, free
+from libc.stdlib cimport malloc, free, rand, srand
+from libc.string cimport memcmp
 
 from . cimport board 
 from . cimport printer
@@ -59,19 +60,19 @@ def test_add_liberty_to_isolated_one():
     neighbor4 = board.neighbor4_pos[origin]
 
     board.add_liberty(string, neighbor4[0], 0)
-    assert (string.lib[0] == neighbor4[0])
+    assert (board.next_link(string.lib, 0) == neighbor4[0])
     assert (string.libs == 1)
 
     board.add_liberty(string, neighbor4[1], neighbor4[0])
-    assert (string.lib[neighbor4[0]] == neighbor4[1])
+    assert (board.next_link(string.lib, neighbor4[0]) == neighbor4[1])
     assert (string.libs == 2)
 
     board.add_liberty(string, neighbor4[2], neighbor4[1])
-    assert (string.lib[neighbor4[1]] == neighbor4[2])
+    assert (board.next_link(string.lib, neighbor4[1]) == neighbor4[2])
     assert (string.libs == 3)
 
     board.add_liberty(string, neighbor4[3], neighbor4[2])
-    assert (string.lib[neighbor4[2]] == neighbor4[3])
+    assert (board.next_link(string.lib, neighbor4[2]) == neighbor4[3])
     assert (string.libs == 4)
 
     board.free_game(game)
@@ -95,19 +96,19 @@ def test_remove_liberty_of_isolated_one():
     south = neighbor4[3]
 
     board.remove_liberty(string, north)
-    assert (string.lib[north] == 0)
-    assert (string.lib[0] == west)
+    assert (not board.has_link(string.lib, north))
+    assert (board.next_link(string.lib, 0) == west)
 
     board.remove_liberty(string, west)
-    assert (string.lib[west] == 0)
-    assert (string.lib[0] == east)
+    assert (not board.has_link(string.lib, west))
+    assert (board.next_link(string.lib, 0) == east)
 
     board.remove_liberty(string, east)
-    assert (string.lib[east] == 0)
-    assert (string.lib[0] == south)
+    assert (not board.has_link(string.lib, east))
+    assert (board.next_link(string.lib, 0) == south)
 
     board.remove_liberty(string, south)
-    assert (string.lib[south] == 0)
+    assert (not board.has_link(string.lib, south))
 
     board.free_game(game)
 
@@ -122,11 +123,11 @@ def test_make_string_of_isolated_one():
     board.make_string(game, pos, board.S_BLACK)
     new_string = &game.string[1]
 
-    assert (new_string.lib[0] == pos - board.board_size)
-    assert (new_string.lib[pos - board.board_size] == pos - 1)
-    assert (new_string.lib[pos - 1] == pos + 1)
-    assert (new_string.lib[pos + 1] == pos + board.board_size)
-    assert (new_string.lib[pos + board.board_size] == board.string_lib_max - 1)
+    assert (board.next_link(new_string.lib, 0) == pos - board.board_size)
+    assert (board.next_link(new_string.lib, pos - board.board_size) == pos - 1)
+    assert (board.next_link(new_string.lib, pos - 1) == pos + 1)
+    assert (board.next_link(new_string.lib, pos + 1) == pos + board.board_size)
+    assert (board.next_link(new_string.lib, pos + board.board_size) == board.string_lib_max - 1)
     assert (new_string.libs == 4)
 
     assert (game.string_id[pos] == 1)
@@ -155,16 +156,16 @@ def test_add_neighbor_to_isolated_one():
 
     assert (string_id == 1)
     assert (neighbor_string_id == 2)
-    assert (game.string[1].neighbor[0] == board.NEIGHBOR_END)
-    assert (game.string[2].neighbor[0] == board.NEIGHBOR_END)
+    assert (board.next_link(game.string[1].neighbor, 0) == board.NEIGHBOR_END)
+    assert (board.next_link(game.string[2].neighbor, 0) == board.NEIGHBOR_END)
 
     board.add_neighbor(&game.string[string_id], neighbor_string_id, 0)
     board.add_neighbor(&game.string[neighbor_string_id], string_id, 0)
 
-    assert (game.string[1].neighbor[0] == 2)
-    assert (game.string[1].neighbor[2] == board.NEIGHBOR_END)
-    assert (game.string[2].neighbor[0] == 1)
-    assert (game.string[2].neighbor[1] == board.NEIGHBOR_END)
+    assert (board.next_link(game.string[1].neighbor, 0) == 2)
+    assert (board.next_link(game.string[1].neighbor, 2) == board.NEIGHBOR_END)
+    assert (board.next_link(game.string[2].neighbor, 0) == 1)
+    assert (board.next_link(game.string[2].neighbor, 1) == board.NEIGHBOR_END)
 
     board.free_game(game)
 
@@ -261,11 +262,11 @@ def test_merge_string_two():
     assert (game.string_next[first] == board.string_pos_max - 1)
     assert (game.string_next[second] == board.string_pos_max - 1)
 
-    assert (game.string[1].neighbor[0] == board.NEIGHBOR_END)
-    assert (game.string[2].neighbor[0] == board.NEIGHBOR_END)
+    assert (board.next_link(game.string[1].neighbor, 0) == board.NEIGHBOR_END)
+    assert (board.next_link(game.string[2].neighbor, 0) == board.NEIGHBOR_END)
 
-    assert (game.string[1].lib[first + board.board_size] == board.string_lib_max - 1)
-    assert (game.string[2].lib[second + board.board_size] == board.string_lib_max - 1)
+    assert (board.next_link(game.string[1].lib, first + board.board_size) == board.string_lib_max - 1)
+    assert (board.next_link(game.string[2].lib, second + board.board_size) == board.string_lib_max - 1)
 
     string[0] = &game.string[2]
 
@@ -302,13 +303,13 @@ def test_merge_string_three():
     assert (game.string_next[second] == board.string_pos_max - 1)
     assert (game.string_next[third] == board.string_pos_max - 1)
 
-    assert (game.string[1].neighbor[0] == board.NEIGHBOR_END)
-    assert (game.string[2].neighbor[0] == board.NEIGHBOR_END)
-    assert (game.string[3].neighbor[0] == board.NEIGHBOR_END)
+    assert (board.next_link(game.string[1].neighbor, 0) == board.NEIGHBOR_END)
+    assert (board.next_link(game.string[2].neighbor, 0) == board.NEIGHBOR_END)
+    assert (board.next_link(game.string[3].neighbor, 0) == board.NEIGHBOR_END)
 
-    assert (game.string[1].lib[first + board.board_size] == board.string_lib_max - 1)
-    assert (game.string[2].lib[second + board.board_size] == board.string_lib_max - 1)
-    assert (game.string[3].lib[third + board.board_size] == board.string_lib_max - 1)
+    assert (board.next_link(game.string[1].lib, first + board.board_size) == board.string_lib_max - 1)
+    assert (board.next_link(game.string[2].lib, second + board.board_size) == board.string_lib_max - 1)
+    assert (board.next_link(game.string[3].lib, third + board.board_size) == board.string_lib_max - 1)
 
     string[0] = &game.string[2]
     string[1] = &game.string[3]
@@ -385,79 +386,85 @@ def test_string_add_and_remove_empty():
     board.put_stone(game, a, board.S_BLACK)
     string1 = &game.string[1]
     assert (string1.empties == 8)
-    assert (string1.empty[0] == a-board.board_size)
-    assert (string1.empty[a-board.board_size] == a-1)
-    assert (string1.empty[a-1] == a+1)
-    assert (string1.empty[a+1] == a+board.board_size)
-    assert (string1.empty[a+board.board_size] == a-board.board_size-1)
-    assert (string1.empty[a-board.board_size-1] == a-board.board_size+1)
-    assert (string1.empty[a-board.board_size+1] == a+board.board_size-1)
-    assert (string1.empty[a+board.board_size-1] == a+board.board_size+1)
-    assert (string1.empty[a+board.board_size+1] == STRING_EMPTY_END)
+    assert (sorted(__links_of(string1.empty, STRING_EMPTY_END)) == sorted([
+        a-board.board_size,
+        a-1,
+        a+1,
+        a+board.board_size,
+        a-board.board_size-1,
+        a-board.board_size+1,
+        a+board.board_size-1,
+        a+board.board_size+1,
+    ]))
 
     # put B[b]
     b = moves['b']
     board.put_stone(game, b, board.S_BLACK)
     assert (string1.empties == 10)
-    assert (string1.empty[0] == a-board.board_size)
-    assert (string1.empty[a-board.board_size] == a-1)
-    assert (string1.empty[a-1] == a+1)
-    assert (string1.empty[a+1] == a-board.board_size-1)
-    assert (string1.empty[a-board.board_size-1] == a-board.board_size+1)
-    assert (string1.empty[a-board.board_size+1] == a+board.board_size-1)
-    assert (string1.empty[a+board.board_size-1] == a+board.board_size+1)
-    assert (string1.empty[a+board.board_size+1] == a+board.board_size*2-1)
-    assert (string1.empty[a+board.board_size*2-1] == a+board.board_size*2)
-    assert (string1.empty[a+board.board_size*2] == a+board.board_size*2+1)
-    assert (string1.empty[a+board.board_size*2+1] == STRING_EMPTY_END)
+    assert (sorted(__links_of(string1.empty, STRING_EMPTY_END)) == sorted([
+        a-board.board_size,
+        a-1,
+        a+1,
+        a-board.board_size-1,
+        a-board.board_size+1,
+        a+board.board_size-1,
+        a+board.board_size+1,
+        a+board.board_size*2-1,
+        a+board.board_size*2,
+        a+board.board_size*2+1,
+    ]))
 
     # put W[c]
     c = moves['c']
     board.put_stone(game, c, board.S_WHITE)
     assert (string1.empties == 9)
-    assert (string1.empty[0] == a-board.board_size)
-    assert (string1.empty[a-board.board_size] == a+1)
-    assert (string1.empty[a+1] == a-board.board_size-1)
-    assert (string1.empty[a-board.board_size-1] == a-board.board_size+1)
-    assert (string1.empty[a-board.board_size+1] == a+board.board_size-1)
-    assert (string1.empty[a+board.board_size-1] == a+board.board_size+1)
-    assert (string1.empty[a+board.board_size+1] == a+board.board_size*2-1)
-    assert (string1.empty[a+board.board_size*2-1] == a+board.board_size*2)
-    assert (string1.empty[a+board.board_size*2] == a+board.board_size*2+1)
-    assert (string1.empty[a+board.board_size*2+1] == STRING_EMPTY_END)
+    assert (sorted(__links_of(string1.empty, STRING_EMPTY_END)) == sorted([
+        a-board.board_size,
+        a+1,
+        a-board.board_size-1,
+        a-board.board_size+1,
+        a+board.board_size-1,
+        a+board.board_size+1,
+        a+board.board_size*2-1,
+        a+board.board_size*2,
+        a+board.board_size*2+1,
+    ]))
     string2 = &game.string[2]
     assert (string2.empties == 6)
-    assert (string2.empty[0] == c-board.board_size)
-    assert (string2.empty[c-board.board_size] == c-1)
-    assert (string2.empty[c-1] == c+board.board_size)
-    assert (string2.empty[c+board.board_size] == c-board.board_size-1)
-    assert (string2.empty[c-board.board_size-1] == c-board.board_size+1)
-    assert (string2.empty[c-board.board_size+1] == c+board.board_size-1)
-    assert (string2.empty[c+board.board_size-1] == STRING_EMPTY_END)
+    assert (sorted(__links_of(string2.empty, STRING_EMPTY_END)) == sorted([
+        c-board.board_size,
+        c-1,
+        c+board.board_size,
+        c-board.board_size-1,
+        c-board.board_size+1,
+        c+board.board_size-1,
+    ]))
 
     # put W[d]
     d = moves['d']
     board.put_stone(game, d, board.S_WHITE)
     assert (string1.empties == 8)
-    assert (string1.empty[0] == a-board.board_size)
-    assert (string1.empty[a-board.board_size] == a+1)
-    assert (string1.empty[a+1] == a-board.board_size-1)
-    assert (string1.empty[a-board.board_size-1] == a+board.board_size-1)
-    assert (string1.empty[a+board.board_size-1] == a+board.board_size+1)
-    assert (string1.empty[a+board.board_size+1] == a+board.board_size*2-1)
-    assert (string1.empty[a+board.board_size*2-1] == a+board.board_size*2)
-    assert (string1.empty[a+board.board_size*2] == a+board.board_size*2+1)
-    assert (string1.empty[a+board.board_size*2+1] == STRING_EMPTY_END)
+    assert (sorted(__links_of(string1.empty, STRING_EMPTY_END)) == sorted([
+        a-board.board_size,
+        a+1,
+        a-board.board_size-1,
+        a+board.board_size-1,
+        a+board.board_size+1,
+        a+board.board_size*2-1,
+        a+board.board_size*2,
+        a+board.board_size*2+1,
+    ]))
     string3 = &game.string[3]
     assert (string3.empties == 7)
-    assert (string3.empty[0] == d-board.board_size)
-    assert (string3.empty[d-board.board_size] == d-1)
-    assert (string3.empty[d-1] == d+1)
-    assert (string3.empty[d+1] == d+board.board_size)
-    assert (string3.empty[d+board.board_size] == d-board.board_size-1)
-    assert (string3.empty[d-board.board_size-1] == d-board.board_size+1)
-    assert (string3.empty[d-board.board_size+1] == d+board.board_size+1)
-    assert (string3.empty[d+board.board_size+1] == STRING_EMPTY_END)
+    assert (sorted(__links_of(string3.empty, STRING_EMPTY_END)) == sorted([
+        d-board.board_size,
+        d-1,
+        d+1,
+        d+board.board_size,
+        d-board.board_size-1,
+        d-board.board_size+1,
+        d+board.board_size+1,
+    ]))
 
 
 def test_string_merge_empty():
@@ -476,75 +483,83 @@ def test_string_merge_empty():
     board.put_stone(game, a, board.S_BLACK)
     string1 = &game.string[1]
     assert (string1.empties == 8)
-    assert (string1.empty[0] == a-board.board_size)
-    assert (string1.empty[a-board.board_size] == a-1)
-    assert (string1.empty[a-1] == a+1)
-    assert (string1.empty[a+1] == a+board.board_size)
-    assert (string1.empty[a+board.board_size] == a-board.board_size-1)
-    assert (string1.empty[a-board.board_size-1] == a-board.board_size+1)
-    assert (string1.empty[a-board.board_size+1] == a+board.board_size-1)
-    assert (string1.empty[a+board.board_size-1] == a+board.board_size+1)
-    assert (string1.empty[a+board.board_size+1] == STRING_EMPTY_END)
+    assert (sorted(__links_of(string1.empty, STRING_EMPTY_END)) == sorted([
+        a-board.board_size,
+        a-1,
+        a+1,
+        a+board.board_size,
+        a-board.board_size-1,
+        a-board.board_size+1,
+        a+board.board_size-1,
+        a+board.board_size+1,
+    ]))
 
     # put B[b]
     b = moves['b']
     board.put_stone(game, b, board.S_BLACK)
     string2 = &game.string[2]
     assert (string2.empties == 7)
-    assert (string2.empty[0] == b-board.board_size)
-    assert (string2.empty[b-board.board_size] == b-1)
-    assert (string2.empty[b-1] == b+1)
-    assert (string2.empty[b+1] == b+board.board_size)
-    assert (string2.empty[b+board.board_size] == b-board.board_size-1)
-    assert (string2.empty[b-board.board_size-1] == b+board.board_size-1)
-    assert (string2.empty[b+board.board_size-1] == b+board.board_size+1)
+    assert (sorted(__links_of(string2.empty, STRING_EMPTY_END)) == sorted([
+        b-board.board_size,
+        b-1,
+        b+1,
+        b+board.board_size,
+        b-board.board_size-1,
+        b+board.board_size-1,
+        b+board.board_size+1,
+    ]))
     assert (string1.empties == 7)
-    assert (string1.empty[0] == a-board.board_size)
-    assert (string1.empty[a-board.board_size] == a-1)
-    assert (string1.empty[a-1] == a+1)
-    assert (string1.empty[a+1] == a+board.board_size)
-    assert (string1.empty[a+board.board_size] == a-board.board_size-1)
-    assert (string1.empty[a-board.board_size-1] == a-board.board_size+1)
-    assert (string1.empty[a-board.board_size+1] == a+board.board_size+1)
-    assert (string1.empty[a+board.board_size+1] == STRING_EMPTY_END)
-    assert (string1.empty[a+board.board_size-1] == 0) # removed by 'b'
+    assert (sorted(__links_of(string1.empty, STRING_EMPTY_END)) == sorted([
+        a-board.board_size,
+        a-1,
+        a+1,
+        a+board.board_size,
+        a-board.board_size-1,
+        a-board.board_size+1,
+        a+board.board_size+1,
+    ]))
+    assert (not board.has_link(string1.empty, a+board.board_size-1)) # removed by 'b'
 
     # put B[c]
     c = moves['c']
     board.put_stone(game, c, board.S_BLACK)
     string3 = &game.string[3]
     assert (string3.empties == 7)
-    assert (string3.empty[0] == c-board.board_size)
-    assert (string3.empty[c-board.board_size] == c-1)
-    assert (string3.empty[c-1] == c+1)
-    assert (string3.empty[c+1] == c+board.board_size)
-    assert (string3.empty[c+board.board_size] == c-board.board_size+1)
-    assert (string3.empty[c-board.board_size+1] == c+board.board_size-1)
-    assert (string3.empty[c+board.board_size-1] == c+board.board_size+1)
+    assert (sorted(__links_of(string3.empty, STRING_EMPTY_END)) == sorted([
+        c-board.board_size,
+        c-1,
+        c+1,
+        c+board.board_size,
+        c-board.board_size+1,
+        c+board.board_size-1,
+        c+board.board_size+1,
+    ]))
     assert (string1.empties == 6)
-    assert (string1.empty[0] == a-board.board_size)
-    assert (string1.empty[a-board.board_size] == a-1)
-    assert (string1.empty[a-1] == a+1)
-    assert (string1.empty[a+1] == a+board.board_size)
-    assert (string1.empty[a+board.board_size] == a-board.board_size-1)
-    assert (string1.empty[a-board.board_size-1] == a-board.board_size+1)
-    assert (string1.empty[a-board.board_size+1] == STRING_EMPTY_END)
-    assert (string1.empty[a+board.board_size-1] == 0) # removed by 'c'
+    assert (sorted(__links_of(string1.empty, STRING_EMPTY_END)) == sorted([
+        a-board.board_size,
+        a-1,
+        a+1,
+        a+board.board_size,
+        a-board.board_size-1,
+        a-board.board_size+1,
+    ]))
+    assert (not board.has_link(string1.empty, a+board.board_size-1)) # removed by 'c'
 
     # put B[d]
     d = moves['d']
     board.put_stone(game, d, board.S_BLACK)
     string1 = &game.string[1]
     assert (string1.empties == 8)
-    assert (string1.empty[0] == d-board.board_size)
-    assert (string1.empty[d-board.board_size] == d+board.board_size-1)
-    assert (string1.empty[d+board.board_size-1] == d+board.board_size+1)
-    assert (string1.empty[d+board.board_size+1] == d+board.board_size*2)
-    assert (string1.empty[d+board.board_size*2] == d-1)
-    assert (string1.empty[d-1] == d+1)
-    assert (string1.empty[d+1] == d-board.board_size-1)
-    assert (string1.empty[d-board.board_size-1] == d-board.board_size+1)
-    assert (string1.empty[d-board.board_size+1] == STRING_EMPTY_END)
+    assert (sorted(__links_of(string1.empty, STRING_EMPTY_END)) == sorted([
+        d-board.board_size,
+        d+board.board_size-1,
+        d+board.board_size+1,
+        d+board.board_size*2,
+        d-1,
+        d+1,
+        d-board.board_size-1,
+        d-board.board_size+1,
+    ]))
 
     # put B[e]
     e = moves['e']
@@ -556,23 +571,24 @@ def test_string_merge_empty():
     # 69 b  e  c  73
     # 80 81 82 83 84
     assert (string1.empties == 16)
-    assert (string1.empty[0] == e-board.board_size*3)  # 38
-    assert (string1.empty[e-board.board_size*3] == e-board.board_size-1)  # 59
-    assert (string1.empty[e-board.board_size-1] == e-board.board_size+1)  # 61
-    assert (string1.empty[e-board.board_size+1] == e-board.board_size*2-1)  # 48
-    assert (string1.empty[e-board.board_size*2-1] == e-board.board_size*2+1)  # 50
-    assert (string1.empty[e-board.board_size*2+1] == e-board.board_size*3-1)  # 37
-    assert (string1.empty[e-board.board_size*3-1] == e-board.board_size*3+1)  # 39
-    assert (string1.empty[e-board.board_size*3+1] == e-2)  # 69
-    assert (string1.empty[e-2] == e+2)  # 73
-    assert (string1.empty[e+2] == e+board.board_size-1)  # 81
-    assert (string1.empty[e+board.board_size-1] == e-board.board_size-2)  # 58
-    assert (string1.empty[e-board.board_size-2] == e+board.board_size-2)  # 80
-    assert (string1.empty[e+board.board_size-2] == e+board.board_size)  # 82
-    assert (string1.empty[e+board.board_size] == e+board.board_size+1)  # 83
-    assert (string1.empty[e+board.board_size+1] == e-board.board_size+2)  # 62
-    assert (string1.empty[e-board.board_size+2] == e+board.board_size+2)  # 84
-    assert (string1.empty[e+board.board_size+2] == STRING_EMPTY_END)
+    assert (sorted(__links_of(string1.empty, STRING_EMPTY_END)) == sorted([
+        e-board.board_size*3,  # 38
+        e-board.board_size-1,  # 59
+        e-board.board_size+1,  # 61
+        e-board.board_size*2-1,  # 48
+        e-board.board_size*2+1,  # 50
+        e-board.board_size*3-1,  # 37
+        e-board.board_size*3+1,  # 39
+        e-2,  # 69
+        e+2,  # 73
+        e+board.board_size-1,  # 81
+        e-board.board_size-2,  # 58
+        e+board.board_size-2,  # 80
+        e+board.board_size,  # 82
+        e+board.board_size+1,  # 83
+        e-board.board_size+2,  # 62
+        e+board.board_size+2,  # 84
+    ]))
 
     assert (string1.flag == True)
     assert (string2.flag == False)
@@ -634,6 +650,342 @@ def test_ko():
     assert (board.is_legal(game, moves['a'], game.current_color) == False)
 
 
+def test_undo_put_stone():
+    cdef board.game_state_t *game
+    cdef board.game_state_t *initial_game
+    cdef board.game_state_t *before_move
+    cdef board.board_journal_t *journal = board.allocate_journal()
+    cdef int i, j, pos, n_moves, size
+
+    game = __initialize_game(19)
+    initial_game = board.allocate_game()
+    before_move = board.allocate_game()
+
+    srand(1)
+    __play_random_moves(game, 120)
+    board.copy_game(initial_game, game)
+
+    # each move is taken back exactly, including captures, ko and merges
+    n_moves = 0
+    for i in range(300):
+        pos = board.PASS
+        for j in range(10):
+            pos = board.onboard_pos[rand() % board.pure_board_max]
+            if board.is_legal(game, pos, game.current_color):
+                break
+            pos = board.PASS
+        board.copy_game(before_move, game)
+        assert board.put_stone_undoable(game, pos, game.current_color, journal)
+        game.current_color = board.FLIP_COLOR(game.current_color)
+        board.undo_put_stone(game, journal)
+        __assert_same_game(game, before_move)
+        assert (memcmp(game.pat, before_move.pat, sizeof(int) * board.board_max) == 0)
+        assert (game.positional_hash == before_move.positional_hash)
+        assert (memcmp(game.prisoner, before_move.prisoner, sizeof(int) * board.S_MAX) == 0)
+
+        board.put_stone_undoable(game, pos, game.current_color, journal)
+        game.current_color = board.FLIP_COLOR(game.current_color)
+        n_moves += 1
+
+    # illegal move is not journaled
+    size = journal.size
+    for i in range(board.pure_board_max):
+        pos = board.onboard_pos[i]
+        if game.board[pos] != board.S_EMPTY:
+            assert not board.put_stone_undoable(game, pos, game.current_color, journal)
+            break
+    assert (journal.size == size)
+
+    for i in range(n_moves):
+        board.undo_put_stone(game, journal)
+    assert (journal.size == 0)
+    __assert_same_game(game, initial_game)
+    assert (memcmp(game.pat, initial_game.pat, sizeof(int) * board.board_max) == 0)
+    assert (game.positional_hash == initial_game.positional_hash)
+    assert (memcmp(game.prisoner, initial_game.prisoner, sizeof(int) * board.S_MAX) == 0)
+    for i in range(board.S_OB):
+        assert (game.updated_string_num[i] == initial_game.updated_string_num[i])
+
+    board.free_journal(journal)
+    board.free_game(game)
+    board.free_game(initial_game)
+    board.free_game(before_move)
+
+def test_is_superko():
+    cdef board.game_state_t *game
+    cdef board.game_state_t *played_game = board.allocate_game()
+    cdef int i, j, n, pos, color
+    cdef int n_repeated = 0
+    cdef bint repeated
+    cdef bint check_superko = board.check_superko_flag
+
+    board.set_check_superko(True)
+    for n in (60, 120, 180, 240):
+        game = __initialize_game(9)
+        srand(n)
+        __play_random_moves(game, n)
+        board.set_check_superko(False)
+        for i in range(board.pure_board_max):
+            pos = board.onboard_pos[i]
+            for color in (board.S_BLACK, board.S_WHITE):
+                board.copy_game(played_game, game)
+                if not board.put_stone(played_game, pos, color):
+                    continue
+                repeated = False
+                for j in range(game.moves):
+                    if game.record[j].hash == played_game.positional_hash:
+                        repeated = True
+                assert (board.is_superko(game, pos, color) == repeated)
+                n_repeated += repeated
+        board.set_check_superko(True)
+        board.free_game(game)
+
+    board.free_game(played_game)
+    board.set_check_superko(check_superko)
+
+    assert (n_repeated > 0)
+
+
+def test_is_true_eye():
+    cdef board.game_state_t *game
+    cdef int empty_diagonal_stack[200]
+    cdef int i, n, pos, color
+    cdef bint by_pattern, by_board
+
+    for n in (40, 80, 120, 160):
+        game = __initialize_game(9)
+        srand(n)
+        __play_random_moves(game, n)
+        for i in range(board.pure_board_max):
+            pos = board.onboard_pos[i]
+            for color in (board.S_BLACK, board.S_WHITE):
+                by_pattern = board.is_true_eye(game, pos, color, board.FLIP_COLOR(color), empty_diagonal_stack, 0)
+                by_board = __is_true_eye_by_board(game, pos, color, board.FLIP_COLOR(color), empty_diagonal_stack, 0)
+                assert (by_pattern == by_board)
+                # policy feature passes color of the empty point itself
+                assert (board.is_true_eye(game, pos, board.S_EMPTY, board.FLIP_COLOR(color), empty_diagonal_stack, 0) == by_board)
+        board.free_game(game)
+
+
+def test_calculate_score():
+    cdef board.game_state_t *game
+    cdef board.game_state_t *scored_game = board.allocate_game()
+    cdef int i, n, size, pos, score
+    cdef int n_empty
+    cdef int stone_num[3]
+
+    for size in (9, 19):
+        for n in range(8):
+            game = __initialize_game(size)
+            srand(n)
+            __play_random_rollout(game)
+
+            stone_num[:] = [0, 0, 0]
+            n_empty = 0
+            for i in range(board.pure_board_max):
+                pos = board.onboard_pos[i]
+                if game.board[pos] == board.S_EMPTY:
+                    assert (game.empty_pos[game.empty_pos_index[pos]] == pos)
+                    n_empty += 1
+                else:
+                    stone_num[<int>game.board[pos]] += 1
+            assert (game.empty_pos_num == n_empty)
+            assert (game.stone_num[<int>board.S_BLACK] == stone_num[<int>board.S_BLACK])
+            assert (game.stone_num[<int>board.S_WHITE] == stone_num[<int>board.S_WHITE])
+
+            board.copy_game(scored_game, game)
+            score = __calculate_score_by_board(scored_game)
+            assert (board.calculate_score(game) == score)
+            # score is unchanged by recoloring bent four again
+            assert (board.calculate_score(game) == score)
+            board.free_game(game)
+
+    board.free_game(scored_game)
+
+
+cdef int __calculate_score_by_board(board.game_state_t *game):
+    cdef int i, pos, color
+    cdef int scores[4]
+
+    scores[:] = [0, 0, 0, 0]
+
+    board.check_bent_four_in_the_corner(game)
+
+    for i in range(board.pure_board_max):
+        pos = board.onboard_pos[i]
+        color = game.board[pos]
+        if color == board.S_EMPTY:
+            color = board.territory[pat.pat3(game.pat, pos)]
+        scores[color] += 1
+
+    return scores[<int>board.S_BLACK] - scores[<int>board.S_WHITE]
+
+
+def test_bitboards():
+    cdef board.game_state_t *game
+    cdef int i, j, n, pos, color
+
+    for n in (9, 19):
+        game = __initialize_game(n)
+        srand(n)
+        for j in range(400):
+            __play_random_moves(game, 1)
+            __assert_bitboards(game)
+            for i in range(board.pure_board_max):
+                pos = board.onboard_pos[i]
+                if game.board[pos] != board.S_EMPTY:
+                    continue
+                for color in (board.S_BLACK, board.S_WHITE):
+                    assert (board.is_suicide(game, pos, color) == __is_suicide_by_board(game, pos, color))
+        board.free_game(game)
+
+
+cdef void __play_random_rollout(board.game_state_t *game):
+    """ Play random moves except for own eyes until both players pass.
+    """
+    cdef int i, pos
+    cdef int n_legal
+    cdef int legal_pos[361]
+
+    while game.pass_count < 2 and game.moves < board.max_moves:
+        n_legal = 0
+        for i in range(board.pure_board_max):
+            pos = board.onboard_pos[i]
+            if board.is_legal_not_eye(game, pos, game.current_color):
+                legal_pos[n_legal] = pos
+                n_legal += 1
+        if n_legal > 0:
+            pos = legal_pos[rand() % n_legal]
+        else:
+            pos = board.PASS
+        board.put_stone(game, pos, game.current_color)
+        game.current_color = board.FLIP_COLOR(game.current_color)
+
+
+cdef bint __is_true_eye_by_board(board.game_state_t *game,
+                                 int pos,
+                                 char color,
+                                 char other_color,
+                                 int empty_diagonal_stack[200],
+                                 int empty_diagonal_top):
+    cdef int allowable_bad_diagonal = 1
+    cdef int num_bad_diagonal = 0
+    cdef int dpos, dcolor
+    cdef int i, j
+    cdef bint found
+
+    for i in range(4):
+        dcolor = game.board[board.neighbor4_pos[pos][i]]
+        if dcolor == board.S_EMPTY or dcolor == other_color:
+            return False
+
+    if board.board_dis_x[pos] == 1 or board.board_dis_y[pos] == 1:
+        allowable_bad_diagonal = 0
+
+    for i in range(4):
+        dpos = board.diagonal_pos[pos][i]
+        dcolor = game.board[dpos]
+        if dcolor == other_color:
+            num_bad_diagonal += 1
+        elif dcolor == board.S_EMPTY:
+            found = False
+            for j in range(empty_diagonal_top):
+                if empty_diagonal_stack[j] == dpos:
+                    found = True
+                    break
+            if found:
+                continue
+            empty_diagonal_stack[empty_diagonal_top] = dpos
+            if not __is_true_eye_by_board(game, dpos, color, other_color, empty_diagonal_stack, empty_diagonal_top + 1):
+                num_bad_diagonal += 1
+
+        if num_bad_diagonal > allowable_bad_diagonal:
+            return False
+
+    return True
+
+
+cdef bint __is_suicide_by_board(board.game_state_t *game, int pos, char color):
+    cdef int other = board.FLIP_COLOR(color)
+    cdef int i, neighbor_pos, neighbor_id
+
+    for i in range(4):
+        neighbor_pos = board.neighbor4_pos[pos][i]
+        neighbor_id = game.string_id[neighbor_pos]
+        if (game.board[neighbor_pos] == other and
+            game.string[neighbor_id].libs == 1):
+            return False
+        elif (game.board[neighbor_pos] == color and
+              game.string[neighbor_id].libs > 1):
+            return False
+
+    return True
+
+
+cdef void __assert_bitboards(board.game_state_t *game):
+    """ Bitboards have a bit at each point of its color, and at stones of strings in atari.
+    """
+    cdef int pos, color
+    cdef bint in_atari
+
+    for pos in range(board.board_max):
+        for color in (board.S_EMPTY, board.S_BLACK, board.S_WHITE):
+            assert (board.test_bit(game.stones[color], pos) == (game.board[pos] == color))
+        in_atari = ((game.board[pos] == board.S_BLACK or game.board[pos] == board.S_WHITE) and
+                    game.string[game.string_id[pos]].libs == 1)
+        assert (board.test_bit(game.atari, pos) == in_atari)
+
+
+cdef void __play_random_moves(board.game_state_t *game, int n):
+    cdef int i, j, pos
+
+    for i in range(n):
+        pos = board.PASS
+        for j in range(10):
+            pos = board.onboard_pos[rand() % board.pure_board_max]
+            if board.is_legal(game, pos, game.current_color):
+                break
+            pos = board.PASS
+        board.put_stone(game, pos, game.current_color)
+        game.current_color = board.FLIP_COLOR(game.current_color)
+
+
+cdef void __assert_same_game(board.game_state_t *a, board.game_state_t *b):
+    cdef int i
+    cdef board.string_t *sa
+    cdef board.string_t *sb
+
+    assert (a.moves == b.moves)
+    assert (a.current_color == b.current_color)
+    assert (a.current_hash == b.current_hash)
+    assert (a.ko_pos == b.ko_pos and a.ko_move == b.ko_move)
+    assert (memcmp(a.board, b.board, sizeof(char) * board.board_max) == 0)
+    assert (memcmp(a.birth_move, b.birth_move, sizeof(board.board_int_t) * board.board_max) == 0)
+    assert (memcmp(a.string_id, b.string_id, sizeof(board.board_int_t) * board.string_pos_max) == 0)
+    assert (memcmp(a.string_next, b.string_next, sizeof(board.board_int_t) * board.string_pos_max) == 0)
+    assert (memcmp(a.stones, b.stones, sizeof(a.stones)) == 0)
+    assert (memcmp(a.atari, b.atari, sizeof(a.atari)) == 0)
+    assert (memcmp(a.superko_table, b.superko_table, sizeof(short) * board.SUPERKO_TABLE_SIZE) == 0)
+    assert (a.empty_pos_num == b.empty_pos_num)
+    assert (memcmp(a.empty_pos, b.empty_pos, sizeof(board.board_int_t) * a.empty_pos_num) == 0)
+    assert (memcmp(a.empty_pos_index, b.empty_pos_index, sizeof(board.board_int_t) * board.board_max) == 0)
+    for i in range(board.S_OB):
+        assert (a.stone_num[i] == b.stone_num[i])
+        assert (a.capture_num[i] == b.capture_num[i])
+        assert (memcmp(a.capture_pos[i], b.capture_pos[i], sizeof(board.board_int_t) * a.capture_num[i]) == 0)
+    for i in range(board.max_string):
+        sa = &a.string[i]
+        sb = &b.string[i]
+        assert (sa.flag == sb.flag)
+        if not sa.flag:
+            continue
+        assert (sa.color == sb.color and sa.origin == sb.origin and sa.size == sb.size)
+        assert (sa.libs == sb.libs and sa.neighbors == sb.neighbors and sa.empties == sb.empties)
+        assert (__same_links(sa.lib, sb.lib, board.string_lib_max, board.liberty_end))
+        assert (__same_links(sa.neighbor, sb.neighbor, board.max_neighbor, board.NEIGHBOR_END))
+        assert (__same_links(sa.empty, sb.empty, board.STRING_EMPTY_MAX, STRING_EMPTY_END))
+
+
 cdef board.game_state_t* __initialize_game(int board_size=9):
     cdef board.game_state_t *game
 
@@ -645,6 +997,29 @@ cdef board.game_state_t* __initialize_game(int board_size=9):
     return game
 
 
+cdef list __links_of(board.string_link_t *links, int end):
+    """ Return elements of a string set in the order they are walked.
+    """
+    cdef list elements = []
+    cdef int i = board.next_link(links, 0)
+
+    while i != end:
+        elements.append(i)
+        i = board.next_link(links, i)
+    return elements
+
+
+cdef bint __same_links(board.string_link_t *a, board.string_link_t *b, int n, int end):
+    """ Whether a and b hold the same elements and walk them in the same order.
+    """
+    cdef int i
+
+    for i in range(1, n):
+        if board.has_link(a, i) != board.has_link(b, i):
+            return False
+    return __links_of(a, end) == __links_of(b, end)
+
+
 cdef board.string_t* __initialize_string(board.game_state_t *game, int origin, char color):
     cdef board.string_t *string
     cdef string_id = 1
@@ -654,10 +1029,8 @@ cdef board.string_t* __initialize_string(board.game_state_t *game, int origin, c
 
     string = &game.string[string_id]
 
-    board.fill_n_short(string.lib, board.string_lib_max, 0)
-    board.fill_n_short(string.neighbor, board.max_neighbor, 0)
-    string.lib[0] = board.string_lib_max - 1
-    string.neighbor[0] = board.NEIGHBOR_END
+    board.clear_links(string.lib, board.string_lib_max, board.string_lib_max - 1)
+    board.clear_links(string.neighbor, board.max_neighbor, board.NEIGHBOR_END)
     string.libs = 0
     string.color = color
     string.origin = origin 
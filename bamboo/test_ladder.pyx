@@ -3,22 +3,22 @@ import numpy as np
 cimport numpy as np
 
 from libc.stdlib cimport malloc, free
+from libc.string cimport memcmp
 
 from . cimport board 
 from . cimport policy_feature
 from . cimport parseboard
 from . cimport printer
 
-from .policy_feature cimport MAX_POLICY_PLANES
+from .policy_feature cimport MAX_POLICY_PLANES, LADDER_CACHE_SIZE, PLANES_NCHW
 from .tree_search cimport tree_node_t
+from .zobrist_hash cimport initialize_hash
 
 
 def test_captured_1():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
                              "d b c . . . .|"
                              "B W a . . . .|"
@@ -56,8 +56,6 @@ def test_breaker_1():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
                                  ". B . . . . .|"
                                  "B W a . . W .|"
@@ -95,8 +93,6 @@ def test_missing_ladder_breaker_1():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
                                  ". B . . . . .|"
                                  "B W B . . W .|"
@@ -130,8 +126,6 @@ def test_missing_ladder_breaker_2():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     # BBS(MCTS-CNN) put 'b' at after 'a' in actual game
     (moves, pure_moves) = parseboard.parse(node.game,
         ". . . . . . . . . . . . . . . . . . .|"
@@ -240,8 +234,6 @@ def test_snapback_1():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
                                 ". . . . . . . . .|"
                                 ". . . . . . . . .|"
@@ -468,8 +460,6 @@ def test_escape_segmentation_fault_1():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
         ". . . W W B . . . . B . W . W W . W .|"
         "W W W W B B . W W B W W W . W B W B B|"
@@ -506,8 +496,6 @@ def test_capture_segmentation_fault_1():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
         ". . . W W B . . . . B . W . W W . W .|"
         "W W W W B B . W W B W W W . W B W B B|"
@@ -544,8 +532,6 @@ def test_segmentation_fault_2():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
         ". . . . . . B B B W . W . W W B . . .|"
         "B . B . B B B W B B W W W W B B B B B|"
@@ -582,8 +568,6 @@ def test_captured_3():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
         ". . . . . . . . . . . . . . . . . . .|"
         ". . . . . . . . . . . . . W B B B W .|"
@@ -625,8 +609,6 @@ def test_segmentation_fault_3():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     """
     (moves, pure_moves) = parseboard.parse(node.game,
         ". . . . . . . . . . . . . . . . . . .|"
@@ -697,3 +679,158 @@ def test_segmentation_fault_3():
     node.game.current_color = board.S_WHITE
     
     policy_feature.update(feature, node.game)
+
+
+def test_ladder_cache():
+    cdef tree_node_t *node
+    node = <tree_node_t *>malloc(sizeof(tree_node_t))
+    node.game = board.allocate_game()
+    initialize_hash()
+    (moves, pure_moves) = parseboard.parse(node.game,
+                             "d b c . . . .|"
+                             "B W a . . . .|"
+                             ". B . . . . .|"
+                             ". . . . . . .|"
+                             ". . . . . . .|"
+                             ". . . . . W .|")
+    feature = policy_feature.allocate_feature(MAX_POLICY_PLANES)
+    policy_feature.initialize_feature(feature)
+    planes = np.asarray(feature.planes)
+
+    node.game.current_color = board.S_BLACK
+
+    policy_feature.set_ladder_cache_size(LADDER_CACHE_SIZE)
+    policy_feature.update(feature, node.game)
+    stats = policy_feature.get_ladder_cache_stats()
+    assert (stats['lookups'] == 2)
+    assert (stats['hits'] == 0)
+    assert (stats['size'] == 2)
+
+    # same position is read from cache
+    first_planes = planes.copy()
+    policy_feature.update(feature, node.game)
+    stats = policy_feature.get_ladder_cache_stats()
+    assert (stats['lookups'] == 4)
+    assert (stats['hits'] == 2)
+    assert (np.array_equal(planes, first_planes))
+    assert (planes[44, pure_moves['a']] == 1)
+    assert (planes[44, pure_moves['b']] == 0)
+
+    # least recently used result is evicted
+    policy_feature.set_ladder_cache_size(1)
+    policy_feature.update(feature, node.game)
+    stats = policy_feature.get_ladder_cache_stats()
+    assert (stats['size'] == 1)
+    assert (stats['hits'] == 0)
+    assert (np.array_equal(planes, first_planes))
+
+    # disabled
+    policy_feature.set_ladder_cache_size(0)
+    policy_feature.update(feature, node.game)
+    stats = policy_feature.get_ladder_cache_stats()
+    assert (stats['lookups'] == 0)
+    assert (np.array_equal(planes, first_planes))
+
+    board.free_game(node.game)
+    policy_feature.free_feature(feature)
+
+
+def test_ladder_read_only():
+    cdef board.game_state_t *game
+    cdef board.game_state_t *before
+    cdef board.game_state_t *games[4]
+    cdef int[:, :, :, ::1] out
+    cdef int n
+
+    game = board.allocate_game()
+    before = board.allocate_game()
+    (moves, pure_moves) = parseboard.parse(game,
+                             "d b c . . . .|"
+                             "B W a . . . .|"
+                             ". B . . . . .|"
+                             ". . . . . . .|"
+                             ". . . . . . .|"
+                             ". . . . . W .|")
+    game.current_color = board.S_BLACK
+    board.copy_game(before, game)
+
+    feature = policy_feature.allocate_feature(MAX_POLICY_PLANES)
+    policy_feature.initialize_feature(feature)
+    planes = np.asarray(feature.planes)
+
+    # ladders are read on a copy, and game is never written
+    policy_feature.update(feature, game)
+    assert (feature.scratch.has_read_game)
+    assert (planes[44, pure_moves['a']] == 1)
+    assert (memcmp(game.board, before.board, sizeof(char) * board.board_max) == 0)
+    assert (memcmp(game.string_id, before.string_id, sizeof(board.board_int_t) * board.string_pos_max) == 0)
+    assert (game.positional_hash == before.positional_hash)
+    assert (game.moves == before.moves)
+
+    # so that threads may encode the same game at once
+    for n in range(4):
+        games[n] = game
+    policy_feature.initialize_batch(feature, 3)
+    out = np.zeros((4, MAX_POLICY_PLANES, board.pure_board_size, board.pure_board_size), dtype=np.int32)
+    policy_feature.update_batch(feature, games, 4, out, PLANES_NCHW)
+    for n in range(4):
+        assert (np.array_equal(np.asarray(out[n]).reshape((MAX_POLICY_PLANES, -1)), planes))
+
+    board.free_game(game)
+    board.free_game(before)
+    policy_feature.free_feature(feature)
+
+
+def test_ladder_incremental():
+    cdef board.game_state_t *game
+    cdef unsigned long long lookups
+
+    game = board.allocate_game()
+    initialize_hash()
+    (moves, pure_moves) = parseboard.parse(game,
+                             "d b c . . . .|"
+                             "B W a . . . .|"
+                             ". B . . . . .|"
+                             ". . . . . . e|"
+                             ". . . . . . .|"
+                             ". . . . f W .|"
+                             ". . . g . . .|")
+    game.current_color = board.S_BLACK
+
+    feature = policy_feature.allocate_feature(MAX_POLICY_PLANES)
+    policy_feature.initialize_feature(feature)
+    incremental_feature = policy_feature.allocate_feature(MAX_POLICY_PLANES)
+    policy_feature.initialize_feature(incremental_feature)
+    planes = np.asarray(feature.planes)
+    incremental_planes = np.asarray(incremental_feature.planes)
+
+    # lookups count ladder searches
+    policy_feature.set_ladder_cache_size(LADDER_CACHE_SIZE)
+    policy_feature.update(feature, game)
+    policy_feature.update_incremental(incremental_feature, game)
+    assert (planes[44, pure_moves['a']] == 1)
+    assert (np.array_equal(planes, incremental_planes))
+
+    # moves far from the ladder keep it as it was read
+    board.do_move(game, moves['e'])
+    board.do_move(game, moves['f'])
+    lookups = policy_feature.get_ladder_cache_stats()['lookups']
+    policy_feature.update_incremental(incremental_feature, game)
+    assert (policy_feature.get_ladder_cache_stats()['lookups'] == lookups)
+    policy_feature.update(feature, game)
+    assert (planes[44, pure_moves['a']] == 1)
+    assert (np.array_equal(planes, incremental_planes))
+
+    # a move next to points the ladder was read on reads it again
+    board.do_move(game, moves['g'])
+    board.do_move(game, moves['c'])
+    lookups = policy_feature.get_ladder_cache_stats()['lookups']
+    policy_feature.update_incremental(incremental_feature, game)
+    assert (policy_feature.get_ladder_cache_stats()['lookups'] > lookups)
+    policy_feature.update(feature, game)
+    assert (np.array_equal(planes, incremental_planes))
+
+    policy_feature.set_ladder_cache_size(0)
+    board.free_game(game)
+    policy_feature.free_feature(feature)
+    policy_feature.free_feature(incremental_feature)
@@ -3,22 +3,35 @@ from __future__ import division
 import numpy as np
 cimport numpy as np
 
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import tensorflow as tf
+
 from bamboo.models.keras_dcnn_policy import KerasPolicy, cnn_policy
+from bamboo.models.v1.dcnn_resnet_value import inference_agz
 
 from libc.stdio cimport printf
+from libc.stdlib cimport malloc, free, rand
 
-from bamboo.board cimport PURE_BOARD_SIZE, BOARD_SIZE, OB_SIZE, S_EMPTY, S_BLACK, S_WHITE, PASS, RESIGN
+from bamboo.board cimport PURE_BOARD_SIZE, PURE_BOARD_MAX, BOARD_SIZE, OB_SIZE, S_EMPTY, S_BLACK, S_WHITE, PASS, RESIGN
 from bamboo.board cimport FLIP_COLOR, CORRECT_X, CORRECT_Y
 from bamboo.board cimport game_state_t, onboard_pos
 from bamboo.board cimport set_board_size, initialize_board, allocate_game, free_game, put_stone, copy_game, calculate_score, komi
 from bamboo.printer cimport print_board
 from bamboo.parseboard cimport parse
 
-from bamboo.zobrist_hash cimport uct_hash_size
-from bamboo.zobrist_hash cimport set_hash_size, initialize_hash, initialize_uct_hash, clear_uct_hash, delete_old_hash, search_empty_index, find_same_hash_index
-from bamboo.tree_search cimport tree_node_t, MCTS
+from bamboo.zobrist_hash cimport uct_hash_size, used, uct_hash
+from bamboo.zobrist_hash cimport set_hash_size, initialize_hash, initialize_uct_hash, clear_uct_hash, delete_old_hash, search_empty_index, find_same_hash_index, delete_hash_index
+from bamboo.tree_search cimport tree_node_t, child_arena_t, search_tree_t, game_pool_t, MCTS, PyMCTS, VIRTUAL_LOSS
+from bamboo.tree_search cimport initialize_child_arena, free_child_arena, allocate_children, release_children
+from bamboo.policy_feature cimport MAX_VALUE_PLANES
+from bamboo.tree_search cimport initialize_game_pool, free_game_pool, borrow_game, return_game
 
-from bamboo.rollout_preprocess cimport set_debug, initialize_rollout_const, initialize_rollout, update_rollout, set_rollout_parameter
+from bamboo.rollout_preprocess cimport rollout_rng_t, set_debug, initialize_rollout_const, initialize_rollout, update_rollout, set_rollout_parameter
 from bamboo.local_pattern cimport read_rands, init_d12_rsp_hash, init_x33_hash
 from bamboo.nakade cimport initialize_nakade_hash
 
@@ -117,7 +130,7 @@ def test_expand():
     assert (child.time_step == 1)
     assert (child.pos == 132)
     assert (child.color == S_BLACK)
-    assert (child.P == 0)
+    assert (node.children_P[72] == 0)
     assert (child.Nv == 0)
     assert (child.Nr == 0)
     assert (child.Wv == 0)
@@ -149,7 +162,7 @@ def test_expand():
     assert (node.is_edge is False)
 
     # assert child B[Q4]
-    child = node.children[300]
+    child = node.children[298]
     assert (node.children_pos[298] == 300)
     assert (child.time_step == 3)
     assert (child.pos == 408)
@@ -189,7 +202,7 @@ def test_select():
 
     mcts.expand(node, search_game)
     # set max_child
-    node.children[72].P = 0.99
+    node.children_P[72] = 0.99
 
     # select down the tree
     node = mcts.select(node, search_game)
@@ -201,9 +214,9 @@ def test_select():
     # set max_child
     max_child_pos = 300
     node.Nr = 1000
-    node.children[max_child_pos].Nr = 1000
-    node.children[max_child_pos].Q = 0.5
-    node.P = 0.99
+    # B[Q16] is occupied, so board index 300 is 299th child
+    node.children[299].Nr = 1000
+    node.children[299].Q = 0.5
 
     node = mcts.select(node, search_game)
     assert (node.pos == onboard_pos[max_child_pos])
@@ -246,7 +259,7 @@ def test_rollout():
     game.current_color = FLIP_COLOR(game.current_color) 
     update_rollout(game)
 
-    mcts.rollout(game)
+    mcts.rollout(game, &mcts.rollout_rngs[0])
 
     print_board(game)
 
@@ -285,7 +298,7 @@ def test_eval_leaf_by_policy_network():
 
     prob_sum = .0
     for i in range(node0.num_child):
-        prob_sum += node0.children[node0.children_pos[i]].P
+        prob_sum += node0.children_P[i]
     assert (round(prob_sum) == 1.0)
 
     # put B[Q16]
@@ -321,7 +334,7 @@ def test_eval_leaf_by_policy_network():
 
     prob_sum = .0
     for i in range(node1.num_child):
-        prob_sum += node1.children[node1.children_pos[i]].P
+        prob_sum += node1.children_P[i]
     assert (round(prob_sum) == 1.0)
 
     # eval node2
@@ -333,7 +346,7 @@ def test_eval_leaf_by_policy_network():
 
     prob_sum = .0
     for i in range(node2.num_child):
-        prob_sum += node2.children[node2.children_pos[i]].P
+        prob_sum += node2.children_P[i]
     assert (round(prob_sum) == 1.0)
 
     assert mcts.policy_network_queue.empty()
@@ -348,3 +361,664 @@ cdef game_state_t* initialize_game(int board_size=19):
     initialize_board(game)
 
     return game
+
+
+def test_eval_leaves_by_policy_network():
+    cdef game_state_t *game = initialize_game()
+    cdef MCTS mcts
+    cdef tree_node_t *node0
+    cdef tree_node_t *node1
+    cdef int i
+    cdef double prob_sum = 0.0
+
+    mcts = MCTS(nogpu=True, pn_batch_size=2)
+    pn = cnn_policy()
+    pn.load_weights(pn_path)
+    mcts.set_policy_network(KerasPolicy(pn))
+
+    game.current_color = S_BLACK
+
+    # seek and expand
+    assert (mcts.seek_root(game) is False)
+    node0 = &mcts.nodes[mcts.current_root]
+    mcts.expand(node0, game)
+
+    # put B[Q16]
+    put_stone(game, 132, game.current_color)
+    game.current_color = FLIP_COLOR(game.current_color) 
+    update_rollout(game)
+
+    # seek and expand
+    assert (mcts.seek_root(game) is True)
+    node1 = &mcts.nodes[mcts.current_root]
+    mcts.expand(node1, game)
+
+    assert (mcts.policy_network_queue.size() == 2)
+
+    # eval node0 and node1 in single batch
+    mcts.eval_all_leaf_by_policy_network()
+
+    assert mcts.policy_network_queue.empty()
+    assert (mcts.pn_batch_hist[2] == 1)
+    assert (node0.has_game is False and node1.has_game is False)
+
+    prob_sum = .0
+    for i in range(node0.num_child):
+        prob_sum += node0.children_P[i]
+    assert (round(prob_sum) == 1.0)
+
+    prob_sum = .0
+    for i in range(node1.num_child):
+        prob_sum += node1.children_P[i]
+    assert (round(prob_sum) == 1.0)
+
+
+def test_backup_atomic():
+    cdef game_state_t *game = initialize_game()
+    cdef MCTS mcts = MCTS(lock_free=True)
+    cdef tree_node_t *node
+    cdef tree_node_t *child
+    cdef int i
+
+    game.current_color = S_BLACK
+
+    assert (mcts.seek_root(game) is False)
+    node = &mcts.nodes[mcts.current_root]
+
+    mcts.expand(node, game)
+
+    # child B[Q16]
+    child = node.children[72]
+
+    for i in range(4):
+        node.Nr += VIRTUAL_LOSS
+        child.Nr += VIRTUAL_LOSS
+        if i % 2 == 0:
+            mcts.backup_atomic(child, S_BLACK)
+        else:
+            mcts.backup_atomic(child, S_WHITE)
+
+    assert (node.Nr == 4)
+    assert (node.Wr == 2)
+    assert (child.Nr == 4)
+    assert (child.Wr == 2)
+    assert (child.Q == 0.5)
+
+
+def test_rollout_rngs_aligned():
+    cdef MCTS mcts = MCTS(n_threads=4)
+    cdef int i
+
+    # each generator fills one cache line of its own
+    assert (sizeof(rollout_rng_t) == 64)
+    for i in range(4):
+        assert (<size_t>&mcts.rollout_rngs[i] % 64 == 0)
+
+
+def test_child_arena():
+    cdef child_arena_t arena
+    cdef tree_node_t node0, node1, node2, node3
+
+    initialize_child_arena(&arena, 10)
+
+    node0.children = NULL
+    node0.num_child = 0
+
+    assert allocate_children(&arena, &node0, 4)
+    node0.num_child = 4
+    assert allocate_children(&arena, &node1, 6)
+    node1.num_child = 6
+    assert (arena.used == 10)
+
+    # arena is full
+    assert not allocate_children(&arena, &node2, 1)
+    assert (arena.n_fail == 1)
+
+    # released block is reused for the same number of children
+    release_children(&arena, &node0)
+    assert (node0.children == NULL and node0.num_child == 0)
+    assert (arena.used == 6)
+    assert allocate_children(&arena, &node2, 4)
+    assert (node2.children == &arena.nodes[0])
+    node2.num_child = 4
+    assert (arena.n_split == 0)
+
+    # larger released block is split, and its rest is reused
+    release_children(&arena, &node2)
+    assert allocate_children(&arena, &node2, 3)
+    assert (node2.children == &arena.nodes[0])
+    assert (arena.n_split == 1)
+    assert allocate_children(&arena, &node3, 1)
+    assert (node3.children == &arena.nodes[3])
+    assert (arena.used == 10)
+    assert not allocate_children(&arena, &node0, 1)
+    assert (arena.n_fail == 2)
+
+    free_child_arena(&arena)
+
+
+def test_child_arena_coalesce():
+    cdef child_arena_t arena
+    cdef tree_node_t *nodes = <tree_node_t *>malloc(1000 * sizeof(tree_node_t))
+    cdef int i, n, num_child, cycle
+
+    initialize_child_arena(&arena, 1000)
+
+    # single children released one by one are merged and given back to the top
+    for i in range(1000):
+        nodes[i].children = NULL
+        assert allocate_children(&arena, &nodes[i], 1)
+        nodes[i].num_child = 1
+    for i in range(1000):
+        release_children(&arena, &nodes[i])
+    assert allocate_children(&arena, &nodes[0], PURE_BOARD_MAX)
+    assert (nodes[0].children == &arena.nodes[0])
+    assert (arena.n_coalesce == 1)
+    nodes[0].num_child = PURE_BOARD_MAX
+    release_children(&arena, &nodes[0])
+
+    # full arena is not coalesced again until a block is released
+    for i in range(1000 // PURE_BOARD_MAX + 1):
+        nodes[i].children = NULL
+    assert allocate_children(&arena, &nodes[0], PURE_BOARD_MAX)
+    nodes[0].num_child = PURE_BOARD_MAX
+    assert allocate_children(&arena, &nodes[1], PURE_BOARD_MAX)
+    nodes[1].num_child = PURE_BOARD_MAX
+    assert not allocate_children(&arena, &nodes[2], PURE_BOARD_MAX)
+    assert not allocate_children(&arena, &nodes[2], PURE_BOARD_MAX)
+    assert (arena.n_coalesce == 2)
+    release_children(&arena, &nodes[0])
+    release_children(&arena, &nodes[1])
+
+    # arena does not fragment over many cycles of allocation and release
+    for cycle in range(1000):
+        n = 0
+        while True:
+            num_child = 1 + rand() % PURE_BOARD_MAX
+            nodes[n].children = NULL
+            if not allocate_children(&arena, &nodes[n], num_child):
+                break
+            nodes[n].num_child = num_child
+            n += 1
+        for i in range(1, n, 2):
+            release_children(&arena, &nodes[i])
+        for i in range(0, n, 2):
+            release_children(&arena, &nodes[i])
+        assert (arena.used == 0)
+        assert allocate_children(&arena, &nodes[0], PURE_BOARD_MAX)
+        nodes[0].num_child = PURE_BOARD_MAX
+        release_children(&arena, &nodes[0])
+
+    free_child_arena(&arena)
+    free(nodes)
+
+
+def test_reclaim():
+    cdef game_state_t *game = initialize_game()
+    cdef MCTS mcts = MCTS()
+    cdef tree_node_t *node
+    cdef tree_node_t *child
+    cdef unsigned int old_root
+    cdef int i
+
+    game.current_color = S_BLACK
+
+    assert (mcts.seek_root(game) is False)
+    node = &mcts.nodes[mcts.current_root]
+    old_root = mcts.current_root
+
+    mcts.expand(node, game)
+    assert (used == 362)
+
+    # expand child B[Q16]
+    child = node.children[72]
+    put_stone(game, 132, game.current_color)
+    game.current_color = FLIP_COLOR(game.current_color) 
+    update_rollout(game)
+    mcts.expand(child, game)
+    assert (used == 362 + 360)
+
+    assert (mcts.seek_root(game) is True)
+    assert (mcts.current_root == child.node_i)
+
+    # old root and siblings of B[Q16] are reclaimed
+    assert (mcts.reclaim(old_root) == 361)
+    assert (used == 361)
+    assert (node.num_child == 0)
+    assert (child.parent == NULL)
+    assert (child.num_child == 360)
+    for i in range(child.num_child):
+        assert (child.children[i].parent == child)
+
+    # nothing left to reclaim
+    assert (mcts.reclaim(old_root) == 0)
+
+    free_game(game)
+
+
+cdef game_pool_t *returning_pool
+cdef game_state_t *returning_game
+
+
+def return_pooled_game():
+    return_game(returning_pool, returning_game)
+
+
+def test_game_pool():
+    global returning_pool, returning_game
+    cdef game_pool_t pool
+    cdef game_state_t *games[3]
+    cdef game_state_t *game
+    cdef bint waiting = True
+
+    initialize_game_pool(&pool, 2)
+
+    games[0] = borrow_game(&pool, NULL)
+    games[1] = borrow_game(&pool, NULL)
+    assert (games[0] != games[1])
+    assert (pool.n_free == 0 and pool.max_in_use == 2 and pool.n_borrow == 2)
+
+    # dry pool falls back to malloc unless asked to wait
+    games[2] = borrow_game(&pool, NULL)
+    assert (games[2] != games[0] and games[2] != games[1])
+    assert (pool.n_malloc == 1)
+    return_game(&pool, games[2])
+    assert (pool.n_free == 0)
+
+    # borrower waits until other thread returns a game
+    returning_pool = &pool
+    returning_game = games[1]
+    returner = threading.Timer(.1, return_pooled_game)
+    returner.start()
+    with nogil:
+        game = borrow_game(&pool, &waiting)
+    returner.join()
+    assert (game == games[1])
+    assert (pool.n_wait == 1 and pool.n_malloc == 1)
+
+    return_game(&pool, games[0])
+    return_game(&pool, game)
+    assert (pool.n_free == 2)
+
+    free_game_pool(&pool)
+
+
+def test_game_pool_reclaim():
+    cdef game_state_t *game = initialize_game()
+    cdef MCTS mcts = MCTS(game_pool_size=4)
+    cdef tree_node_t *node
+    cdef unsigned int old_root
+
+    game.current_color = S_BLACK
+
+    # root game is borrowed from pool
+    mcts.seek_root(game)
+    node = &mcts.nodes[mcts.current_root]
+    old_root = mcts.current_root
+    assert (node.has_game)
+    assert (mcts.game_pool.n_free == 3)
+
+    mcts.expand(node, game)
+
+    put_stone(game, 132, game.current_color)
+    game.current_color = FLIP_COLOR(game.current_color)
+    update_rollout(game)
+    mcts.seek_root(game)
+    assert (mcts.game_pool.n_free == 2)
+
+    # game of old root is returned on reclaim
+    mcts.reclaim(old_root)
+    assert (mcts.game_pool.n_free == 3)
+    assert (mcts.game_pool.n_borrow == 2 and mcts.game_pool.n_malloc == 0)
+
+    mcts.initialize_nodes()
+    assert (mcts.game_pool.n_free == 4)
+
+    free_game(game)
+
+
+def test_value_network_queue_game():
+    cdef game_state_t *game = initialize_game()
+    cdef game_state_t *search_game = allocate_game()
+    cdef MCTS mcts = MCTS(game_pool_size=8)
+    cdef tree_node_t *node
+    cdef int i
+
+    game.current_color = S_BLACK
+
+    mcts.seek_root(game)
+    node = &mcts.nodes[mcts.current_root]
+    assert (mcts.game_pool.n_free == 7)
+
+    # leaf waiting for value network is queued once, with a game apart from its own
+    mcts.use_vn = True
+    mcts.use_rollout = False
+    for i in range(5):
+        copy_game(search_game, game)
+        mcts.search(node, search_game, &mcts.rollout_rngs[0])
+    assert (node.is_edge)
+    assert (mcts.value_network_queue.size() == 1)
+    assert (mcts.game_pool.n_free == 6)
+    assert (node.value_queued)
+    assert (node.value_game != NULL and node.value_game != node.game)
+
+    # dropped leaf is returned its game and may be queued again
+    mcts.clear_value_network_queue()
+    assert (mcts.game_pool.n_free == 7)
+    assert (node.value_game == NULL and not node.value_queued)
+    assert (node.game != NULL)
+
+    mcts.initialize_nodes()
+    assert (mcts.game_pool.n_free == 8)
+
+    free_game(search_game)
+    free_game(game)
+
+
+def save_value_network(path):
+    with tf.Graph().as_default():
+        inputs = tf.placeholder(tf.float32, [None, MAX_VALUE_PLANES, PURE_BOARD_SIZE, PURE_BOARD_SIZE])
+        inference_agz(inputs)
+        saver = tf.train.Saver()
+        with tf.compat.v1.Session() as session:
+            session.run(tf.compat.v1.global_variables_initializer())
+            saver.save(session, path)
+
+
+def test_eval_leaves_by_value_network():
+    cdef game_state_t *game = initialize_game()
+    cdef game_state_t *other_games[3]
+    cdef tree_node_t *nodes[3]
+    cdef MCTS mcts = MCTS(vn_batch_size=3)
+    cdef double Wv
+    cdef int i
+
+    d = tempfile.mkdtemp()
+    try:
+        save_value_network(os.path.join(d, 'value'))
+        mcts.run_vn_session(os.path.join(d, 'value'))
+    finally:
+        shutil.rmtree(d)
+
+    game.current_color = S_BLACK
+    for i in range(3):
+        other_games[i] = initialize_game()
+        other_games[i].current_color = S_WHITE
+        put_stone(other_games[i], onboard_pos[i*100], S_BLACK)
+        nodes[i] = &mcts.nodes[i]
+        nodes[i].Nv = 0
+        nodes[i].Nr = 0
+    put_stone(other_games[2], onboard_pos[300], S_WHITE)
+
+    # leaf alone in zero padded batch
+    nodes[0].value_game = game
+    mcts.eval_leaves_by_value_network(nodes, 1)
+    Wv = nodes[0].Wv
+
+    # value of the leaf does not depend on the rest of the batch
+    for i in range(3):
+        nodes[1].value_game = other_games[i]
+        nodes[2].value_game = other_games[(i+1) % 3]
+        mcts.eval_leaves_by_value_network(nodes, 3)
+        assert (abs(nodes[0].Wv - Wv) < 1e-5)
+    assert (nodes[0].Nv == 4)
+
+    for i in range(3):
+        nodes[i].value_game = NULL
+        free_game(other_games[i])
+    free_game(game)
+
+
+cdef tree_node_t *find_child(tree_node_t *node, int pos):
+    cdef int i
+
+    for i in range(node.num_child):
+        if onboard_pos[node.children_pos[i]] == pos:
+            return node.children[i]
+    return NULL
+
+
+cdef tree_node_t *expand_sequence(MCTS mcts, tree_node_t *node, game_state_t *game, int *moves, int n):
+    """ Expand along the moves and return the node reached.
+    """
+    cdef int i
+
+    for i in range(n):
+        if node.is_edge:
+            mcts.expand(node, game)
+        node = find_child(node, moves[i])
+        put_stone(game, moves[i], game.current_color)
+        game.current_color = FLIP_COLOR(game.current_color)
+        update_rollout(game)
+    return node
+
+
+def test_delete_hash_collision():
+    # both hashes start probing at entry 5
+    cdef unsigned long long hash1 = 5
+    cdef unsigned long long hash2 = (<unsigned long long>1 << 32) | 4
+    cdef unsigned long long hash3 = 6
+    cdef game_state_t *game
+
+    clear_uct_hash()
+
+    assert (search_empty_index(hash1, S_BLACK, 1) == 5)
+    assert (search_empty_index(hash2, S_BLACK, 1) == 6)
+    assert (search_empty_index(hash3, S_BLACK, 1) == 7)
+
+    # entries displaced past deleted one are still found
+    delete_hash_index(5)
+    assert (used == 2)
+    assert (find_same_hash_index(hash1, S_BLACK, 1) == uct_hash_size)
+    assert (find_same_hash_index(hash2, S_BLACK, 1) == 6)
+    assert (find_same_hash_index(hash3, S_BLACK, 1) == 7)
+
+    # deleted entry is reused
+    assert (search_empty_index(hash1, S_BLACK, 1) == 5)
+    assert (find_same_hash_index(hash1, S_BLACK, 1) == 5)
+
+    delete_hash_index(6)
+    assert (uct_hash.node_hash[6].deleted)
+    assert (find_same_hash_index(hash3, S_BLACK, 1) == 7)
+
+    # deleting end of cluster empties deleted entries before it
+    delete_hash_index(7)
+    assert (not uct_hash.node_hash[6].deleted)
+    assert (not uct_hash.node_hash[7].deleted)
+    delete_hash_index(5)
+    assert (not uct_hash.node_hash[5].deleted)
+    assert (used == 0)
+
+    # sweeping old entries keeps the rest reachable
+    assert (search_empty_index(hash1, S_BLACK, 1) == 5)
+    assert (search_empty_index(hash2, S_BLACK, 2) == 6)
+    assert (search_empty_index(hash3, S_BLACK, 1) == 7)
+    uct_hash.oldest_move = 1
+    game = initialize_game()
+    game.moves = 2
+    delete_old_hash(game)
+    assert (used == 1)
+    assert (find_same_hash_index(hash2, S_BLACK, 2) == 6)
+    assert (uct_hash.node_hash[5].deleted)
+    assert (not uct_hash.node_hash[7].deleted)
+    free_game(game)
+
+
+def test_expand_transposition():
+    cdef game_state_t *game = initialize_game()
+    cdef game_state_t *other_game = initialize_game()
+    cdef MCTS mcts = MCTS(transposition=True)
+    cdef tree_node_t *root
+    cdef tree_node_t *node
+    cdef tree_node_t *other_node
+    cdef tree_node_t *parent
+    cdef tree_node_t *other_parent
+    cdef int moves[3]
+    cdef int other_moves[3]
+    cdef int i, other_i
+
+    moves[0] = onboard_pos[60]
+    moves[1] = onboard_pos[200]
+    moves[2] = onboard_pos[300]
+    other_moves[0] = moves[2]
+    other_moves[1] = moves[1]
+    other_moves[2] = moves[0]
+
+    game.current_color = S_BLACK
+    other_game.current_color = S_BLACK
+
+    assert (mcts.seek_root(game) is False)
+    root = &mcts.nodes[mcts.current_root]
+
+    node = expand_sequence(mcts, root, game, moves, 3)
+    assert (mcts.n_transposition_hits == 0)
+
+    # B[300] W[200] B[60] reaches the same position as B[60] W[200] B[300]
+    other_node = expand_sequence(mcts, root, other_game, other_moves, 3)
+    assert (mcts.n_transposition_hits == 1)
+    assert (other_node == node)
+    assert (node.ref_count == 2)
+    assert (node.parent != NULL)
+
+    # shared node has a prior on each edge linking to it
+    parent = find_child(find_child(root, moves[0]), moves[1])
+    other_parent = find_child(find_child(root, other_moves[0]), other_moves[1])
+    for i in range(parent.num_child):
+        if parent.children[i] == node:
+            break
+    for other_i in range(other_parent.num_child):
+        if other_parent.children[other_i] == node:
+            break
+    assert (parent.children[i] == other_parent.children[other_i])
+    parent.children_P[i] = 0.5
+    other_parent.children_P[other_i] = 0.25
+    assert (parent.children_P[i] == 0.5)
+
+    free_game(game)
+    free_game(other_game)
+
+
+
+def test_root_parallel():
+    cdef game_state_t *game = initialize_game()
+    cdef MCTS mcts = MCTS(n_threads=4, root_parallel=2)
+    cdef search_tree_t *tree
+    cdef tree_node_t *root
+    cdef tree_node_t *tree_root
+    cdef double visits[361]
+    cdef int i
+
+    mcts.initialize_nodes()
+
+    game.current_color = S_BLACK
+
+    assert (mcts.n_trees == 2)
+
+    assert (mcts.seek_root(game) is False)
+    root = &mcts.nodes[mcts.current_root]
+    mcts.expand(root, game)
+    assert (used == 362)
+
+    # second tree has its own node pool and hash table
+    tree = &mcts.trees[1]
+    assert (mcts.seek_tree_root(tree, game) is False)
+    tree_root = &tree.nodes[tree.current_root]
+    assert (tree_root.tree_id == 1)
+    mcts.expand(tree_root, game)
+    assert (used == 362)
+    assert (tree.hash_table.used == 362)
+    assert (tree_root.children[0].tree_id == 1)
+    assert (tree_root.num_child == root.num_child)
+
+    # root visits are merged by move
+    root.children[72].Nr = 10
+    tree_root.children[72].Nr = 5
+    tree_root.children[100].Nr = 3
+    mcts.merge_root_visits(game, visits)
+    assert (visits[root.children_pos[72]] == 15)
+    assert (visits[root.children_pos[100]] == 3)
+    assert (visits[root.children_pos[0]] == 0)
+
+    # reclaim works on the tree of old root
+    put_stone(game, onboard_pos[root.children_pos[72]], game.current_color)
+    game.current_color = FLIP_COLOR(game.current_color)
+    assert (mcts.seek_tree_root(tree, game) is True)
+    assert (mcts.reclaim_tree(tree, tree_root.node_i) == 361)
+    assert (tree.hash_table.used == 1)
+    assert (used == 362)
+
+    free_game(game)
+
+
+def test_pondering_control():
+    cdef PyMCTS mcts
+
+    set_board_size(19)
+
+    mcts = PyMCTS(read_ahead=True)
+    mcts.clear()
+    mcts.mcts.player_color = S_WHITE
+    n_suspend = mcts.mcts.n_suspend
+
+    pondering_thread = threading.Thread(target=mcts.start_pondering)
+    pondering_thread.start()
+
+    # read-ahead on black's turn while suspend is acknowledged by pondering thread
+    mcts.resume_pondering()
+    time.sleep(.5)
+    mcts.suspend_pondering()
+    assert (mcts.mcts.pondering_suspended)
+    assert (mcts.mcts.n_suspend == n_suspend + 1)
+    assert (mcts.mcts.n_playout > 0)
+    assert (mcts.mcts.current_root != uct_hash_size)
+
+    # tree is kept while suspended
+    root = mcts.mcts.current_root
+    mcts.resume_pondering()
+    time.sleep(.5)
+    mcts.suspend_pondering()
+    assert (mcts.mcts.current_root == root)
+    assert (mcts.mcts.nodes[root].Nr > 0)
+
+    mcts.stop_pondering()
+    pondering_thread.join(5.0)
+    assert (not pondering_thread.is_alive())
+    assert (mcts.mcts.pondering_stopped)
+
+
+def test_stop_pondering_before_start():
+    cdef PyMCTS mcts
+
+    set_board_size(19)
+
+    mcts = PyMCTS(read_ahead=True)
+    mcts.clear()
+
+    # stop issued before start is kept, and pondering thread returns at once
+    mcts.stop_pondering()
+    pondering_thread = threading.Thread(target=mcts.start_pondering)
+    pondering_thread.start()
+    pondering_thread.join(5.0)
+    assert (not pondering_thread.is_alive())
+    assert (mcts.mcts.pondering_stopped)
+    assert (mcts.mcts.n_playout == 0)
+
+    # clear allows pondering again
+    mcts.clear()
+    assert (mcts.mcts.pondering)
+    mcts.mcts.player_color = S_WHITE
+    pondering_thread = threading.Thread(target=mcts.start_pondering)
+    pondering_thread.start()
+    mcts.resume_pondering()
+    time.sleep(.5)
+    mcts.suspend_pondering()
+    assert (mcts.mcts.n_playout > 0)
+
+    # stop issued before clear is dropped by clear
+    mcts.stop_pondering()
+    pondering_thread.join(5.0)
+    assert (not pondering_thread.is_alive())
+    mcts.clear()
+    assert (mcts.mcts.pondering)
+
+    mcts.stop_pondering()
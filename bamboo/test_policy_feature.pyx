@@ -2,7 +2,7 @@ import numpy as np
 
 cimport numpy as np
 
-from libc.stdlib cimport malloc, free
+from libc.stdlib cimport malloc, free, rand, srand
 
 from . cimport board 
 from . cimport policy_feature
@@ -10,7 +10,7 @@ from . cimport parseboard
 from . cimport printer
 
 from .board cimport is_legal
-from .policy_feature cimport MAX_POLICY_PLANES
+from .policy_feature cimport MAX_POLICY_PLANES, MAX_VALUE_PLANES, PLANES_NCHW, PLANES_NHWC
 from .tree_search cimport tree_node_t
 
 
@@ -147,8 +147,6 @@ def test_capture_size():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
                              "O a . . O X X X X|"
                              "X . . . . O X X X|"
@@ -324,8 +322,6 @@ def test_liberties_after_move_captured_1():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
                              "W W B B B B W|"
                              "W B B W . B W|"
@@ -348,8 +344,6 @@ def test_liberties_after_move_captured_2():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
                              ". . B . B B W . .|"
                              "B B B B W W B B .|"
@@ -374,8 +368,6 @@ def test_sensibleness_not_suicide():
     cdef tree_node_t *node
     node = <tree_node_t *>malloc(sizeof(tree_node_t))
     node.game = board.allocate_game()
-    for i in range(361):
-        node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
     (moves, pure_moves) = parseboard.parse(node.game,
                             "W W W . . . .|"
                             "W W B W . . .|"
@@ -484,3 +476,206 @@ def test_sensibleness_true_eye_remove_stone():
     assert (planes[46, pure_moves['a']] == 0)
     assert (planes[46, pure_moves['c']] == 0)
 
+
+
+def test_update_incremental():
+    cdef board.game_state_t *game
+    cdef int i, j, pos
+
+    for board_size in (9, 19):
+        board.set_board_size(board_size)
+        game = board.allocate_game()
+        board.initialize_board(game)
+
+        feature = policy_feature.allocate_feature(MAX_POLICY_PLANES)
+        policy_feature.initialize_feature(feature)
+        incremental_feature = policy_feature.allocate_feature(MAX_POLICY_PLANES)
+        policy_feature.initialize_feature(incremental_feature)
+
+        srand(board_size)
+        for i in range(400):
+            policy_feature.update(feature, game)
+            policy_feature.update_incremental(incremental_feature, game)
+            assert (np.array_equal(np.asarray(feature.planes), np.asarray(incremental_feature.planes)))
+
+            pos = board.PASS
+            for j in range(10):
+                pos = board.onboard_pos[rand() % board.pure_board_max]
+                if board.is_legal(game, pos, game.current_color):
+                    break
+                pos = board.PASS
+            board.put_stone(game, pos, game.current_color)
+            game.current_color = board.FLIP_COLOR(game.current_color)
+
+        board.free_game(game)
+
+    board.set_board_size(19)
+
+
+def test_update_incremental_unrelated_positions():
+    cdef board.game_state_t *game
+    cdef board.game_state_t *other_game
+    cdef int i, pos
+
+    board.set_board_size(19)
+    game = board.allocate_game()
+    other_game = board.allocate_game()
+    board.initialize_board(game)
+    board.initialize_board(other_game)
+
+    feature = policy_feature.allocate_feature(MAX_POLICY_PLANES)
+    policy_feature.initialize_feature(feature)
+    incremental_feature = policy_feature.allocate_feature(MAX_POLICY_PLANES)
+    policy_feature.initialize_feature(incremental_feature)
+
+    srand(1)
+    for i in range(200):
+        pos = board.onboard_pos[rand() % board.pure_board_max]
+        if board.is_legal(game, pos, game.current_color):
+            board.put_stone(game, pos, game.current_color)
+            game.current_color = board.FLIP_COLOR(game.current_color)
+        pos = board.onboard_pos[rand() % board.pure_board_max]
+        if board.is_legal(other_game, pos, other_game.current_color):
+            board.put_stone(other_game, pos, other_game.current_color)
+            other_game.current_color = board.FLIP_COLOR(other_game.current_color)
+
+        policy_feature.update(feature, game)
+        policy_feature.update_incremental(incremental_feature, game)
+        assert (np.array_equal(np.asarray(feature.planes), np.asarray(incremental_feature.planes)))
+
+        policy_feature.update(feature, other_game)
+        policy_feature.update_incremental(incremental_feature, other_game)
+        assert (np.array_equal(np.asarray(feature.planes), np.asarray(incremental_feature.planes)))
+
+    board.free_game(game)
+    board.free_game(other_game)
+
+
+def test_update_scratch_stamp_wraparound():
+    cdef board.game_state_t *game
+    cdef policy_feature.PolicyFeature wrapped_feature
+    cdef int i, pos
+
+    board.set_board_size(19)
+    game = board.allocate_game()
+    board.initialize_board(game)
+
+    feature = policy_feature.allocate_feature(MAX_POLICY_PLANES)
+    policy_feature.initialize_feature(feature)
+    wrapped_feature = policy_feature.allocate_feature(MAX_POLICY_PLANES)
+    policy_feature.initialize_feature(wrapped_feature)
+
+    srand(1)
+    for i in range(100):
+        pos = board.onboard_pos[rand() % board.pure_board_max]
+        if board.is_legal(game, pos, game.current_color):
+            board.put_stone(game, pos, game.current_color)
+            game.current_color = board.FLIP_COLOR(game.current_color)
+
+    # stale marks left by previous update must not match after stamp wraps around
+    policy_feature.update(wrapped_feature, game)
+    wrapped_feature.scratch.stamp = <unsigned int>-100
+    policy_feature.update(wrapped_feature, game)
+    assert (wrapped_feature.scratch.stamp < 1000)
+
+    policy_feature.update(feature, game)
+    assert (np.array_equal(np.asarray(feature.planes), np.asarray(wrapped_feature.planes)))
+
+    board.free_game(game)
+
+
+def test_update_batch():
+    cdef board.game_state_t *games[8]
+    cdef policy_feature.PolicyFeature feature
+    cdef policy_feature.PolicyFeature batch_feature
+    cdef int[:, :, :, ::1] nchw
+    cdef int[:, :, :, ::1] nhwc
+    cdef int i, j, n, pos
+
+    board.set_board_size(19)
+
+    srand(1)
+    for n in range(8):
+        games[n] = board.allocate_game()
+        board.initialize_board(games[n])
+        for i in range(40 * n):
+            pos = board.PASS
+            for j in range(10):
+                pos = board.onboard_pos[rand() % board.pure_board_max]
+                if board.is_legal(games[n], pos, games[n].current_color):
+                    break
+                pos = board.PASS
+            board.put_stone(games[n], pos, games[n].current_color)
+            games[n].current_color = board.FLIP_COLOR(games[n].current_color)
+
+    for n_planes in (MAX_POLICY_PLANES, MAX_VALUE_PLANES):
+        feature = policy_feature.allocate_feature(n_planes)
+        policy_feature.initialize_feature(feature)
+        batch_feature = policy_feature.allocate_feature(n_planes)
+        policy_feature.initialize_feature(batch_feature)
+
+        for n_threads in (1, 3):
+            policy_feature.initialize_batch(batch_feature, n_threads)
+            nchw = np.full((8, n_planes, 19, 19), -1, dtype=np.int32)
+            nhwc = np.full((8, 19, 19, n_planes), -1, dtype=np.int32)
+            policy_feature.update_batch(batch_feature, games, 8, nchw, PLANES_NCHW)
+            policy_feature.update_batch(batch_feature, games, 8, nhwc, PLANES_NHWC)
+
+            # each position is encoded as update does, and games are left as they were
+            for n in range(8):
+                policy_feature.update(feature, games[n])
+                planes = np.asarray(feature.planes).reshape((n_planes, 19, 19))
+                assert (np.array_equal(np.asarray(nchw[n]), planes))
+                assert (np.array_equal(np.asarray(nhwc[n]), planes.transpose(1, 2, 0)))
+
+    for n in range(8):
+        board.free_game(games[n])
+
+
+def test_update_batch_shape_mismatch():
+    cdef board.game_state_t *games[2]
+    cdef policy_feature.PolicyFeature feature
+    cdef int n
+
+    board.set_board_size(19)
+    for n in range(2):
+        games[n] = board.allocate_game()
+        board.initialize_board(games[n])
+
+    feature = policy_feature.allocate_feature(MAX_POLICY_PLANES)
+    policy_feature.initialize_feature(feature)
+
+    bad_outs = [
+        # fewer positions than games
+        (np.zeros((1, MAX_POLICY_PLANES, 19, 19), dtype=np.int32), PLANES_NCHW),
+        # planes and board swapped
+        (np.zeros((2, 19, 19, MAX_POLICY_PLANES), dtype=np.int32), PLANES_NCHW),
+        (np.zeros((2, MAX_POLICY_PLANES, 19, 19), dtype=np.int32), PLANES_NHWC),
+        # value network planes
+        (np.zeros((2, MAX_VALUE_PLANES, 19, 19), dtype=np.int32), PLANES_NCHW),
+        # smaller board
+        (np.zeros((2, MAX_POLICY_PLANES, 9, 9), dtype=np.int32), PLANES_NCHW),
+    ]
+    for out, layout in bad_outs:
+        raised = False
+        try:
+            policy_feature.update_batch(feature, games, 2, out, layout)
+        except ValueError:
+            raised = True
+        assert (raised)
+        assert (not out.any())
+
+    raised = False
+    try:
+        policy_feature.update_batch(feature, games, -1, np.zeros((2, MAX_POLICY_PLANES, 19, 19), dtype=np.int32), PLANES_NCHW)
+    except ValueError:
+        raised = True
+    assert (raised)
+
+    # exact fit is accepted
+    out = np.zeros((2, MAX_POLICY_PLANES, 19, 19), dtype=np.int32)
+    policy_feature.update_batch(feature, games, 2, out, PLANES_NCHW)
+    assert (out.any())
+
+    for n in range(2):
+        board.free_game(games[n])
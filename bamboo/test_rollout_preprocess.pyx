@@ -3,13 +3,15 @@ cimport numpy as np
 
 from operator import itemgetter
 
-from libc.stdlib cimport malloc, free
+from libc.stdlib cimport malloc, free, rand, srand
+from libc.math cimport exp
 
 from bamboo.board cimport BOARD_MAX, PURE_BOARD_SIZE, PURE_BOARD_MAX, S_EMPTY, S_BLACK, S_WHITE, PASS
 from bamboo.board cimport FLIP_COLOR, Y
-from bamboo.board cimport game_state_t, rollout_feature_t, board_size, board_max, pure_board_size, pure_board_max
-from bamboo.board cimport onboard_pos 
-from bamboo.board cimport set_board_size, allocate_game, free_game, put_stone, copy_game
+from bamboo.board cimport game_state_t, rollout_feature_t, rollout_prob_t, board_size, board_max, pure_board_size, pure_board_max
+from bamboo.board cimport COMPACT_GAME_STATE_ENABLED
+from bamboo.board cimport onboard_pos, onboard_index
+from bamboo.board cimport set_board_size, allocate_game, free_game, put_stone, copy_game, initialize_board, is_legal_not_eye
 from bamboo.zobrist_hash cimport initialize_hash 
 from bamboo.printer cimport print_board
 from bamboo.parseboard cimport parse
@@ -18,8 +20,12 @@ from bamboo.rollout_preprocess cimport F_RESPONSE, F_SAVE_ATARI, F_NEIGHBOR, F_N
 from bamboo.rollout_preprocess cimport response_start, save_atari_start, neighbor_start, nakade_start, d12_rsp_start, x33_start
 from bamboo.rollout_preprocess cimport F_SELF_ATARI, F_LAST_MOVE_DISTANCE, F_D12_PAT
 from bamboo.rollout_preprocess cimport self_atari_start, last_move_distance_start, d12_start
-from bamboo.rollout_preprocess cimport initialize_rollout_const, initialize_planes, initialize_probs, update_planes, update_tree_planes_all, memorize_updated, choice_rollout_move, set_illegal, norm_probs 
-from bamboo.local_pattern cimport initialize_rands, put_x33_hash, put_d12_rspos_hash, put_d12_hash
+from bamboo.rollout_preprocess cimport initialize_rollout_const, initialize_planes, initialize_probs, update_planes, update_tree_planes_all, memorize_updated, choice_rollout_move, set_illegal, build_logits_fenwick, get_rollout_probs
+from bamboo.rollout_preprocess cimport rollout_rng_t, seed_rollout_rng, rollout_rng_uniform
+from bamboo.rollout_preprocess cimport tree_weights, tree_exp_weights, tree_feature_size, get_tree_probs
+from bamboo.rollout_preprocess cimport rollout_weights, rollout_exp_weights, rollout_feature_size, update_all_probs
+from bamboo.board cimport is_legal
+from bamboo.local_pattern cimport initialize_rands, put_x33_hash, put_d12_rspos_hash, put_d12_hash, finalize_pattern_tables
 from bamboo.local_pattern import print_x33
 from bamboo.nakade cimport initialize_nakade_hash
 
@@ -42,6 +48,7 @@ def setup():
     put_12diamond_rspos_test_patterns()
     put_3x3_test_patterns()
     put_12diamond_test_patterns()
+    finalize_pattern_tables()
 
 
 def teardown():
@@ -2104,10 +2111,12 @@ def test_memorize_updated():
 
 def test_choice_rollout_move():
     cdef game_state_t *game = allocate_game()
+    cdef rollout_rng_t rng
     cdef int pos, color 
     cdef int i
 
     set_board_size(19)
+    seed_rollout_rng(&rng, 0)
 
     initialize_probs(game)
 
@@ -2120,13 +2129,10 @@ def test_choice_rollout_move():
     game.rollout_logits[color][300] = 30
     game.rollout_logits_sum[color] = 170
 
-    norm_probs(game.rollout_probs[color],
-               game.rollout_row_probs[color],
-               game.rollout_logits[color],
-               game.rollout_logits_sum[color])
+    build_logits_fenwick(game.rollout_logits_fenwick[color], game.rollout_logits[color])
 
     for i in range(100):
-        pos = choice_rollout_move(game)
+        pos = choice_rollout_move(game, &rng)
         assert (pos in (120, 132, 396, 408))
 
     set_illegal(game, 120)
@@ -2134,11 +2140,12 @@ def test_choice_rollout_move():
     set_illegal(game, 396)
     set_illegal(game, 408)
 
-    assert (choice_rollout_move(game) == PASS)
+    assert (choice_rollout_move(game, &rng) == PASS)
 
 
 def test_set_illegal():
     cdef game_state_t *game = allocate_game()
+    cdef double probs[361]
     cdef int pos, color 
     cdef int i
 
@@ -2155,25 +2162,202 @@ def test_set_illegal():
     game.rollout_logits[color][300] = 30
     game.rollout_logits_sum[color] = 140
 
-    norm_probs(game.rollout_probs[color],
-               game.rollout_row_probs[color],
-               game.rollout_logits[color],
-               game.rollout_logits_sum[color])
+    build_logits_fenwick(game.rollout_logits_fenwick[color], game.rollout_logits[color])
 
     set_illegal(game, 120)
     assert (game.rollout_logits_sum[color] == 100)
-    assert (round(game.rollout_probs[color][72] + game.rollout_probs[color][288] + game.rollout_probs[color][300]) == 1)
+    get_rollout_probs(game, probs)
+    assert (round(probs[72] + probs[288] + probs[300]) == 1)
+    assert (sum_logits_fenwick(game.rollout_logits_fenwick[color]) == 100)
 
     set_illegal(game, 132)
     assert (game.rollout_logits_sum[color] == 50)
-    assert (round(game.rollout_probs[color][288] + game.rollout_probs[color][300]) == 1)
+    get_rollout_probs(game, probs)
+    assert (round(probs[288] + probs[300]) == 1)
 
     set_illegal(game, 396)
     assert (game.rollout_logits_sum[color] == 30)
-    assert (round(game.rollout_probs[color][288] + game.rollout_probs[color][300]) == 1)
+    get_rollout_probs(game, probs)
+    assert (round(probs[288] + probs[300]) == 1)
 
     set_illegal(game, 408)
     assert (game.rollout_logits_sum[color] == 0)
+    assert (sum_logits_fenwick(game.rollout_logits_fenwick[color]) == 0)
+
+
+def test_choice_rollout_move_distribution():
+    cdef game_state_t *game = allocate_game()
+    cdef double probs[361]
+    cdef int counts[361]
+    cdef int n_samples = 100000
+    cdef rollout_rng_t rng
+    cdef int pos, color
+    cdef int i
+
+    set_board_size(19)
+    seed_rollout_rng(&rng, 0)
+
+    initialize_probs(game)
+
+    game.current_color = S_BLACK
+    color = <int>S_BLACK
+
+    for i in range(PURE_BOARD_MAX):
+        game.rollout_logits[color][i] = i % 5
+        game.rollout_logits_sum[color] += i % 5
+    game.rollout_logits[color][60] = 200
+    game.rollout_logits[color][300] = 100
+    game.rollout_logits_sum[color] += 200 - 60 % 5 + 100 - 300 % 5
+
+    build_logits_fenwick(game.rollout_logits_fenwick[color], game.rollout_logits[color])
+
+    set_illegal(game, onboard_pos[1])
+    set_illegal(game, onboard_pos[359])
+
+    get_rollout_probs(game, probs)
+    for i in range(PURE_BOARD_MAX):
+        counts[i] = 0
+
+    for i in range(n_samples):
+        pos = choice_rollout_move(game, &rng)
+        counts[onboard_index[pos]] += 1
+
+    assert (counts[0] == 0)
+    assert (counts[1] == 0)
+    assert (counts[359] == 0)
+    for i in range(PURE_BOARD_MAX):
+        assert (abs(counts[i]/<double>n_samples - probs[i]) < 0.01)
+
+    free_game(game)
+
+
+def test_rollout_rng():
+    cdef rollout_rng_t rng1, rng2, rng3
+    cdef double r, r_sum = .0
+    cdef int n_samples = 100000
+    cdef int i
+
+    seed_rollout_rng(&rng1, 1)
+    seed_rollout_rng(&rng2, 1)
+    seed_rollout_rng(&rng3, 2)
+
+    for i in range(n_samples):
+        r = rollout_rng_uniform(&rng1)
+        assert (r >= .0 and r < 1.0)
+        assert (r == rollout_rng_uniform(&rng2))
+        r_sum += r
+
+    assert (rollout_rng_uniform(&rng1) != rollout_rng_uniform(&rng3))
+    assert (abs(r_sum/n_samples - .5) < .01)
+
+
+def test_get_tree_probs():
+    cdef game_state_t *game = allocate_game()
+    cdef rollout_feature_t *feature
+    cdef double probs[361]
+    cdef double logits[361]
+    cdef double logits_sum = .0
+    cdef int i, j, pos
+
+    set_board_size(19)
+    initialize_board(game)
+
+    srand(1)
+    for i in range(120):
+        pos = onboard_pos[rand() % PURE_BOARD_MAX]
+        if is_legal_not_eye(game, pos, game.current_color):
+            put_stone(game, pos, game.current_color)
+            game.current_color = FLIP_COLOR(game.current_color)
+
+    update_tree_planes_all(game)
+    feature = &game.rollout_feature_planes[<int>game.current_color]
+    for j in range(F_SELF_ATARI):
+        for i in range(PURE_BOARD_MAX):
+            if rand() % 3 == 0:
+                feature.tensor[j][onboard_pos[i]] = rand() % tree_feature_size
+            else:
+                feature.tensor[j][onboard_pos[i]] = -1
+
+    for i in range(tree_feature_size):
+        tree_weights[i] = (rand() % 200 - 100)/50.0
+        tree_exp_weights[i] = exp(tree_weights[i])
+
+    for i in range(PURE_BOARD_MAX):
+        logits[i] = .0
+        pos = onboard_pos[i]
+        if is_legal_not_eye(game, pos, game.current_color):
+            for j in range(9):
+                if feature.tensor[j][pos] != -1:
+                    logits[i] += tree_weights[feature.tensor[j][pos]]
+            logits[i] = exp(logits[i])
+            logits_sum += logits[i]
+
+    get_tree_probs(game, probs)
+
+    for i in range(PURE_BOARD_MAX):
+        assert (abs(probs[i] - logits[i]/logits_sum) < 1e-12)
+
+    for i in range(tree_feature_size):
+        tree_weights[i] = .0
+        tree_exp_weights[i] = 1.0
+
+    free_game(game)
+
+
+def test_update_all_probs():
+    cdef game_state_t *game = allocate_game()
+    cdef rollout_feature_t *feature
+    cdef double logits[361]
+    cdef double logits_sum = .0
+    cdef int color
+    cdef int i, j, pos
+
+    set_board_size(19)
+    initialize_board(game)
+
+    srand(2)
+    for i in range(120):
+        pos = onboard_pos[rand() % PURE_BOARD_MAX]
+        if is_legal_not_eye(game, pos, game.current_color):
+            put_stone(game, pos, game.current_color)
+            game.current_color = FLIP_COLOR(game.current_color)
+
+    color = <int>game.current_color
+    feature = &game.rollout_feature_planes[color]
+    for j in range(F_SELF_ATARI):
+        for i in range(PURE_BOARD_MAX):
+            if rand() % 3 == 0:
+                feature.tensor[j][onboard_pos[i]] = rand() % rollout_feature_size
+            else:
+                feature.tensor[j][onboard_pos[i]] = -1
+
+    for i in range(rollout_feature_size):
+        rollout_weights[i] = (rand() % 200 - 100)/50.0
+        rollout_exp_weights[i] = exp(rollout_weights[i])
+
+    for i in range(PURE_BOARD_MAX):
+        logits[i] = .0
+        pos = onboard_pos[i]
+        if is_legal(game, pos, color):
+            for j in range(6):
+                if feature.tensor[j][pos] != -1:
+                    logits[i] += rollout_weights[feature.tensor[j][pos]]
+            logits[i] = exp(logits[i])
+            logits_sum += logits[i]
+
+    update_all_probs(game)
+
+    # logits are float in compact layout
+    rel_tol = 1e-6 if COMPACT_GAME_STATE_ENABLED else 1e-12
+    for i in range(PURE_BOARD_MAX):
+        assert (abs(game.rollout_logits[color][i] - logits[i]) <= rel_tol * logits[i])
+    assert (abs(game.rollout_logits_sum[color] - logits_sum) <= rel_tol * logits_sum)
+
+    for i in range(rollout_feature_size):
+        rollout_weights[i] = .0
+        rollout_exp_weights[i] = 1.0
+
+    free_game(game)
 
 
 def test_copy_game():
@@ -2220,10 +2404,8 @@ def test_copy_game():
     game.rollout_logits_sum[black] = 1
     game.rollout_logits_sum[white] = 2
 
-    game.rollout_probs[black][0] = 1
-    game.rollout_probs[white][360] = 2
-    game.rollout_row_probs[black][0] = 1
-    game.rollout_row_probs[white][18] = 2
+    game.rollout_logits_fenwick[black][1] = 1
+    game.rollout_logits_fenwick[white][361] = 2
 
     copy_game(copy, game)
 
@@ -2258,10 +2440,8 @@ def test_copy_game():
     assert (copy.rollout_logits_sum[black] == 1)
     assert (copy.rollout_logits_sum[white] == 2)
 
-    assert (copy.rollout_probs[black][0] == 1)
-    assert (copy.rollout_probs[white][360] == 2)
-    assert (copy.rollout_row_probs[black][0] == 1)
-    assert (copy.rollout_row_probs[white][18] == 2)
+    assert (copy.rollout_logits_fenwick[black][1] == 1)
+    assert (copy.rollout_logits_fenwick[white][361] == 2)
 
 
 cdef int number_of_active_positions(rollout_feature_t *feature, int feature_id):
@@ -2271,3 +2451,12 @@ cdef int number_of_active_positions(rollout_feature_t *feature, int feature_id):
         if feature.tensor[feature_id][i] >= 0:
             n_active += 1
     return n_active
+
+
+cdef double sum_logits_fenwick(rollout_prob_t *fenwick):
+    cdef int i = PURE_BOARD_MAX
+    cdef double logits_sum = .0
+    while i > 0:
+        logits_sum += fenwick[i]
+        i -= i & -i
+    return logits_sum
@@ -5,7 +5,7 @@ cimport numpy as np
 
 from bamboo.board cimport S_BLACK, S_WHITE
 from bamboo.board cimport FLIP_COLOR
-from bamboo.board cimport game_state_t
+from bamboo.board cimport game_state_t, board_int_t
 from bamboo.board cimport allocate_game, free_game, put_stone
 from bamboo.parseboard cimport parse
 
@@ -18,9 +18,9 @@ def setup():
 
 def test_seki_0():
     cdef game_state_t *game = allocate_game()
-    cdef int seki[529]
+    cdef board_int_t seki[529]
 
-    memset(seki, 0, sizeof(int)*529)
+    memset(seki, 0, sizeof(board_int_t)*529)
 
     (moves, pure_moves) = parse(game,
                               ". . . . . . . . .|"
@@ -43,9 +43,9 @@ def test_seki_0():
 
 def test_seki_1():
     cdef game_state_t *game = allocate_game()
-    cdef int seki[529]
+    cdef board_int_t seki[529]
 
-    memset(seki, 0, sizeof(int)*529)
+    memset(seki, 0, sizeof(board_int_t)*529)
 
     (moves, pure_moves) = parse(game,
                               ". . B W a B W . .|"
@@ -68,9 +68,9 @@ def test_seki_1():
 
 def test_seki_2():
     cdef game_state_t *game = allocate_game()
-    cdef int seki[529]
+    cdef board_int_t seki[529]
 
-    memset(seki, 0, sizeof(int)*529)
+    memset(seki, 0, sizeof(board_int_t)*529)
 
     (moves, pure_moves) = parse(game,
                               ". . . W W B B W a|"
@@ -94,9 +94,9 @@ def test_seki_2():
 
 def test_seki_3():
     cdef game_state_t *game = allocate_game()
-    cdef int seki[529]
+    cdef board_int_t seki[529]
 
-    memset(seki, 0, sizeof(int)*529)
+    memset(seki, 0, sizeof(board_int_t)*529)
 
     (moves, pure_moves) = parse(game,
                               ". . . . . . . . .|"
@@ -120,9 +120,9 @@ def test_seki_3():
 
 def test_seki_4():
     cdef game_state_t *game = allocate_game()
-    cdef int seki[529]
+    cdef board_int_t seki[529]
 
-    memset(seki, 0, sizeof(int)*529)
+    memset(seki, 0, sizeof(board_int_t)*529)
 
     (moves, pure_moves) = parse(game,
                               "W a W B B B W . .|"
@@ -146,9 +146,9 @@ def test_seki_4():
 
 def test_seki_5():
     cdef game_state_t *game = allocate_game()
-    cdef int seki[529]
+    cdef board_int_t seki[529]
 
-    memset(seki, 0, sizeof(int)*529)
+    memset(seki, 0, sizeof(board_int_t)*529)
 
     (moves, pure_moves) = parse(game,
                               ". . W B a B W B .|"
@@ -172,9 +172,9 @@ def test_seki_5():
 
 def test_seki_6():
     cdef game_state_t *game = allocate_game()
-    cdef int seki[529]
+    cdef board_int_t seki[529]
 
-    memset(seki, 0, sizeof(int)*529)
+    memset(seki, 0, sizeof(board_int_t)*529)
 
     (moves, pure_moves) = parse(game,
                               "W a B b B W . . .|"
@@ -199,9 +199,9 @@ def test_seki_6():
 
 def test_seki_7():
     cdef game_state_t *game = allocate_game()
-    cdef int seki[529]
+    cdef board_int_t seki[529]
 
-    memset(seki, 0, sizeof(int)*529)
+    memset(seki, 0, sizeof(board_int_t)*529)
 
     (moves, pure_moves) = parse(game,
                               "a B B b W B . . .|"
@@ -225,9 +225,9 @@ def test_seki_7():
 
 def test_seki_8():
     cdef game_state_t *game = allocate_game()
-    cdef int seki[529]
+    cdef board_int_t seki[529]
 
-    memset(seki, 0, sizeof(int)*529)
+    memset(seki, 0, sizeof(board_int_t)*529)
 
     (moves, pure_moves) = parse(game,
                               "a B c B W . . . .|"
@@ -251,9 +251,9 @@ def test_seki_8():
 
 def test_seki_9():
     cdef game_state_t *game = allocate_game()
-    cdef int seki[529]
+    cdef board_int_t seki[529]
 
-    memset(seki, 0, sizeof(int)*529)
+    memset(seki, 0, sizeof(board_int_t)*529)
 
     (moves, pure_moves) = parse(game,
                               "W B a W W B . . .|"
@@ -276,9 +276,9 @@ def test_seki_9():
 
 def test_bent4():
     cdef game_state_t *game = allocate_game()
-    cdef int seki[529]
+    cdef board_int_t seki[529]
 
-    memset(seki, 0, sizeof(int)*529)
+    memset(seki, 0, sizeof(board_int_t)*529)
 
     (moves, pure_moves) = parse(game,
                               "W a B W . . . . .|"
@@ -3,11 +3,18 @@ import numpy as np
 cimport numpy as np
 
 from libc.stdlib cimport malloc, free
+from libc.string cimport memset
+
+from libcpp.unordered_map cimport unordered_map
+from cython.operator cimport dereference as deref, preincrement as inc
 
 from bamboo.board cimport S_EMPTY, S_BLACK, S_WHITE
 from bamboo.board cimport game_state_t, allocate_game, free_game
 from bamboo.parseboard cimport parse
 from bamboo.local_pattern cimport initialize_rands, x33_bits, x33_hash, x33_hash_from_bits
+from bamboo.local_pattern cimport pattern_entry_t, pattern_table_t, build_pattern_table, free_pattern_table, lookup_pattern_table, set_pattern_table_stats
+from bamboo.local_pattern cimport x33_hashmap, x33_table, put_x33_hash, finalize_pattern_tables
+from bamboo.zobrist_hash cimport mt
 
 from bamboo.local_pattern import print_x33
 
@@ -73,3 +80,75 @@ def test_x33_hash_from_bits_1():
     assert (hash1 == hash2)
 
     free_game(game)
+
+
+def test_pattern_table():
+    cdef unordered_map[unsigned long long, int] hashmap
+    cdef unordered_map[unsigned long long, int].iterator it
+    cdef pattern_table_t table
+    cdef unsigned long long hash
+    cdef int i, id
+
+    memset(&table, 0, sizeof(pattern_table_t))
+    assert (lookup_pattern_table(&table, 0) == -1)
+
+    for i in range(1000):
+        hashmap[mt()] = i % 300
+    # hashes sharing home slot, including zero
+    for i in range(10):
+        hashmap[(<unsigned long long>i) << 40] = i
+
+    build_pattern_table(&table, hashmap)
+    assert (table.size == hashmap.size())
+    assert (table.mask + 1 >= 2 * hashmap.size())
+
+    it = hashmap.begin()
+    while it != hashmap.end():
+        assert (lookup_pattern_table(&table, deref(it).first) == deref(it).second)
+        inc(it)
+
+    set_pattern_table_stats(True)
+    for i in range(10000):
+        hash = mt()
+        id = -1
+        if hashmap.find(hash) != hashmap.end():
+            id = hashmap[hash]
+        assert (lookup_pattern_table(&table, hash) == id)
+    assert (lookup_pattern_table(&table, (<unsigned long long>10) << 40) == -1)
+    assert (table.lookups == 10001)
+    assert (table.probes >= table.lookups)
+    set_pattern_table_stats(False)
+
+    free_pattern_table(&table)
+    assert (lookup_pattern_table(&table, 0) == -1)
+
+
+def test_put_x33_hash():
+    cdef pattern_entry_t *entries
+    cdef unsigned long long bits, hash
+    cdef int i
+    cdef dict added = {}
+
+    initialize_rands()
+    finalize_pattern_tables()
+    entries = x33_table.entries
+
+    for i in range(200):
+        bits = ((<unsigned long long>i) << 8) | 0b1110
+        hash = x33_hash_from_bits(bits)
+        if x33_hashmap.find(hash) == x33_hashmap.end():
+            added[hash] = i
+        put_x33_hash(bits, i)
+    # table is left as it was until finalized
+    assert (x33_table.entries == entries)
+    for hash in added:
+        assert (lookup_pattern_table(&x33_table, hash) == -1)
+
+    finalize_pattern_tables()
+    for hash, i in added.items():
+        assert (lookup_pattern_table(&x33_table, hash) == i)
+    assert (x33_table.size == x33_hashmap.size())
+
+    for hash in added:
+        x33_hashmap.erase(hash)
+    build_pattern_table(&x33_table, x33_hashmap)
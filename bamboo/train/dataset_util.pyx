@@ -27,6 +27,8 @@ from bamboo.zobrist_hash import set_hash_size, initialize_hash
 from bamboo.nakade import initialize_nakade_hash
 from bamboo.local_pattern import read_rands, init_d12_rsp_hash, init_x33_hash, init_d12_hash
 from bamboo.rollout_preprocess cimport initialize_rollout_const, update_rollout, choice_rollout_move, set_illegal
+from bamboo.rollout_preprocess cimport rollout_rng_t, seed_rollout_rng
+from bamboo.cpprand cimport random_device
 
 
 def is_sgf(fname):
@@ -59,7 +61,7 @@ def list_sgfs(path):
     return (os.path.join(path, f) for f in files if is_sgf(f))
 
 
-cdef int rollout(game_state_t *game) nogil:
+cdef int rollout(game_state_t *game, rollout_rng_t *rng) nogil:
     cdef int winner
     cdef double score
     cdef int color, other_color
@@ -74,7 +76,7 @@ cdef int rollout(game_state_t *game) nogil:
 
         if pos == PASS or is_legal_not_eye(game, pos, color) == False:
             while True:
-                pos = choice_rollout_move(game)
+                pos = choice_rollout_move(game, rng)
                 if is_legal_not_eye(game, pos, color):
                     break
                 else:
@@ -105,6 +107,8 @@ def generate_value_dataset(cmd_line_args=None):
     cdef SGFMoveIterator sgf_iter
     cdef game_state_t *rollout_game = allocate_game()
     cdef int black_rollout_wins, white_rollout_wins
+    cdef rollout_rng_t rng
+    cdef random_device rand_gen
     cdef int i
 
     parser = argparse.ArgumentParser(
@@ -137,6 +141,8 @@ def generate_value_dataset(cmd_line_args=None):
                         help="Number of search threads (Default: 1)")
     parser.add_argument("--pro", "-pro", default=False, action="store_true",
                         help="True if pro dataset")
+    parser.add_argument("--seed", type=int, default=-1,
+                        help="Seed of rollout random number generator. Negative value seeds randomly. (Default: -1)")
     parser.add_argument("--verbose", "-v", default=False, action="store_true",
                         help="Turn on verbose mode")
     parser.add_argument("--quiet", "-q", default=False, action="store_true",
@@ -147,6 +153,8 @@ def generate_value_dataset(cmd_line_args=None):
     else:
         args = parser.parse_args(cmd_line_args)
 
+    seed_rollout_rng(&rng, args.seed if args.seed >= 0 else rand_gen())
+
     # get an iterator of SGF files according to command line args
     sgf_count = count_all_sgfs(args.input_directory)
     if args.recurse:
@@ -223,7 +231,7 @@ def generate_value_dataset(cmd_line_args=None):
                     for i in range(500):
                         copy_game(rollout_game, sgf_iter.game)
 
-                        winner = rollout(rollout_game)
+                        winner = rollout(rollout_game, &rng)
                         if winner == S_BLACK:
                             black_rollout_wins += 1
                         elif winner == S_WHITE:
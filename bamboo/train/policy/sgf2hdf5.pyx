@@ -22,8 +22,8 @@ from bamboo.sgf_error import SizeMismatchError, IllegalMove, TooManyMove, TooFew
 from bamboo.sgf_util cimport SGFMoveIterator
 from bamboo.board cimport PASS
 from bamboo.board cimport game_state_t, pure_board_max, onboard_index
-from bamboo.policy_feature cimport MAX_POLICY_PLANES
-from bamboo.policy_feature cimport PolicyFeature, allocate_feature, initialize_feature, free_feature, update, free_feature_games
+from bamboo.policy_feature cimport MAX_POLICY_PLANES, PLANES_NCHW
+from bamboo.policy_feature cimport PolicyFeature, allocate_feature, initialize_feature, free_feature, update_batch, free_feature_games
 from bamboo.tree_search cimport tree_node_t
 from bamboo.printer cimport print_board
 
@@ -56,8 +56,6 @@ cdef class GameConverter(object):
         cdef SGFMoveIterator sgf_iter
 
         node = <tree_node_t *>malloc(sizeof(tree_node_t))
-        for i in range(self.bsize**2):
-            node.children[i] = <tree_node_t *>malloc(sizeof(tree_node_t))
         initialize_feature(self.feature)
         try:
             with open(file_name, 'r') as file_object:
@@ -67,20 +65,16 @@ cdef class GameConverter(object):
             node.game = game
             for i, move in enumerate(sgf_iter):
                 if move[0] != PASS:
+                    planes = np.empty((1, self.n_features, self.bsize, self.bsize), dtype=np.int32)
                     s = time.time()
-                    update(self.feature, node.game)
+                    update_batch(self.feature, &node.game, 1, planes.transpose(0, 1, 3, 2), PLANES_NCHW)
                     self.update_speeds.append(time.time()-s)
                     if onboard_index[move[0]] >= pure_board_max:
                         continue
                     else:
-                        planes = np.asarray(self.feature.planes)
-                        planes = planes.reshape(1, self.n_features, self.bsize, self.bsize)
-                        planes = planes.transpose(0, 1, 3, 2)  # required?
                         yield (planes, onboard_index_to_np_move(onboard_index[move[0]], self.bsize))
         finally:
             free_feature_games(self.feature)
-            for i in range(self.bsize**2):
-                free(node.children[i])
             free(node)
 
     def sgfs_to_hdf5(self,
@@ -15,7 +15,7 @@ from bamboo.sgf_error import SizeMismatchError, IllegalMove, TooManyMove, TooFew
 from bamboo.sgf_util cimport SGFMoveIterator
 from bamboo.board cimport PASS, S_EMPTY, STRING_EMPTY_END
 from bamboo.board cimport DIS, DX, DY
-from bamboo.board cimport game_state_t, string_t 
+from bamboo.board cimport game_state_t, string_t, board_int_t, next_link
 from bamboo.board cimport onboard_index, board_x, board_y, move_dis
 from bamboo.printer cimport print_board
 from bamboo.local_pattern cimport x33_bits, x33_trans8_min, x33_trans16_min, print_x33
@@ -33,7 +33,7 @@ def harvest_3x3_pattern(file_name, verbose=False, quiet=False):
     cdef game_state_t *game
     cdef SGFMoveIterator sgf_iter
     cdef int *updated_string_num
-    cdef int *updated_string_id
+    cdef board_int_t *updated_string_id
     cdef int i
     cdef int string_id
     cdef string_t *string
@@ -52,7 +52,7 @@ def harvest_3x3_pattern(file_name, verbose=False, quiet=False):
                 for i in range(updated_string_num[0]):
                     string_id = updated_string_id[i]
                     string = &game.string[string_id]
-                    center = string.empty[0]
+                    center = next_link(string.empty, 0)
                     while center != STRING_EMPTY_END:
                         pat = x33_bits(game, center, <int>game.current_color)
                         # Check if pattern updated
@@ -63,7 +63,7 @@ def harvest_3x3_pattern(file_name, verbose=False, quiet=False):
                                 move_dict[pat] += 1
                             else:
                                 move_dict[pat] += 0
-                        center = string.empty[center]
+                        center = next_link(string.empty, center)
                 updated_string_num[0] = 0
     except IllegalMove:
         if not quiet:
@@ -212,7 +212,7 @@ def harvest_12diamond_pattern(file_name, verbose=False, quiet=False):
     cdef game_state_t *game
     cdef SGFMoveIterator sgf_iter
     cdef int *updated_string_num
-    cdef int *updated_string_id
+    cdef board_int_t *updated_string_id
     cdef int i
     cdef int string_id
     cdef string_t *string
@@ -231,7 +231,7 @@ def harvest_12diamond_pattern(file_name, verbose=False, quiet=False):
                 for i in range(updated_string_num[0]):
                     string_id = updated_string_id[i]
                     string = &game.string[string_id]
-                    center = string.empty[0]
+                    center = next_link(string.empty, 0)
                     while center != STRING_EMPTY_END:
                         pat = d12_bits(game, center, <int>game.current_color)
                         # Check if pattern updated
@@ -242,7 +242,7 @@ def harvest_12diamond_pattern(file_name, verbose=False, quiet=False):
                                 move_dict[pat] += 1
                             else:
                                 move_dict[pat] += 0
-                        center = string.empty[center]
+                        center = next_link(string.empty, center)
                 updated_string_num[0] = 0
     except IllegalMove:
         if not quiet: